@@ -0,0 +1,99 @@
+"""
+Per-request latency with and without connection reuse.
+
+    POSTGRES_HOST=localhost python -m benchmarks.connections --requests 500
+
+Requests ``pending-recieved-requests`` (a cheap endpoint, so connection set-up
+is a large share of it) one after another, closing old connections after each
+request as the request_finished signal does in a server, with:
+
+- ``per_request``: ``CONN_MAX_AGE = 0``, a new connection every request;
+- ``persistent``: ``CONN_MAX_AGE`` > 0 with health checks;
+- ``pool``: a psycopg 3 pool (PostgreSQL with psycopg[pool] only).
+
+On SQLite opening a connection costs next to nothing and the in-memory test
+database is never closed, so run it against PostgreSQL.
+"""
+import argparse
+import random
+import time
+
+from .datagen import generate
+from .endpoints import Population, pending_requests
+from .harness import setup_django, summarize, test_database, write_results
+
+
+def configure(mode, pool_size):
+    from django.db import connections
+
+    connections.close_all()
+    settings_dict = connections['default'].settings_dict
+    settings_dict['OPTIONS'].pop('pool', None)
+    settings_dict['CONN_MAX_AGE'] = 0 if mode in ('per_request', 'pool') else 600
+    settings_dict['CONN_HEALTH_CHECKS'] = mode == 'persistent'
+    if mode == 'pool':
+        settings_dict['OPTIONS']['pool'] = {'min_size': 1, 'max_size': pool_size, 'timeout': 5}
+
+
+def supports_pool():
+    from django.db import connection
+
+    if connection.vendor != 'postgresql':
+        return False
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def run(mode, population, args):
+    from django.db import close_old_connections, connections
+
+    from users.instrumentation import registry
+
+    configure(mode, args.pool_size)
+    rng = random.Random(0)
+    for _ in range(min(args.requests, 50)):  # Warm the token cache.
+        pending_requests(population, rng)
+    registry.reset()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        request_started = time.perf_counter()
+        close_old_connections()  # request_started
+        pending_requests(population, rng)
+        close_old_connections()  # request_finished
+        latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+    opened = sum(registry.connections.values())
+    connections.close_all()
+    return summarize(latencies, elapsed, connections_opened=opened)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-request latency with and without connection reuse.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    results = {}
+    # Every request must reach the database, not the response cache.
+    with test_database(RESPONSE_CACHE={**settings.RESPONSE_CACHE, 'TIMEOUT': 0}):
+        generate(args.users, friends_per_user=3, requests_per_user=3)
+        population = Population()
+        modes = ['per_request', 'persistent'] + (['pool'] if supports_pool() else [])
+        for mode in modes:
+            results[mode] = summary = run(mode, population, args)
+            print(f"{mode:<12} p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms "
+                  f"connections={summary['connections_opened']}")
+        print('results written to', write_results('connections', results, args.output))
+
+
+if __name__ == '__main__':
+    main()
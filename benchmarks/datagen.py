@@ -0,0 +1,120 @@
+"""
+Synthetic data for the benchmarks: ``N`` users with a power-law friendship
+graph and pending friend requests skewed towards popular users, written with
+bulk inserts.
+
+    python -m benchmarks.datagen --users 10000 --friends-per-user 5
+
+seeds the database configured by ``DJANGO_SETTINGS_MODULE``. Output is
+deterministic for a given ``--seed``.
+"""
+import argparse
+import random
+
+FIRST_NAMES = ['Ana', 'Rahul', 'John', 'Maria', 'Li', 'Shanti', 'Joao', 'Marco', 'Sina', 'Karan', 'Priya', 'Omar']
+LAST_NAMES = ['Kumar', 'Singh', 'Smith', 'Rossi', 'Li', 'Sharma', 'Silva', 'Jones', 'Marin', 'Rao', 'Khan', 'Ito']
+PASSWORD = 'bench-pass-1234'
+# Keywords that hit the generated names: full names, prefixes and substrings.
+SEARCH_TERMS = ['ana', 'ra', 'kumar', 'sin', 'jo', 'mar', 'li', 'sha']
+
+
+def email_for(index):
+    return f'user{index}@bench.local'
+
+
+def preferential_attachment(count, edges_per_node, rng):
+    """
+    Barabási–Albert graph over nodes ``0..count-1``: each node links to
+    ``edges_per_node`` earlier nodes picked proportionally to their degree,
+    which gives the heavy-tailed degree distribution of real social graphs.
+    Returns a list of ``(a, b)`` pairs with ``a > b``.
+    """
+    pairs = []
+    weighted = []  # Every node once per edge it has, plus once to be reachable.
+    for node in range(count):
+        targets = set()
+        wanted = min(edges_per_node, node)
+        while len(targets) < wanted:
+            targets.add(rng.choice(weighted))
+        for target in targets:
+            pairs.append((node, target))
+            weighted.append(target)
+        weighted.extend([node] * (len(targets) + 1))
+    return pairs, weighted
+
+
+def generate(users=1000, friends_per_user=3, requests_per_user=2, seed=0, batch_size=1000):
+    """
+    Insert ``users`` users, a preferential-attachment friendship graph with
+    about ``friends_per_user`` friendships per user (with the matching accepted
+    ``FriendRequest`` rows), and about ``requests_per_user`` pending requests
+    per user, sent mostly to well-connected users. Derived tables (friend
+    edges, search index, suggestions) are rebuilt. Returns the row counts.
+    """
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from rest_framework.authtoken.models import Token
+
+    from users.graph import rebuild_friend_graph
+    from users.hashing import make_password
+    from users.models import FriendRequest, Friendship
+    from users.search import rebuild_search_index
+    from users.stats import reconcile_stats
+    from users.suggestions import recompute_suggestions
+
+    rng = random.Random(seed)
+    encoded = make_password(PASSWORD)
+    offset = User.objects.filter(username__endswith='@bench.local').count()
+
+    with transaction.atomic():
+        created = User.objects.bulk_create([
+            User(
+                username=email_for(offset + i), email=email_for(offset + i), password=encoded,
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+            )
+            for i in range(users)
+        ], batch_size=batch_size)
+        ids = [user.pk for user in created]
+        Token.objects.bulk_create([Token(key=Token.generate_key(), user_id=pk) for pk in ids], batch_size=batch_size)
+
+        pairs, weighted = preferential_attachment(len(ids), friends_per_user, rng)
+        Friendship.objects.bulk_create(
+            [Friendship(user1_id=ids[b], user2_id=ids[a]) for a, b in pairs], batch_size=batch_size,
+        )
+        FriendRequest.objects.bulk_create(
+            [FriendRequest(from_user_id=ids[a], to_user_id=ids[b], status='accepted') for a, b in pairs], batch_size=batch_size,
+        )
+
+        taken = {frozenset(pair) for pair in pairs}
+        pending = []
+        for sender in range(len(ids)):
+            for _ in range(requests_per_user):
+                receiver = rng.choice(weighted) if weighted else sender
+                if receiver != sender and frozenset((sender, receiver)) not in taken:
+                    taken.add(frozenset((sender, receiver)))
+                    pending.append(FriendRequest(from_user_id=ids[sender], to_user_id=ids[receiver]))
+        FriendRequest.objects.bulk_create(pending, batch_size=batch_size)
+
+    rebuild_friend_graph(batch_size=batch_size)
+    rebuild_search_index(batch_size=batch_size)
+    recompute_suggestions()
+    reconcile_stats(chunk_size=batch_size)
+    return {'users': len(ids), 'friendships': len(pairs), 'pending_requests': len(pending)}
+
+
+def main():
+    from .harness import setup_django
+
+    parser = argparse.ArgumentParser(description='Seed the configured database with benchmark data.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--friends-per-user', type=int, default=3)
+    parser.add_argument('--requests-per-user', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    print(generate(args.users, args.friends_per_user, args.requests_per_user, args.seed))
+
+
+if __name__ == '__main__':
+    main()
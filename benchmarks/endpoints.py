@@ -0,0 +1,169 @@
+"""
+Per-endpoint benchmarks of the users API.
+
+    python -m benchmarks.endpoints --users 5000 --workers 8 --duration 5
+    python -m benchmarks.endpoints --baseline benchmarks/results/baseline.json
+
+Seeds a throwaway test database with ``benchmarks.datagen`` and, for every
+endpoint, records the SQL queries per request (median and max over a few
+sequential requests), then throughput and p50/p95/p99 latency under
+``--workers`` concurrent clients. Results are written as JSON; with
+``--baseline`` they are compared against an earlier run and the exit status is
+1 when an endpoint regressed by more than ``--tolerance``.
+
+Endpoints that write are driven by a single client on SQLite, which locks the
+whole database per write; use a local PostgreSQL to measure them under load.
+"""
+import argparse
+import itertools
+import json
+import random
+import statistics
+import sys
+
+from .datagen import PASSWORD, SEARCH_TERMS, email_for, generate
+from .harness import compare, run_load, setup_django, summarize, test_database, write_results
+
+ENDPOINTS = {}
+
+
+def endpoint(name, writes=False):
+    def register(func):
+        ENDPOINTS[name] = (func, writes)
+        return func
+    return register
+
+
+class Population:
+    """
+    The seeded users, their tokens and a counter for fresh signups.
+    """
+
+    def __init__(self):
+        from rest_framework.authtoken.models import Token
+
+        self.tokens = dict(Token.objects.values_list('user_id', 'key'))
+        self.user_ids = sorted(self.tokens)
+        self.signups = itertools.count()
+
+    def index(self, rng):
+        return rng.randrange(len(self.user_ids))
+
+    def client(self, rng):
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.tokens[self.user_ids[self.index(rng)]]}')
+        return client
+
+
+@endpoint('signup', writes=True)
+def signup(population, rng):
+    from rest_framework.test import APIClient
+
+    email = f'signup{next(population.signups)}@bench.local'
+    return APIClient().post('/user/signup', {'email': email, 'password': PASSWORD, 'first_name': 'Bench', 'last_name': 'User'})
+
+
+@endpoint('login')
+def login(population, rng):
+    from rest_framework.test import APIClient
+
+    return APIClient().post('/user/login', {'email': email_for(population.index(rng)), 'password': PASSWORD})
+
+
+@endpoint('user_search')
+def user_search(population, rng):
+    return population.client(rng).get('/user/user_search/', {'search': rng.choice(SEARCH_TERMS)})
+
+
+@endpoint('friend_request', writes=True)
+def friend_request(population, rng):
+    return population.client(rng).post('/user/friend-request', {'action': 'send', 'target_email': email_for(population.index(rng))})
+
+
+@endpoint('friends_list')
+def friends_list(population, rng):
+    return population.client(rng).get('/user/friends_list')
+
+
+@endpoint('pending_requests')
+def pending_requests(population, rng):
+    return population.client(rng).get('/user/pending-recieved-requests')
+
+
+@endpoint('counts')
+def counts(population, rng):
+    return population.client(rng).get('/user/counts')
+
+
+def count_queries(request, population, samples):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    rng = random.Random(1)
+    counts = []
+    for _ in range(samples):
+        with CaptureQueriesContext(connection) as queries:
+            request(population, rng)
+        counts.append(len(queries))
+    return {'queries_median': statistics.median(counts), 'queries_max': max(counts)}
+
+
+def benchmark(name, population, args):
+    from django.db import connection
+
+    request, writes = ENDPOINTS[name]
+    queries = count_queries(request, population, args.query_samples)
+    workers = 1 if writes and connection.vendor == 'sqlite' else args.workers
+    statuses = {}
+
+    def run_one(worker):
+        response = request(population, random.Random())
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return name
+
+    latencies, elapsed, errors = run_load(run_one, workers, args.duration)
+    return summarize(latencies.get(name, []), elapsed, workers=workers, errors=len(errors), statuses=statuses, **queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every users endpoint.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--friends-per-user', type=int, default=5)
+    parser.add_argument('--requests-per-user', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent client threads.')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds per endpoint.')
+    parser.add_argument('--query-samples', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=None, help='PBKDF2 work factor (default: PASSWORD_HASH_ITERATIONS).')
+    parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument('--output')
+    parser.add_argument('--baseline', help='Earlier results file to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression.')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    overrides = {'PASSWORD_HASH_ITERATIONS': args.iterations or settings.PASSWORD_HASH_ITERATIONS}
+    with test_database(**overrides):
+        seeded = generate(args.users, args.friends_per_user, args.requests_per_user)
+        population = Population()
+        results = {'config': vars(args), 'seeded': seeded, 'endpoints': {}}
+        for name in args.endpoints:
+            results['endpoints'][name] = summary = benchmark(name, population, args)
+            print(f"{name:<18} {summary['throughput']:>8} req/s  p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms "
+                  f"p99={summary['p99_ms']}ms  queries={summary['queries_median']}/{summary['queries_max']}")
+        print('results written to', write_results('endpoints', results, args.output))
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)['results']['endpoints']
+        regressions = compare(results['endpoints'], baseline, args.tolerance)
+        for line in regressions:
+            print('REGRESSION', line)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
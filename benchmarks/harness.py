@@ -0,0 +1,159 @@
+"""
+Shared plumbing for the benchmarks in this package: Django setup against a
+throwaway test database, a threaded load driver, latency percentiles and JSON
+result files.
+
+Benchmarks run against whatever ``DATABASES`` the settings module configures
+(SQLite or a local PostgreSQL); the test database is created and destroyed
+around the run, so no real data is touched.
+"""
+import json
+import math
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+
+
+def setup_django(settings_module='social_network.settings.admin'):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def test_database(**overrides):
+    """
+    Create the test database (and apply settings ``overrides``) for the
+    duration of the block.
+    """
+    from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+    # Throttling would cap every benchmark at a handful of requests.
+    overrides.setdefault('REST_FRAMEWORK', _without_throttling())
+    setup_test_environment(debug=False)
+    config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(**overrides):
+            yield
+    finally:
+        teardown_databases(config, verbosity=0)
+        teardown_test_environment()
+
+
+def _without_throttling():
+    from django.conf import settings
+
+    return {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of ``samples``.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def summarize(latencies, elapsed, **extra):
+    """
+    Throughput (requests/second) and p50/p95/p99 latency (milliseconds).
+    """
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        **extra,
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def run_load(request, workers, duration):
+    """
+    Call ``request(worker_index)`` from ``workers`` threads for ``duration``
+    seconds. ``request`` returns a label (e.g. the endpoint name); latencies
+    are collected per label. Returns ``(latencies_by_label, elapsed, errors)``.
+    """
+    from django.db import connections
+
+    latencies = {}
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    label = request(index)
+                except Exception as exc:
+                    with lock:
+                        errors.append(repr(exc))
+                    continue
+                took = time.perf_counter() - started
+                with lock:
+                    latencies.setdefault(label, []).append(took)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started, errors
+
+
+def environment():
+    from django.db import connection
+
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'database': connection.vendor,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def write_results(name, results, output=None):
+    """
+    Write ``results`` with the run's environment to ``output`` (default
+    ``benchmarks/results/<name>.json``) and return the path.
+    """
+    output = output or os.path.join(os.path.dirname(__file__), 'results', f'{name}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as fp:
+        json.dump({'benchmark': name, 'environment': environment(), 'results': results}, fp, indent=2)
+    return output
+
+
+def compare(current, baseline, tolerance):
+    """
+    Compare per-endpoint summaries with a baseline run. Returns a description
+    of every endpoint whose throughput fell, or whose p99 latency or query
+    count rose, by more than ``tolerance`` (a fraction).
+    """
+    regressions = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if before.get('throughput') and now['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']} -> {now['throughput']} req/s")
+        if before.get('p99_ms') and now['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {before['p99_ms']} -> {now['p99_ms']} ms")
+        if 'queries_max' in before and now.get('queries_max', 0) > before['queries_max']:
+            regressions.append(f"{name}: queries {before['queries_max']} -> {now['queries_max']}")
+    return regressions
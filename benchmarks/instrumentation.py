@@ -0,0 +1,52 @@
+"""
+Overhead of ``users.instrumentation``: read endpoints with and without the
+middleware, and with profiling off (the default).
+
+    python -m benchmarks.instrumentation --duration 5
+
+Each endpoint runs with the middleware removed from ``MIDDLEWARE`` and then
+with it in place; the report gives the relative change in throughput and p50.
+"""
+import argparse
+
+from .datagen import generate
+from .endpoints import Population, benchmark
+from .harness import setup_django, test_database, write_results
+
+ENDPOINTS = ['user_search', 'friends_list', 'pending_requests']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the overhead of the instrumentation middleware.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=1, help='One client keeps the comparison free of lock contention.')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--query-samples', type=int, default=1)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    bare = [name for name in settings.MIDDLEWARE if name != 'users.instrumentation.InstrumentationMiddleware']
+    results = {}
+    with test_database(PROFILE_SAMPLE_RATE=0.0):
+        generate(args.users, friends_per_user=5, requests_per_user=3)
+        population = Population()
+        for name in ENDPOINTS:
+            with override_settings(MIDDLEWARE=bare):
+                without = benchmark(name, population, args)
+            with_middleware = benchmark(name, population, args)
+            overhead = {
+                'throughput_pct': round((without['throughput'] / with_middleware['throughput'] - 1) * 100, 2),
+                'p50_pct': round((with_middleware['p50_ms'] / without['p50_ms'] - 1) * 100, 2),
+            }
+            results[name] = {'without': without, 'with': with_middleware, 'overhead': overhead}
+            print(f"{name:<18} throughput {without['throughput']} -> {with_middleware['throughput']} req/s "
+                  f"({overhead['throughput_pct']:+}%), p50 {without['p50_ms']} -> {with_middleware['p50_ms']} ms ({overhead['p50_pct']:+}%)")
+        print('results written to', write_results('instrumentation', results, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Mixed login + user search load, with password hashing inline versus in the
+``users.hashing`` pool.
+
+    python -m benchmarks.login_search --users 2000 --workers 16 --duration 10
+
+Each worker thread sends a login with probability ``--login-ratio`` and a
+search otherwise. The report gives overall throughput and per-endpoint p99:
+with inline hashing a login burst holds the request threads and search
+latency follows login latency; with the pool, hashes beyond the pool's
+capacity are refused with 503 and searches keep their latency.
+"""
+import argparse
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from .datagen import PASSWORD, SEARCH_TERMS, email_for, generate
+from .harness import run_load, setup_django, summarize, test_database, write_results
+
+
+def scenario(tokens, count, login_ratio):
+    from rest_framework.test import APIClient
+
+    def request(worker):
+        client = APIClient()
+        rng = random.Random()
+        if rng.random() < login_ratio:
+            response = client.post('/user/login', {'email': email_for(rng.randrange(count)), 'password': PASSWORD})
+            label = 'login'
+        else:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {tokens[worker % len(tokens)]}')
+            response = client.get('/user/user_search/', {'search': rng.choice(SEARCH_TERMS)})
+            label = 'search'
+        return label if response.status_code < 500 else f'{label}_{response.status_code}'
+
+    return request
+
+
+def run(args, tokens, pool):
+    from django.test.utils import override_settings
+
+    from users.hashing import get_hashing_pool, make_password
+
+    with override_settings(PASSWORD_HASHING_POOL=pool):
+        # Start the worker processes before the clock does.
+        warm_up = get_hashing_pool()
+        list(ThreadPoolExecutor(max(warm_up.workers, 1)).map(make_password, [PASSWORD] * max(warm_up.workers, 1)))
+        latencies, elapsed, errors = run_load(scenario(tokens, args.users, args.login_ratio), args.workers, args.duration)
+        get_hashing_pool().shutdown()
+    total = sum(len(samples) for samples in latencies.values())
+    return {
+        'pool': pool,
+        'throughput': round(total / elapsed, 2),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'endpoints': {label: summarize(samples, elapsed) for label, samples in sorted(latencies.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=16, help='Concurrent client threads.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per configuration.')
+    parser.add_argument('--login-ratio', type=float, default=0.2)
+    parser.add_argument('--iterations', type=int, default=870000, help='PBKDF2 work factor.')
+    parser.add_argument('--pool-workers', type=int, default=None, help='Hashing processes (default: one per CPU).')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.authtoken.models import Token
+
+    with test_database(PASSWORD_HASH_ITERATIONS=args.iterations, PASSWORD_HASHING_POOL={'WORKERS': 0}):
+        generate(args.users, friends_per_user=0, requests_per_user=0)
+        tokens = list(Token.objects.order_by('user_id').values_list('key', flat=True)[:64])
+        results = {
+            'inline': run(args, tokens, {'WORKERS': 0}),
+            'pool': run(args, tokens, {'WORKERS': args.pool_workers, 'QUEUE_SIZE': 32, 'TIMEOUT': 10, 'RETRY_AFTER': 1}),
+        }
+    for name, result in results.items():
+        print(f"{name:>7}: {result['throughput']:>8} req/s, errors {result['errors']}")
+        for label, summary in result['endpoints'].items():
+            print(f"         {label:<12} n={summary['requests']:<6} p50={summary['p50_ms']}ms p99={summary['p99_ms']}ms")
+    print('results written to', write_results('login_search', {'config': vars(args), **results}, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Per-row cost of the list endpoints' serialization: DRF ``ModelSerializer``
+plus ``JSONRenderer`` versus ``.values()`` rows (``users.serializers.ValuesSerializer``)
+plus ``users.renderers.FastJSONRenderer``.
+
+    python -m benchmarks.serialization --rows 100 --repeat 200
+
+For the user search, friends and pending-request lists, a page of ``--rows``
+rows is fetched, serialized and rendered ``--repeat`` times each way, on a
+throwaway test database. Reported per row: CPU time of the fetch (query and
+row construction), of the serialization and of the rendering, and the peak
+memory allocated for a page (``tracemalloc``). The two outputs are checked
+to be identical first.
+"""
+import argparse
+import time
+import tracemalloc
+
+from .harness import setup_django, test_database, write_results
+
+
+def create_data(rows):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from users.models import FriendEdge, FriendRequest
+    from users.search import rebuild_search_index
+
+    me = User.objects.create_user(username='me@bench.local', email='me@bench.local', password='x')
+    others = User.objects.bulk_create([
+        User(username=f'user{i}@bench.local', email=f'user{i}@bench.local', first_name='Ana', last_name=f'Kumar {i}')
+        for i in range(rows)
+    ])
+    now = timezone.now()
+    FriendEdge.objects.bulk_create([FriendEdge(user=me, friend=other, friend_date_joined=other.date_joined) for other in others])
+    FriendRequest.objects.bulk_create([FriendRequest(from_user=other, to_user=me, created_at=now) for other in others])
+    rebuild_search_index()
+    return me
+
+
+def endpoints(me, rows):
+    """
+    ``name: (model_page, values_page)``: callables returning the serialized
+    page of each implementation, before rendering.
+    """
+    from users.graph import friends_of
+    from users.search import search_users
+    from users.serializers import FriendRequestSerializer, UserSerializer, friend_request_values, friend_values, user_values
+    from users.views import pending_requests_for
+
+    def search():
+        return search_users('ana').order_by('search_rank', '-date_joined', '-id')
+
+    def friends():
+        return friends_of(me).order_by('-friend_date_joined', '-friend_id')
+
+    def pending():
+        return pending_requests_for(me).order_by('-created_at', '-id')
+
+    return {
+        'search': (
+            lambda: UserSerializer(list(search()[:rows]), many=True),
+            lambda: (user_values, list(user_values.values(search())[:rows])),
+        ),
+        'friends': (
+            lambda: UserSerializer([edge.friend for edge in friends()[:rows]], many=True),
+            lambda: (friend_values, list(friend_values.values(friends())[:rows])),
+        ),
+        'pending': (
+            lambda: FriendRequestSerializer(list(pending()[:rows]), many=True),
+            lambda: (friend_request_values, list(friend_request_values.values(pending())[:rows])),
+        ),
+    }
+
+
+def measure(fetch, serialize, render, repeat, rows):
+    fetch_cpu = serialize_cpu = render_cpu = 0
+    for _ in range(repeat):
+        started = time.process_time()
+        fetched = fetch()
+        fetched_at = time.process_time()
+        data = serialize(fetched)
+        serialized_at = time.process_time()
+        render(data)
+        fetch_cpu += fetched_at - started
+        serialize_cpu += serialized_at - fetched_at
+        render_cpu += time.process_time() - serialized_at
+
+    tracemalloc.start()
+    render(serialize(fetch()))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_row = 1e6 / (repeat * rows)
+    return {
+        'fetch_us_per_row': round(fetch_cpu * per_row, 2),
+        'serialize_us_per_row': round(serialize_cpu * per_row, 2),
+        'render_us_per_row': round(render_cpu * per_row, 2),
+        'total_us_per_row': round((fetch_cpu + serialize_cpu + render_cpu) * per_row, 2),
+        'peak_bytes_per_row': round(peak / rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare ModelSerializer + JSONRenderer with .values() rows + FastJSONRenderer.')
+    parser.add_argument('--rows', type=int, default=100, help='Rows per page (max_page_size is 100).')
+    parser.add_argument('--repeat', type=int, default=200, help='Pages per endpoint and implementation.')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+
+    from users import renderers
+
+    if renderers.orjson is None:
+        print('orjson is not installed: FastJSONRenderer falls back to JSONRenderer')
+    results = {'config': vars(args), 'orjson': renderers.orjson is not None, 'endpoints': {}}
+    with test_database():
+        me = create_data(args.rows)
+        for name, (model_page, values_page) in endpoints(me, args.rows).items():
+            model_output = JSONRenderer().render(model_page().data)
+            serializer, page = values_page()
+            if renderers.FastJSONRenderer().render(serializer.to_representation(page)) != model_output:
+                raise SystemExit(f'{name}: the outputs differ')
+
+            model = measure(model_page, lambda serializer: serializer.data, JSONRenderer().render, args.repeat, args.rows)
+            values = measure(
+                values_page, lambda fetched: fetched[0].to_representation(fetched[1]),
+                renderers.FastJSONRenderer().render, args.repeat, args.rows,
+            )
+            results['endpoints'][name] = {'model_serializer': model, 'values': values}
+            for label, summary in (('ModelSerializer', model), ('values', values)):
+                print(
+                    f"{name:8} {label:16} {summary['total_us_per_row']:7} us/row "
+                    f"(fetch {summary['fetch_us_per_row']}, serialize {summary['serialize_us_per_row']}, "
+                    f"render {summary['render_us_per_row']})  peak {summary['peak_bytes_per_row']} B/row"
+                )
+
+    print('results written to', write_results('serialization', results, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Throughput of the project behind different servers.
+
+    python -m benchmarks.datagen --users 2000         # once: seeds the configured database
+    python -m benchmarks.serving --concurrency 16 --duration 10
+
+Unlike the other benchmarks this one needs real server processes, so it runs
+against the configured database (seeded by ``benchmarks.datagen``), not a
+throwaway test database. Each server is started in turn on a free local port
+and loaded over HTTP with authenticated ``GET --path`` requests (the tokens of
+the seeded users) from ``--concurrency`` threads:
+
+- ``runserver``: ``manage.py runserver --noreload``, one threaded process,
+  DEBUG on;
+- ``gunicorn-debug``: ``social_network.gunicorn_conf`` with the development
+  settings (DEBUG on);
+- ``gunicorn``: ``social_network.gunicorn_conf`` with the production profile;
+- ``uvicorn``: ``social_network.gunicorn_asgi`` with the production profile.
+
+Besides throughput and latency it reports the servers' resident memory after
+the run, where DEBUG's ``connection.queries`` shows up. ``--dev-settings`` and
+``--prod-settings`` must point at the same database, and the production
+profile needs ``REDIS_URL`` (a local ``redis-server`` will do).
+"""
+import argparse
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from .harness import setup_django, summarize, write_results
+
+SERVERS = {
+    'runserver': ('dev', lambda port: [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']),
+    'gunicorn-debug': ('dev', lambda port: ['gunicorn', 'social_network.wsgi:application', '-c', 'python:social_network.gunicorn_conf']),
+    'gunicorn': ('prod', lambda port: ['gunicorn', 'social_network.wsgi:application', '-c', 'python:social_network.gunicorn_conf']),
+    'uvicorn': ('prod', lambda port: ['gunicorn', 'social_network.asgi:application', '-c', 'python:social_network.gunicorn_asgi']),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_listening(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def tree_rss_kb(pid):
+    """
+    Resident memory of ``pid`` and its children, in KiB (Linux only).
+    """
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as fp:
+                total += next(int(line.split()[1]) for line in fp if line.startswith('VmRSS:'))
+            with open(f'/proc/{current}/task/{current}/children') as fp:
+                pids.extend(int(child) for child in fp.read().split())
+        except (OSError, StopIteration):
+            continue
+    return total or None
+
+
+def load(port, path, tokens, concurrency, duration):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(index)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={'Authorization': f'Token {rng.choice(tokens)}'})
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 500
+            except (OSError, http.client.HTTPException) as exc:
+                ok = False
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                response = exc
+            took = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(took)
+                else:
+                    errors.append(repr(getattr(response, 'status', response)))
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started, errors
+
+
+def run(name, args, tokens):
+    profile, command = SERVERS[name]
+    port = free_port()
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': args.dev_settings if profile == 'dev' else args.prod_settings,
+        'DJANGO_SECRET_KEY': os.environ.get('DJANGO_SECRET_KEY', 'benchmark-only-secret'),
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN', 'benchmark-only-token'),
+        'DJANGO_ALLOWED_HOSTS': '127.0.0.1,localhost',
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+    }
+    if args.workers:
+        env['GUNICORN_WORKERS'] = str(args.workers)
+    process = subprocess.Popen(command(port), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_listening(port, process)
+        load(port, args.path, tokens, args.concurrency, min(args.duration, 2))  # warm-up
+        latencies, elapsed, errors = load(port, args.path, tokens, args.concurrency, args.duration)
+        return summarize(latencies, elapsed, errors=len(errors), rss_kb=tree_rss_kb(process.pid))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare throughput of the project behind different servers.')
+    parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument('--path', default='/user/friends_list')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, help='GUNICORN_WORKERS (default: from the core count).')
+    parser.add_argument('--dev-settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'social_network.settings.admin'))
+    parser.add_argument('--prod-settings', default='social_network.settings.production')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django(args.dev_settings)
+    from rest_framework.authtoken.models import Token
+
+    tokens = list(Token.objects.filter(user__username__endswith='@bench.local').values_list('key', flat=True)[:1000])
+    if not tokens:
+        parser.error('no benchmark users: seed the database with "python -m benchmarks.datagen" first')
+
+    results = {'config': vars(args), 'servers': {}}
+    for name in args.servers:
+        try:
+            results['servers'][name] = summary = run(name, args, tokens)
+        except (OSError, RuntimeError) as exc:  # e.g. gunicorn/uvicorn not installed
+            print(f'{name:15} skipped: {exc}')
+            continue
+        print(
+            f"{name:15} {summary['throughput']:8} req/s  p50={summary['p50_ms']}ms "
+            f"p99={summary['p99_ms']}ms  errors={summary['errors']}  rss={summary['rss_kb']} KiB"
+        )
+    print('results written to', write_results('serving', results, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Cold start and per-request middleware cost of the settings profiles.
+
+    python -m benchmarks.startup --runs 10 --requests 2000
+
+Startup: each profile is loaded ``--runs`` times in a fresh interpreter, which
+initializes Django and the WSGI handler and imports the URLconf (and with it
+every view), as a worker does before serving its first request. Reported:
+process wall time, the time spent in Django set-up, and the number of modules
+imported.
+
+Per request: ``GET /user/counts`` (a primary key lookup behind a cached token)
+is sent ``--requests`` times through the full handler with each profile's
+middleware stack, on a throwaway test database.
+
+The profiles must configure a database the interpreter can load the backend
+of; ``--profiles`` takes any settings modules.
+"""
+import argparse
+import importlib
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from .harness import percentile, setup_django, summarize, test_database, write_results
+
+PROFILES = ['social_network.settings.admin', 'social_network.settings.api']
+
+STARTUP = '''
+import json, os, sys, time
+started = time.perf_counter()
+os.environ['DJANGO_SETTINGS_MODULE'] = sys.argv[1]
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({'setup_ms': (time.perf_counter() - started) * 1000, 'modules': len(sys.modules)}))
+'''
+
+
+def measure_startup(profile, runs):
+    walls, setups = [], []
+    modules = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP, profile], check=True, capture_output=True, text=True,
+        ).stdout
+        walls.append((time.perf_counter() - started) * 1000)
+        result = json.loads(output.strip().splitlines()[-1])
+        setups.append(result['setup_ms'])
+        modules = result['modules']
+    return {
+        'wall_ms_median': round(statistics.median(walls), 1),
+        'setup_ms_median': round(statistics.median(setups), 1),
+        'setup_ms_p95': round(percentile(setups, 95), 1),
+        'modules': modules,
+    }
+
+
+def measure_requests(middleware, user, requests):
+    from django.test.utils import override_settings
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+
+    with override_settings(MIDDLEWARE=middleware):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        for _ in range(50):  # Warm-up: middleware chain, token cache.
+            client.get('/user/counts')
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            request_started = time.perf_counter()
+            client.get('/user/counts')
+            latencies.append(time.perf_counter() - request_started)
+        return summarize(latencies, time.perf_counter() - started, middleware=len(middleware))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare startup time and per-request middleware cost of the settings profiles.')
+    parser.add_argument('--profiles', nargs='+', default=PROFILES)
+    parser.add_argument('--runs', type=int, default=10, help='Cold starts per profile.')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per middleware stack.')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = {'config': vars(args), 'startup': {}, 'requests': {}}
+    for profile in args.profiles:
+        results['startup'][profile] = summary = measure_startup(profile, args.runs)
+        print(f"{profile:40} start {summary['wall_ms_median']:7} ms (django {summary['setup_ms_median']} ms)  modules={summary['modules']}")
+
+    setup_django(args.profiles[0])
+    from django.contrib.auth.models import User
+
+    with test_database(SERVER_TIMING_HEADER=False):
+        user = User.objects.create_user(username='startup@bench.local', email='startup@bench.local', password='x')
+        for profile in args.profiles:
+            middleware = importlib.import_module(profile).MIDDLEWARE
+            results['requests'][profile] = summary = measure_requests(middleware, user, args.requests)
+            print(f"{profile:40} {summary['throughput']:8} req/s  p50={summary['p50_ms']}ms  middleware={summary['middleware']}")
+
+    print('results written to', write_results('startup', results, args.output))
+
+
+if __name__ == '__main__':
+    main()
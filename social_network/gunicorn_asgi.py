@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for serving the project over ASGI with uvicorn workers.
+
+    gunicorn social_network.asgi:application -c python:social_network.gunicorn_asgi
+
+Each worker is one event loop, so a worker per core is enough; slow clients of
+the async endpoints (``users.async_views``) then cost a coroutine, not a thread.
+Everything else (preloading, worker recycling, timeouts) is shared with
+``social_network.gunicorn_conf``.
+"""
+import multiprocessing
+import os
+
+from .gunicorn_conf import *  # noqa: F401,F403
+
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
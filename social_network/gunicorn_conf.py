@@ -0,0 +1,51 @@
+"""
+Gunicorn configuration for serving the project over WSGI (the Docker image's
+default command).
+
+    gunicorn social_network.wsgi:application -c python:social_network.gunicorn_conf
+
+Unless ``DJANGO_SETTINGS_MODULE`` says otherwise this serves the API-only
+production profile (``social_network.settings.production``, DEBUG off); use
+``social_network.settings.production_admin`` for workers serving ``/admin/``.
+
+- Workers: ``2 x cores + 1`` gthread processes with ``GUNICORN_THREADS``
+  threads each, so a request waiting on the database or the hashing pool does
+  not hold up a whole process. ``GUNICORN_WORKER_CLASS=sync`` gives one
+  request per process.
+- ``preload_app``: the project is imported once in the master and the workers
+  are forked from it (faster boots, shared copy-on-write memory). Database
+  connections the master opened while importing are closed in every worker.
+- ``max_requests`` with jitter: each worker is replaced after about that many
+  requests, which bounds slow memory growth; the jitter keeps the workers from
+  restarting at the same moment.
+- ``graceful_timeout``: on a reload or shutdown, workers get that long to
+  finish in-flight requests. ``keepalive`` keeps idle client connections (e.g.
+  from a load balancer) open for that many seconds.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'social_network.settings.production')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Worker heartbeats on tmpfs: a slow disk (or Docker's overlay) cannot make
+# the master think a busy worker hung.
+worker_tmp_dir = os.environ.get('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # e.g. "-" for stdout
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Never share a socket opened by the master with a forked worker.
+    from django.db import connections
+
+    connections.close_all()
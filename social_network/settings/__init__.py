@@ -0,0 +1,3 @@
+"""
+Settings profiles; see ``social_network.settings.base``.
+"""
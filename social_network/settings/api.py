@@ -0,0 +1,10 @@
+"""
+API-only workers: ``DJANGO_SETTINGS_MODULE=social_network.settings.api``.
+
+Only the apps the JSON API uses are installed (no admin, sessions, messages,
+static files or templates) and the middleware stack is the short one of
+``base``, so a worker imports and initializes less at startup and runs fewer
+middleware per request. ``/admin/`` is not routed. Run migrations with the
+admin profile, which knows every table.
+"""
+from .base import *  # noqa: F401,F403
@@ -0,0 +1,295 @@
+"""
+Settings shared by every profile of the social_network project.
+
+On their own they describe the token-authenticated JSON API and nothing else;
+the profiles in this package build on them:
+
+- ``api``: API-only workers (``users.urls`` and ``/metrics``);
+- ``admin``: adds the admin site with sessions, messages, CSRF, templates and
+  static files; the default of manage.py, wsgi.py and asgi.py;
+- ``production`` / ``production_admin``: the same with the deployment
+  overrides of ``deploy`` (DEBUG off).
+
+Generated by 'django-admin startproject' using Django 4.2.15.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/4.2/ref/settings/
+"""
+
+import os
+from pathlib import Path
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'django-insecure-wo!kobf1ryh+es&ta1ad6he8sn(1p=1n)8lk70w$m7*i!*i7h)'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = True
+
+ALLOWED_HOSTS = []
+
+
+# Application definition
+
+PROJECT_APPS = [
+    'users',
+    'rest_framework',
+    'rest_framework.authtoken'
+]
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    *PROJECT_APPS,
+]
+
+
+REST_FRAMEWORK = {
+    'DEFAULT_PERMISSION_CLASSES': (
+        'rest_framework.permissions.IsAuthenticated',
+    ),
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'users.authentication.CachedTokenAuthentication',
+    ),
+    # JSON only: the browsable API needs templates (see the admin profile).
+    'DEFAULT_RENDERER_CLASSES': (
+        'users.renderers.FastJSONRenderer',
+    ),
+    # Rates enforced by users.throttling (sliding window, shared across workers).
+    'DEFAULT_THROTTLE_RATES': {
+        'signup': '20/hour',
+        'login': '10/min',
+        'user_search': '60/min',
+        'friend_request': '3/min',
+    },
+}
+
+# Storage for the rate limiter: users.ratelimit.DatabaseBackend (shared via the
+# database), users.ratelimit.RedisBackend (shared via Redis, needs the "redis"
+# package, e.g. OPTIONS {'url': 'redis://redis:6379/0'}) or
+# users.ratelimit.LocMemBackend (per process, for tests).
+RATE_LIMIT_BACKEND = 'users.ratelimit.DatabaseBackend'
+RATE_LIMIT_BACKEND_OPTIONS = {}
+
+# users.authentication.CachedTokenAuthentication: seconds a token -> user
+# snapshot lives in the shared cache, and size/seconds of the per-process LRU.
+TOKEN_AUTH_CACHE_TTL = 300
+TOKEN_AUTH_LOCAL_CACHE_SIZE = 10000
+TOKEN_AUTH_LOCAL_CACHE_TTL = 10
+
+# Largest list of operations accepted by users.views.FriendRequestBatchView.
+FRIEND_REQUEST_BATCH_MAX_OPERATIONS = 100
+
+# users.suggestions: suggestions kept per user, and friends read per side when
+# a friendship is created (larger hubs are left to recompute_suggestions).
+FRIEND_SUGGESTIONS_TOP_K = 50
+FRIEND_SUGGESTIONS_FANOUT_LIMIT = 1000
+
+# users.jobs (background jobs, run by "manage.py run_jobs"): jobs claimed per
+# batch, attempts before a job is marked failed, first retry delay (doubled per
+# attempt up to MAX_RETRY_DELAY), seconds a claimed job is leased to a worker,
+# and seconds finished jobs (and their idempotency keys) are kept.
+JOB_QUEUE = {
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 2,
+    'MAX_RETRY_DELAY': 600,
+    'LEASE_SECONDS': 300,
+    'RETENTION_SECONDS': 86400,
+}
+
+# users.events (the /user/events stream): how events reach the streams of other
+# worker processes (Redis pub/sub when REDIS_URL is set, otherwise each process
+# polls the table), events queued per stream before it falls back to reading
+# the table, seconds between keep-alive comments, most missed events replayed
+# on reconnect (more get a reset event), and seconds events are kept.
+EVENT_STREAM = {
+    'BACKEND': 'users.events.RedisBackend' if os.environ.get('REDIS_URL') else 'users.events.DatabaseBackend',
+    'OPTIONS': {'url': os.environ['REDIS_URL']} if os.environ.get('REDIS_URL') else {},
+    'QUEUE_SIZE': 100,
+    'HEARTBEAT': 15,
+    'REPLAY_LIMIT': 500,
+    'RETENTION_SECONDS': 86400,
+}
+
+# users.hashing: password hashes run in a process pool of WORKERS processes
+# (None = one per CPU, 0 = inline on the request thread). At most
+# WORKERS + QUEUE_SIZE hashes are admitted at once; further logins and signups
+# get 503 with Retry-After: RETRY_AFTER. TIMEOUT bounds the wait for a result.
+PASSWORD_HASHING_POOL = {
+    'WORKERS': None,
+    'QUEUE_SIZE': 32,
+    'TIMEOUT': 10,
+    'RETRY_AFTER': 1,
+}
+
+# users.instrumentation: add a Server-Timing header to every response, run this
+# fraction of requests under cProfile (dumped to PROFILE_DIR), and require
+# "Authorization: Bearer <METRICS_TOKEN>" on /metrics when it is set.
+SERVER_TIMING_HEADER = True
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_DIR = BASE_DIR / 'profiles'
+METRICS_TOKEN = None
+
+# Token authentication happens in the views (DRF) and is CSRF-exempt, so the
+# API needs no session, CSRF or auth middleware.
+MIDDLEWARE = [
+    'users.instrumentation.InstrumentationMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'users.routers.ReplicaRoutingMiddleware',
+]
+
+
+
+# Shared by every worker process: Redis when REDIS_URL is set, otherwise files
+# under CACHE_DIR, which all processes on one host share (local runs and tests).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / '.cache'),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
+# users.response_cache: seconds friends/pending pages are cached, seconds and
+# minimum request count before a search page is cached, the least seconds
+# between two signups dropping the cached searches, and the single-flight
+# lock's lifetime and the longest a request waits for another to fill the entry.
+RESPONSE_CACHE = {
+    'TIMEOUT': 300,
+    'SEARCH_TIMEOUT': 60,
+    'SEARCH_MIN_HITS': 2,
+    'SEARCH_INVALIDATE_INTERVAL': 10,
+    'LOCK_TIMEOUT': 10,
+    'LOCK_WAIT': 2,
+}
+
+ROOT_URLCONF = 'social_network.urls'
+
+TEMPLATES = []
+
+WSGI_APPLICATION = 'social_network.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+
+
+# Connection settings come from the environment (docker-compose.yml sets them).
+# By default a connection is kept for DB_CONN_MAX_AGE seconds and checked before
+# it is reused, instead of opening one per request. Setting DB_POOL_MAX_SIZE
+# switches to a psycopg 3 pool instead (Django allows one or the other): at most
+# DB_POOL_MAX_SIZE connections per process, and a request waits up to
+# DB_POOL_TIMEOUT seconds for a free one. Pool statistics are served at /metrics.
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'social_network_db'),
+        'USER': os.environ.get('POSTGRES_USER', 'user'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'password'),
+        'HOST': os.environ.get('POSTGRES_HOST', 'db'),  # service name in my docker-compose.yml
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            },
+        } if DB_POOL_MAX_SIZE else {},
+    }
+}
+
+# Read replicas: POSTGRES_REPLICA_HOSTS is a comma-separated list of hosts with
+# the same database and credentials as the primary. users.routers sends the
+# reads of GET requests to them (see that module for pinning and failover).
+# Tests run against the primary only (TEST MIRROR).
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASE_REPLICAS.append(f'replica{number}')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['users.routers.PrimaryReplicaRouter']
+
+# After a successful write a user reads from the primary for this many seconds,
+# so they see their own changes despite replication lag.
+DATABASE_REPLICA_PIN_SECONDS = 5
+
+# A replica that failed is not used again for this many seconds.
+DATABASE_REPLICA_RETRY_SECONDS = 30
+
+
+AUTHENTICATION_BACKENDS = [
+    'users.backends.PooledHashingModelBackend',
+]
+
+# users.hashers.PBKDF2PolicyPasswordHasher reads its work factor from
+# PASSWORD_HASH_ITERATIONS; hashes made with another count are upgraded on login.
+PASSWORD_HASHERS = [
+    'users.hashers.PBKDF2PolicyPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = 870000
+
+# Password validation
+# https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/4.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
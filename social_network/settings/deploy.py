@@ -0,0 +1,54 @@
+"""
+Deployment overrides, applied on top of a profile by ``production`` and
+``production_admin``.
+
+DEBUG is off. Besides error pages, DEBUG makes Django record every SQL
+statement in ``connection.queries`` (up to 9000 per connection, per thread),
+which costs time on every query and memory for the life of the worker. The
+secret key, the metrics token, the Redis URL and allowed hosts must come from
+the environment.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import PASSWORD_HASHING_POOL
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('DJANGO_SECRET_KEY must be set in production.')
+
+# /metrics exposes per-view traffic and must not be open to anyone. The
+# Server-Timing header tells any client how long the database took; turn it on
+# (SERVER_TIMING_HEADER=1) only where the clients are trusted.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+if not METRICS_TOKEN:
+    raise ImproperlyConfigured('METRICS_TOKEN must be set in production.')
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', '0') == '1'
+
+# The response cache, the token cache and replica pinning are invalidated by
+# writes to the cache, which must therefore be shared by every host: the
+# per-host file cache of base.py would serve other hosts stale pages until they
+# expire (and it lists its whole directory on every set).
+if not os.environ.get('REDIS_URL'):
+    raise ImproperlyConfigured('REDIS_URL must be set in production.')
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',') if host.strip()]
+
+# Behind a TLS-terminating proxy that sets X-Forwarded-Proto.
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = CSRF_COOKIE_SECURE = os.environ.get('DJANGO_SECURE_COOKIES', '1') == '1'
+
+# Every gunicorn worker (social_network.gunicorn_conf: GUNICORN_WORKERS, by
+# default 2 x cores + 1) starts its own hashing pool, so one process per CPU
+# each would run several times more hashes than there are cores. Split the
+# cores between the workers instead (at least one process each), or set
+# PASSWORD_HASHING_WORKERS.
+_cores = os.cpu_count() or 1
+_gunicorn_workers = int(os.environ.get('GUNICORN_WORKERS', _cores * 2 + 1))
+PASSWORD_HASHING_POOL = {
+    **PASSWORD_HASHING_POOL,
+    'WORKERS': int(os.environ.get('PASSWORD_HASHING_WORKERS', max(1, _cores // _gunicorn_workers))),
+}
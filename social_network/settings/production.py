@@ -0,0 +1,7 @@
+"""
+Production API workers: ``DJANGO_SETTINGS_MODULE=social_network.settings.production``
+(the default of ``social_network.gunicorn_conf``). The ``api`` profile with
+the ``deploy`` overrides.
+"""
+from .api import *  # noqa: F401,F403
+from .deploy import *  # noqa: F401,F403
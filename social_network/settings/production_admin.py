@@ -0,0 +1,9 @@
+"""
+Production admin workers: the ``admin`` profile with the ``deploy`` overrides.
+"""
+from .admin import *  # noqa: F401,F403
+from .deploy import *  # noqa: F401,F403
+from .base import BASE_DIR
+
+# Admin assets, collected with "manage.py collectstatic" and served by the proxy.
+STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -14,12 +14,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path
 from django.urls import path, include
 
+from users.instrumentation import metrics_view
+
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('user/', include('users.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
+
+# Not installed in the API-only profile (social_network.settings.api).
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
@@ -0,0 +1,182 @@
+"""
+Async (ASGI) versions of the read endpoints and login, and the event stream.
+
+DRF runs every ``APIView`` synchronously, so these are plain Django async views
+built on the async ORM. Under an ASGI server (see ``social_network/gunicorn_asgi.py``)
+a worker can keep thousands of slow clients open without a thread per request.
+They return the same status codes and JSON bodies as the views in
+``users.views``; ``users.tests.AsyncParityTests`` keeps the two in step.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+
+from . import events, renderers, response_cache
+from .authentication import CachedTokenAuthentication
+from .graph import friends_of
+from .pagination import FriendsPagination, PendingRequestsPagination, UserSearchPagination
+from .search import search_users
+from .serializers import friend_request_values, friend_values, user_values
+from .throttling import LoginThrottle, UserSearchThrottle
+from .views import pending_requests_for
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async stand-in for DRF's ``APIView``: token authentication,
+    throttling and DRF-style error responses.
+    """
+    authentication_required = True
+    throttle_classes = ()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Token-authenticated like DRF's APIView, so CSRF does not apply.
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            await self.authenticate(request)
+            await self.check_throttles(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def authenticate(self, request):
+        credentials = await CachedTokenAuthentication().aauthenticate(request)
+        request.user, request.auth = credentials if credentials else (AnonymousUser(), None)
+        if self.authentication_required and not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+
+    async def check_throttles(self, request):
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                raise exceptions.Throttled(throttle.wait())
+
+    def handle_exception(self, exc):
+        response = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = CachedTokenAuthentication.keyword
+        if getattr(exc, 'wait', None) is not None:
+            response['Retry-After'] = '%d' % exc.wait
+        return response
+
+
+def cached_json(result):
+    data, status_code, hit = result
+    headers = {'X-Cache': 'HIT' if hit else 'MISS'}
+    content = renderers.dumps(data)
+    if content is None:
+        return JsonResponse(data, status=status_code, headers=headers)
+    return HttpResponse(content, status=status_code, content_type='application/json', headers=headers)
+
+
+class AsyncLoginView(AsyncAPIView):
+    authentication_required = False
+    throttle_classes = (LoginThrottle,)
+
+    async def post(self, request):
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'detail': 'JSON parse error'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            data = request.POST
+        email = data.get('email')
+        password = data.get('password')
+
+        if not email or not password:
+            return JsonResponse({'error': 'Email and password are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        email = email.lower()
+
+        user = await sync_to_async(authenticate)(request, username=email, password=password)
+        if user is None:
+            return JsonResponse({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+        token, created = await Token.objects.aget_or_create(user=user)
+        return JsonResponse({'message': 'Login successful', 'token': token.key}, status=status.HTTP_200_OK)
+
+
+class AsyncUserSearchView(AsyncAPIView):
+    throttle_classes = (UserSearchThrottle,)
+
+    async def get(self, request):
+        search_keyword = request.GET.get('search', '').lower()
+        if not search_keyword:
+            return JsonResponse({'error': 'No search keyword provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return cached_json(await response_cache.acached_search(request, lambda: self.search(request, search_keyword)))
+
+    async def search(self, request, search_keyword):
+        paginator = UserSearchPagination()
+        page = await paginator.apaginate_queryset(user_values.values(search_users(search_keyword), *paginator.ordering_fields), request)
+        if not page and not paginator.has_previous:
+            return {'error': 'No users found matching the search criteria'}, status.HTTP_404_NOT_FOUND
+
+        return paginator.get_paginated_data(user_values.to_representation(page)), status.HTTP_200_OK
+
+
+class AsyncListFriendsView(AsyncAPIView):
+    async def get(self, request):
+        return cached_json(await response_cache.acached(request, 'friends', request.user.pk, lambda: self.list_friends(request)))
+
+    async def list_friends(self, request):
+        paginator = FriendsPagination()
+        edges = await paginator.apaginate_queryset(friend_values.values(friends_of(request.user), *paginator.ordering_fields), request)
+        if not edges and not paginator.has_previous:
+            return {'message': 'No friends yet'}, status.HTTP_200_OK
+
+        return paginator.get_paginated_data(friend_values.to_representation(edges)), status.HTTP_200_OK
+
+
+class AsyncListPendingFriendRequestsView(AsyncAPIView):
+    async def get(self, request):
+        return cached_json(await response_cache.acached(request, 'pending', request.user.pk, lambda: self.list_pending(request)))
+
+    async def list_pending(self, request):
+        pending_requests = pending_requests_for(request.user)
+
+        since = request.GET.get('since')
+        if since:
+            try:
+                pending_requests = pending_requests.filter(id__gt=int(since))
+            except ValueError:
+                return {'error': 'since must be a friend request id'}, status.HTTP_400_BAD_REQUEST
+
+        paginator = PendingRequestsPagination()
+        page = await paginator.apaginate_queryset(friend_request_values.values(pending_requests, *paginator.ordering_fields), request)
+        return paginator.get_paginated_data(friend_request_values.to_representation(page)), status.HTTP_200_OK
+
+
+class EventStreamView(AsyncAPIView):
+    """
+    Server-Sent Events stream of the friend requests sent to, accepted by or
+    rejected by the authenticated user or sent by them (``users.events``),
+    in place of polling the pending list. A reconnect resumes after the
+    ``Last-Event-ID`` header (or ``last_event_id`` parameter). Needs an ASGI
+    worker: under WSGI the stream would hold a thread for its whole life.
+    """
+
+    async def get(self, request):
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        if last_event_id is not None:
+            try:
+                last_event_id = int(last_event_id)
+            except ValueError:
+                return JsonResponse({'error': 'Last-Event-ID must be an event id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(events.stream(request.user.pk, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Keep nginx and similar proxies from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
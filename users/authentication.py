@@ -0,0 +1,193 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from . import routers
+from .instrumentation import record_cache
+
+# Columns of auth_user kept in a snapshot. The password hash is deliberately
+# left out; it is loaded lazily (and saving the user only writes these fields).
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser', 'date_joined',
+)
+# The same in model field order, which is the order Model.from_db() takes values in.
+SNAPSHOT_FIELDS_IN_MODEL_ORDER = [field.attname for field in User._meta.concrete_fields if field.attname in SNAPSHOT_FIELDS]
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU map whose entries expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self.clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def reset(self):
+        self.counts = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+local_tokens = LRUCache(
+    maxsize=getattr(settings, 'TOKEN_AUTH_LOCAL_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_AUTH_LOCAL_CACHE_TTL', 10),
+)
+stats = TokenCacheStats()
+
+
+def shared_cache_key(key):
+    # Never use the raw token as (part of) a cache key.
+    return 'auth:token:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def invalidate_token(key):
+    local_tokens.delete(key)
+    cache.delete(shared_cache_key(key))
+    stats.incr('invalidations')
+
+
+def invalidate_user_tokens(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    ``TokenAuthentication`` with a read-through cache of token -> user.
+
+    Lookups go to a bounded in-process LRU first (short TTL, because other
+    workers cannot invalidate it), then to the shared Django cache (longer
+    TTL), and only then to the ``Token`` JOIN ``User`` query. Entries are
+    invalidated explicitly by ``users.signals`` when a token is deleted or
+    rotated and when its user is changed or deactivated.
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot = local_tokens.get(key)
+        if snapshot is not None:
+            stats.incr('local_hits')
+            record_cache(hit=True)
+        else:
+            snapshot = cache.get(shared_cache_key(key))
+            if snapshot is not None:
+                stats.incr('shared_hits')
+                record_cache(hit=True)
+            else:
+                stats.incr('misses')
+                record_cache(hit=False)
+                snapshot = self.load_snapshot(key)
+                cache.set(shared_cache_key(key), snapshot, getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 300))
+            local_tokens.set(key, snapshot)
+        return self.build_credentials(key, snapshot)
+
+    def load_snapshot(self, key):
+        return self.snapshot_from_values(self.snapshot_queryset(key).first())
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of ``authenticate`` for the ASGI views in
+        ``users.async_views``, which run outside DRF.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        snapshot = local_tokens.get(key)
+        if snapshot is not None:
+            stats.incr('local_hits')
+            record_cache(hit=True)
+        else:
+            snapshot = await cache.aget(shared_cache_key(key))
+            if snapshot is not None:
+                stats.incr('shared_hits')
+                record_cache(hit=True)
+            else:
+                stats.incr('misses')
+                record_cache(hit=False)
+                snapshot = self.snapshot_from_values(await self.snapshot_queryset(key).afirst())
+                await cache.aset(shared_cache_key(key), snapshot, getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 300))
+            local_tokens.set(key, snapshot)
+        return self.build_credentials(key, snapshot)
+
+    def snapshot_queryset(self, key):
+        return self.get_model().objects.filter(key=key).values(*[f'user__{field}' for field in SNAPSHOT_FIELDS])
+
+    @staticmethod
+    def snapshot_from_values(values):
+        if values is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return {field: values[f'user__{field}'] for field in SNAPSHOT_FIELDS}
+
+    @staticmethod
+    def build_credentials(key, snapshot):
+        if not snapshot['is_active']:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        routers.user_authenticated(snapshot['id'])
+        user = User.from_db('default', SNAPSHOT_FIELDS, [snapshot[field] for field in SNAPSHOT_FIELDS_IN_MODEL_ORDER])
+        token = Token(key=key, user=user)
+        token._state.adding = False
+        return user, token
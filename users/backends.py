@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from . import hashing
+
+UserModel = get_user_model()
+
+
+class PooledHashingModelBackend(ModelBackend):
+    """
+    ``ModelBackend`` that verifies passwords in the ``users.hashing`` pool and
+    transparently rehashes them (also in the pool) when the hasher or its work
+    factor has changed since the password was set.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash once anyway so unknown usernames take as long as known ones.
+            hashing.make_password(password)
+            return
+
+        is_correct, must_update = hashing.check_password(password, user.password)
+        if not is_correct:
+            return
+        if must_update:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+        if self.user_can_authenticate(user):
+            return user
@@ -0,0 +1,43 @@
+"""
+Case-insensitive email lookups served by a unique index.
+
+Stock ``auth_user.email`` has no index, and ``email__iexact`` could not use a
+plain one anyway. Migration 0010 adds a unique index on ``email_key`` (the
+lower-cased email, NULL when blank, so users without an email never collide),
+and every lookup by email filters on that same expression so the index serves
+it. The index also makes two signups with the same address impossible: the
+second insert fails with an ``IntegrityError``.
+"""
+from django.contrib.auth.models import User
+from django.db.models import CharField, Func
+
+EMAIL_KEY_INDEX = 'users_auth_user_email_key'
+
+
+class EmailKey(Func):
+    # Literal '' rather than a parameter: SQLite only matches a query
+    # expression to an index expression when they are written the same way.
+    template = "NULLIF(LOWER(%(expressions)s), '')"
+    output_field = CharField()
+
+
+# The indexed expression, as SQL (see the migration).
+EMAIL_KEY_SQL = "NULLIF(LOWER(email), '')"
+
+
+def normalize_email(email):
+    return email.lower()
+
+
+def users_with_email(*emails):
+    """
+    The users whose email is one of ``emails``, ignoring case. Values that
+    are not strings (e.g. from a JSON body) match nobody.
+    """
+    keys = {normalize_email(email) for email in emails if isinstance(email, str)}
+    if not keys:
+        return User.objects.none()
+    users = User.objects.alias(email_key=EmailKey('email'))
+    if len(keys) == 1:
+        return users.filter(email_key=keys.pop())
+    return users.filter(email_key__in=keys)
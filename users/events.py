@@ -0,0 +1,419 @@
+"""
+Push of friend request events to the users they concern, served as
+Server-Sent Events by ``users.async_views.EventStreamView`` (``/user/events``).
+
+Writers collect events in an ``EventBatch`` and ``record()`` it inside the
+transaction of the change: one ``UserEvent`` row per recipient. Each user's
+events are numbered 1, 2, 3... (``seq``, the SSE event id) from a counter in
+their ``UserStats`` row, which stays locked until the transaction ends. A
+user's events therefore commit in ``seq`` order, with no gaps, however
+concurrent the writers. Row ids are no such thing: they are assigned at insert
+and can commit out of order. The events are published once the transaction
+commits. A client that reconnects with ``Last-Event-ID`` is first sent what it
+missed, read from the table, so it does not have to refetch its pending list.
+
+Within a process, events fan out through ``broker``: every open stream
+subscribes with a bounded queue and publishing never blocks. When a stream's
+queue overflows (its client reads slower than events arrive), the queued
+events are dropped and the stream catches up from the table instead, so a slow
+client holds at most ``QUEUE_SIZE`` events in memory. A stream only uses a
+database connection for its reads and closes it after each, so idle streams
+hold none (an open stream must not take a pool slot for its lifetime).
+
+Between processes, the configured backend carries events to every process's
+broker:
+
+- ``LocalBackend``: this process only (a single worker, tests).
+- ``DatabaseBackend``: each process polls the table for new ids, one query
+  per ``poll_interval`` however many clients it serves. Every poll re-reads
+  the last ``rescan`` ids too, so events that committed after a higher id
+  are still picked up.
+- ``RedisBackend``: Redis pub/sub. Requires the ``redis`` package.
+
+A stream delivers a user's events strictly in ``seq`` order. When it sees a
+gap (a later event arrived first, or one was missed) it reads the missing ones
+from the table, and it checks the counter at every heartbeat, so no committed
+event is lost even if its notification is.
+
+Configured by ``settings.EVENT_STREAM``.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import DatabaseError, close_old_connections, connections, transaction
+from django.db.models import Case, F, When
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import UserEvent, UserStats
+from .stats import compute
+
+SENT = 'friend_request.sent'
+ACCEPTED = 'friend_request.accepted'
+REJECTED = 'friend_request.rejected'
+# Sent instead of missed events that cannot be replayed (too many, or purged):
+# the client should refetch what it shows.
+RESET = 'reset'
+
+MESSAGE_FIELDS = ('id', 'user_id', 'seq', 'kind', 'data')
+
+
+def _options():
+    return {
+        'BACKEND': 'users.events.DatabaseBackend',
+        'OPTIONS': {},
+        'QUEUE_SIZE': 100,
+        'HEARTBEAT': 15,
+        'REPLAY_LIMIT': 500,
+        'RETENTION_SECONDS': 86400,
+        **getattr(settings, 'EVENT_STREAM', {}),
+    }
+
+
+def _user_data(user):
+    return {'id': user.id, 'username': user.username, 'email': user.email}
+
+
+class EventBatch:
+    def __init__(self):
+        self.events = []
+
+    def add(self, kind, from_user, to_user):
+        """
+        Tell both users that the request ``from_user -> to_user`` was ``kind``.
+        """
+        data = {'from_user': _user_data(from_user), 'to_user': _user_data(to_user)}
+        self.events += [UserEvent(user_id=user.id, kind=kind, data=data) for user in (from_user, to_user)]
+
+    def record(self):
+        if not self.events:
+            return
+        seqs = advance_sequences(Counter(event.user_id for event in self.events))
+        for event in self.events:
+            seqs[event.user_id] += 1
+            event.seq = seqs[event.user_id]
+        messages = [
+            {field: getattr(event, field) for field in MESSAGE_FIELDS}
+            for event in UserEvent.objects.bulk_create(self.events)
+        ]
+        self.events = []
+        transaction.on_commit(lambda: get_event_backend().publish(messages))
+
+
+def advance_sequences(counts):
+    """
+    Reserve ``counts[user_id]`` event numbers for each user and return the
+    number each user's events continue after. The ``UserStats`` rows are
+    locked in user id order (as by ``users.stats``) until the transaction ends.
+    """
+    user_ids = sorted(counts)
+    seqs = dict(
+        UserStats.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id')
+        .values_list('user_id', 'last_event_seq')
+    )
+    missing = [user_id for user_id in user_ids if user_id not in seqs]
+    if missing:
+        UserStats.objects.bulk_create(compute(missing), ignore_conflicts=True)
+        return advance_sequences(counts)
+    UserStats.objects.filter(user_id__in=user_ids).update(last_event_seq=Case(
+        *[When(user_id=user_id, then=F('last_event_seq') + count) for user_id, count in counts.items()],
+    ))
+    return seqs
+
+
+class Subscription:
+    """
+    The bounded queue of one open stream. A ``None`` in the queue means
+    events were dropped and must be read from the table.
+    """
+
+    def __init__(self, user_id, size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def put(self, message):
+        # Runs on the stream's event loop.
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        message = await asyncio.wait_for(self.queue.get(), timeout)
+        if message is None:
+            # Whatever arrives from now on is queued again; the catch-up read
+            # that follows covers everything before.
+            self.overflowed = False
+        return message
+
+
+class Broker:
+    """
+    The open streams of this process, by user.
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, size):
+        subscription = Subscription(user_id, size)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def dispatch(self, messages):
+        """
+        Hand ``messages`` to the streams of their users. Thread-safe.
+        """
+        with self._lock:
+            targets = [
+                (subscription, message)
+                for message in messages
+                for subscription in self._subscriptions.get(message['user_id'], ())
+            ]
+        for subscription, message in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                pass  # The stream's loop has closed.
+
+
+broker = Broker()
+
+
+class BaseEventBackend:
+    def publish(self, messages):
+        raise NotImplementedError
+
+    def start(self):
+        """
+        Start delivering the events of other processes to ``broker``. Called
+        whenever a stream opens; only the first call has an effect.
+        """
+
+
+class LocalBackend(BaseEventBackend):
+    def publish(self, messages):
+        broker.dispatch(messages)
+
+
+class _ListenerThread:
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.listen, name=f'{type(self).__name__}-listener', daemon=True)
+                self._thread.start()
+
+    def listen(self):
+        raise NotImplementedError
+
+
+class DatabaseBackend(_ListenerThread, LocalBackend):
+    """
+    Streams of this process get events at once; every process also polls the
+    table for events written by the others (duplicates are skipped by seq).
+    Ids commit out of order, so each poll starts ``rescan`` ids below the
+    highest one seen and skips the ids it already dispatched.
+    """
+
+    def __init__(self, poll_interval=1.0, batch_size=1000, rescan=100):
+        super().__init__()
+        if rescan >= batch_size:
+            raise ImproperlyConfigured('DatabaseBackend needs rescan < batch_size.')
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.rescan = rescan
+
+    def listen(self):
+        last_id = None
+        seen = set()
+        while True:
+            try:
+                close_old_connections()
+                if last_id is None:
+                    last_id = UserEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                rows = list(
+                    UserEvent.objects.filter(id__gt=last_id - self.rescan).order_by('id').values(*MESSAGE_FIELDS)[:self.batch_size]
+                )
+                messages = [row for row in rows if row['id'] not in seen]
+                if rows:
+                    last_id = max(last_id, rows[-1]['id'])
+                seen = {event_id for event_id in (*seen, *(row['id'] for row in messages)) if event_id > last_id - self.rescan}
+                if messages:
+                    broker.dispatch(messages)
+                if len(rows) == self.batch_size:
+                    continue
+            except DatabaseError:
+                pass  # Try again at the next poll.
+            time.sleep(self.poll_interval)
+
+
+class RedisBackend(_ListenerThread, BaseEventBackend):
+    """
+    Publishes to a Redis channel every process subscribes to.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', channel='events', client=None):
+        super().__init__()
+        if client is None:
+            try:
+                import redis
+            except ImportError as exc:
+                raise ImproperlyConfigured('RedisBackend requires the "redis" package.') from exc
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.channel = channel
+
+    def publish(self, messages):
+        self.client.publish(self.channel, json.dumps(messages))
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        broker.dispatch(json.loads(message['data']))
+            except Exception:
+                time.sleep(1)  # Reconnect.
+
+
+@lru_cache(maxsize=None)
+def get_event_backend():
+    options = _options()
+    return import_string(options['BACKEND'])(**options['OPTIONS'])
+
+
+@receiver(setting_changed)
+def reset_event_backend(setting, **kwargs):
+    if setting == 'EVENT_STREAM':
+        get_event_backend.cache_clear()
+
+
+def format_event(event_id, kind, data):
+    return f'id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n'
+
+
+def _released(function):
+    """
+    ``function`` (which reads the database) as a coroutine function that gives
+    the connections back before returning. Django only closes a request's
+    connections when the response ends, so otherwise every open stream would
+    hold one (a pool slot, or a server process) for as long as it is open.
+    """
+    def run(*args):
+        try:
+            return function(*args)
+        finally:
+            for conn in connections.all(initialized_only=True):
+                # Not one a test case (or a caller) is still using.
+                if not conn.in_atomic_block:
+                    conn.close()
+    return sync_to_async(run)
+
+
+def _last_event_seq(user_id):
+    return UserStats.objects.filter(user_id=user_id).values_list('last_event_seq', flat=True).first() or 0
+
+
+_latest_seq = _released(_last_event_seq)
+
+
+@_released
+def _catch_up(user_id, last_seq, limit):
+    """
+    Return the seq to continue after and the SSE chunks of the events of
+    ``user_id`` after ``last_seq``, or a single reset event when they cannot
+    all be replayed (too many, purged, or ``last_seq`` is not one of theirs).
+    """
+    missed = list(
+        UserEvent.objects.filter(user_id=user_id, seq__gt=last_seq).order_by('seq').values(*MESSAGE_FIELDS)[:limit + 1]
+    )
+    if missed:
+        # Numbers have no gaps, so a missing one was purged.
+        replayable = len(missed) <= limit and missed[0]['seq'] == last_seq + 1
+    else:
+        replayable = _last_event_seq(user_id) == last_seq
+    if not replayable:
+        latest = _last_event_seq(user_id)
+        return latest, [format_event(latest, RESET, {})]
+    if not missed:
+        return last_seq, []
+    return missed[-1]['seq'], [format_event(message['seq'], message['kind'], message['data']) for message in missed]
+
+
+async def stream(user_id, last_seq=None):
+    """
+    The SSE chunks of ``user_id``'s events, after ``last_seq`` if given, then
+    live, with a comment every ``HEARTBEAT`` seconds so proxies keep the
+    connection open.
+    """
+    options = _options()
+    if last_seq is None:
+        # Taken before subscribing, and caught up from below, so an event
+        # committed in between is neither lost nor sent twice.
+        last_seq = await _latest_seq(user_id)
+    subscription = broker.subscribe(user_id, options['QUEUE_SIZE'])
+    get_event_backend().start()
+    try:
+        yield ': connected\n\n'
+        last_seq, chunks = await _catch_up(user_id, last_seq, options['REPLAY_LIMIT'])
+        for chunk in chunks:
+            yield chunk
+        while True:
+            try:
+                message = await subscription.get(options['HEARTBEAT'])
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                # In case a notification was lost (e.g. a Redis reconnect).
+                message = None if await _latest_seq(user_id) > last_seq else False
+            if message is None or message and message['seq'] > last_seq + 1:
+                last_seq, chunks = await _catch_up(user_id, last_seq, options['REPLAY_LIMIT'])
+                for chunk in chunks:
+                    yield chunk
+            elif message and message['seq'] == last_seq + 1:
+                last_seq = message['seq']
+                yield format_event(message['seq'], message['kind'], message['data'])
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def purge_events(retention_seconds=None):
+    """
+    Delete events older than ``retention_seconds``; clients resuming from
+    before then get a reset event.
+    """
+    if retention_seconds is None:
+        retention_seconds = _options()['RETENTION_SECONDS']
+    deleted, _ = UserEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=retention_seconds)).delete()
+    return deleted
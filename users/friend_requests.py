@@ -0,0 +1,163 @@
+"""
+The friend request lifecycle: send, accept and reject.
+
+Each action runs in one transaction that first takes a lock on the pair of
+users (a transaction-level advisory lock on PostgreSQL, so unrelated pairs
+involving the same user never wait for each other). Under that lock the
+checks and writes of two concurrent actions on the same pair cannot
+interleave, so crossing sends, double accepts and an accept racing a reject
+all resolve to one consistent outcome. Status changes are conditional
+``UPDATE ... WHERE status = 'pending'`` statements, so a transition happens at
+most once even without the lock.
+
+Sending to someone who already has a pending request to you accepts it
+(mutual requests become a friendship). Friendships are stored once, in
+canonical order (see ``Friendship``). The counters of ``users.stats`` are
+updated in the same transaction.
+
+Each action also records a ``users.events`` event for both users.
+
+Every action returns one of the outcome constants below.
+"""
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+
+from . import events, response_cache
+from .models import FriendRequest, Friendship
+from .stats import StatsDelta
+
+SENT = 'sent'
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+ALREADY_PENDING = 'already_pending'
+ALREADY_FRIENDS = 'already_friends'
+NO_PENDING_REQUEST = 'no_pending_request'
+
+
+def lock_pair(user_a_id, user_b_id):
+    """
+    Serialize actions on the pair of users until the transaction ends.
+    """
+    lock_pairs([(user_a_id, user_b_id)])
+
+
+def lock_pairs(pairs):
+    """
+    ``lock_pair`` for every pair in ``pairs``, with one statement. Locks are
+    taken in a global order, so callers locking overlapping pairs cannot
+    deadlock.
+    """
+    keys = sorted({Friendship.canonical(user_a_id, user_b_id) for user_a_id, user_b_id in pairs})
+    if not keys:
+        return
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(low, high) FROM ('
+                'SELECT * FROM unnest(%s::integer[], %s::integer[]) AS pair (low, high) ORDER BY low, high'
+                ') AS pairs',
+                [[low for low, _ in keys], [high for _, high in keys]],
+            )
+    else:
+        # Row locks in id order; a no-op on SQLite, which serializes writers.
+        user_ids = {user_id for key in keys for user_id in key}
+        list(User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk'))
+
+
+def _befriend(delta, user_a_id, user_b_id):
+    user1_id, user2_id = Friendship.canonical(user_a_id, user_b_id)
+    _, created = Friendship.objects.get_or_create(user1_id=user1_id, user2_id=user2_id)
+    if created:
+        delta.friendship_added(user1_id, user2_id)
+
+
+def _transition(from_user_id, to_user_id, status):
+    """
+    Move the pending request ``from_user_id -> to_user_id`` to ``status``.
+    Returns whether there was one.
+    """
+    changed = FriendRequest.objects.filter(
+        from_user_id=from_user_id, to_user_id=to_user_id, status='pending',
+    ).update(status=status)
+    if changed:
+        # Queryset updates send no signals.
+        response_cache.invalidate('pending', to_user_id)
+    return bool(changed)
+
+
+def replace_rejected(from_user_id, to_user_ids):
+    """
+    Delete the rejected requests of ``from_user_id`` to ``to_user_ids`` that
+    are about to be sent again. The new request is a new row, so it has a new
+    id and date: it sorts as new in the pending list and clients polling with
+    ``since`` see it, which they would not if the old row were reopened.
+    """
+    if to_user_ids:
+        FriendRequest.objects.filter(from_user_id=from_user_id, to_user_id__in=to_user_ids, status='rejected').delete()
+
+
+@transaction.atomic
+def send_request(from_user, to_user):
+    lock_pair(from_user.pk, to_user.pk)
+    delta = StatsDelta()
+    batch = events.EventBatch()
+
+    if _transition(to_user.pk, from_user.pk, 'accepted'):
+        delta.request_answered(to_user.pk, from_user.pk)
+        _befriend(delta, from_user.pk, to_user.pk)
+        delta.apply()
+        batch.add(events.ACCEPTED, to_user, from_user)
+        batch.record()
+        return ACCEPTED
+
+    existing = FriendRequest.objects.filter(from_user=from_user, to_user=to_user).only('id', 'status').first()
+    if existing is not None and existing.status == 'pending':
+        return ALREADY_PENDING
+    user1_id, user2_id = Friendship.canonical(from_user.pk, to_user.pk)
+    if (existing is not None and existing.status == 'accepted') or Friendship.objects.filter(
+        user1_id=user1_id, user2_id=user2_id,
+    ).exists():
+        return ALREADY_FRIENDS
+
+    if existing is not None:
+        replace_rejected(from_user.pk, [to_user.pk])
+    try:
+        with transaction.atomic():
+            FriendRequest.objects.create(from_user=from_user, to_user=to_user)
+    except IntegrityError:
+        # Only reachable without a pair lock; the other send won.
+        return ALREADY_PENDING
+    delta.request_sent(from_user.pk, to_user.pk)
+    delta.apply()
+    batch.add(events.SENT, from_user, to_user)
+    batch.record()
+    return SENT
+
+
+@transaction.atomic
+def accept_request(user, from_user):
+    lock_pair(user.pk, from_user.pk)
+    if not _transition(from_user.pk, user.pk, 'accepted'):
+        return NO_PENDING_REQUEST
+    delta = StatsDelta()
+    delta.request_answered(from_user.pk, user.pk)
+    _befriend(delta, user.pk, from_user.pk)
+    delta.apply()
+    batch = events.EventBatch()
+    batch.add(events.ACCEPTED, from_user, user)
+    batch.record()
+    return ACCEPTED
+
+
+@transaction.atomic
+def reject_request(user, from_user):
+    lock_pair(user.pk, from_user.pk)
+    if not _transition(from_user.pk, user.pk, 'rejected'):
+        return NO_PENDING_REQUEST
+    delta = StatsDelta()
+    delta.request_answered(from_user.pk, user.pk)
+    delta.apply()
+    batch = events.EventBatch()
+    batch.add(events.REJECTED, from_user, user)
+    batch.record()
+    return REJECTED
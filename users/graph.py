@@ -0,0 +1,70 @@
+from django.db import transaction
+
+from . import response_cache
+from .models import FriendEdge, Friendship
+
+
+def add_friend_edges(user_a, user_b):
+    """
+    Record the friendship between ``user_a`` and ``user_b`` in both directions.
+    """
+    add_friend_edges_bulk([(user_a, user_b)])
+
+
+def add_friend_edges_bulk(pairs):
+    """
+    Record every ``(user_a, user_b)`` friendship in ``pairs`` with one insert.
+    Used where friendships are bulk-created and signals do not fire.
+    """
+    edges = []
+    for user_a, user_b in pairs:
+        edges.append(FriendEdge(user=user_a, friend=user_b, friend_date_joined=user_b.date_joined))
+        edges.append(FriendEdge(user=user_b, friend=user_a, friend_date_joined=user_a.date_joined))
+    FriendEdge.objects.bulk_create(edges, ignore_conflicts=True)
+    response_cache.invalidate('friends', *[edge.user_id for edge in edges])
+
+
+def remove_friend_edges(user_a_id, user_b_id):
+    FriendEdge.objects.filter(user_id=user_a_id, friend_id=user_b_id).delete()
+    FriendEdge.objects.filter(user_id=user_b_id, friend_id=user_a_id).delete()
+    response_cache.invalidate('friends', user_a_id, user_b_id)
+
+
+def friends_of(user):
+    """
+    Return the ``FriendEdge`` rows of ``user`` with the friend joined in,
+    loading only the columns the friends list serializes.
+    """
+    return FriendEdge.objects.filter(user=user).select_related('friend').only(
+        'friend_id', 'friend_date_joined',
+        'friend__id', 'friend__username', 'friend__email', 'friend__first_name', 'friend__last_name',
+    )
+
+
+def are_friends(user_a, user_b):
+    return FriendEdge.objects.filter(user=user_a, friend=user_b).exists()
+
+
+@transaction.atomic
+def rebuild_friend_graph(batch_size=1000):
+    """
+    Recreate every ``FriendEdge`` from the ``Friendship`` table, streaming it in
+    chunks. Returns the number of friendships processed.
+    """
+    FriendEdge.objects.all().delete()
+    batch = []
+    total = 0
+    pairs = Friendship.objects.values_list(
+        'user1_id', 'user2_id', 'user1__date_joined', 'user2__date_joined',
+    ).order_by('pk')
+    for user1_id, user2_id, user1_joined, user2_joined in pairs.iterator(chunk_size=batch_size):
+        batch.append(FriendEdge(user_id=user1_id, friend_id=user2_id, friend_date_joined=user2_joined))
+        batch.append(FriendEdge(user_id=user2_id, friend_id=user1_id, friend_date_joined=user1_joined))
+        total += 1
+        if len(batch) >= batch_size:
+            FriendEdge.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FriendEdge.objects.bulk_create(batch, ignore_conflicts=True)
+    response_cache.invalidate_all()
+    return total
@@ -0,0 +1,146 @@
+"""
+Streaming export and import of users, friendships and friend requests.
+
+The format is JSON Lines, gzip-compressed when the file name ends in ``.gz``:
+a header, then one compact array per row, tagged with its table::
+
+    {"format": "social-graph", "version": 1}
+    ["user", 1, "a@example.com", "a@example.com", "pbkdf2_sha256$...", "A", "B", true, false, false, "2024-05-01T10:00:00+00:00", null]
+    ["friendship", 1, 1, 2, "2024-05-02T10:00:00+00:00"]
+    ["friend_request", 1, 1, 2, "accepted", "2024-05-02T09:00:00+00:00"]
+
+Users come first, then friendships, then requests, each in primary key order,
+so every foreign key points at a row earlier in the file. Both directions
+hold one chunk of rows in memory at a time: the export reads through
+``iterator(chunk_size=...)`` (a server-side cursor on PostgreSQL) and the
+import writes ``bulk_create`` batches, committing and checkpointing each one.
+Derived tables (friend edges, search index, suggestions) are not exported;
+rebuild them after an import.
+"""
+import gzip
+import json
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import FriendRequest, Friendship
+
+FORMAT = 'social-graph'
+VERSION = 1
+
+TABLES = {
+    'user': (User, (
+        'id', 'username', 'email', 'password', 'first_name', 'last_name',
+        'is_active', 'is_staff', 'is_superuser', 'date_joined', 'last_login',
+    )),
+    'friendship': (Friendship, ('id', 'user1_id', 'user2_id', 'created_at')),
+    'friend_request': (FriendRequest, ('id', 'from_user_id', 'to_user_id', 'status', 'created_at')),
+}
+
+
+def open_dump(path, mode='r'):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _encode(value):
+    return value.isoformat()
+
+
+def export_graph(fp, chunk_size=2000, using=DEFAULT_DB_ALIAS):
+    """
+    Write every user, friendship and friend request to the text file ``fp``.
+    Returns the number of rows written per table.
+    """
+    fp.write(json.dumps({'format': FORMAT, 'version': VERSION}) + '\n')
+    counts = {}
+    for tag, (model, fields) in TABLES.items():
+        counts[tag] = 0
+        rows = model.objects.using(using).order_by('pk').values_list(*fields)
+        for row in rows.iterator(chunk_size=chunk_size):
+            fp.write(json.dumps([tag, *row], default=_encode, separators=(',', ':')) + '\n')
+            counts[tag] += 1
+    return counts
+
+
+@contextmanager
+def _keep_timestamps():
+    # bulk_create fills auto_now_add fields with the current time; an import
+    # must keep the exported values instead.
+    fields = [
+        field for model, _ in TABLES.values() for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def import_graph(fp, batch_size=1000, start_line=0, on_checkpoint=None, using=DEFAULT_DB_ALIAS):
+    """
+    Load a dump written by ``export_graph`` from the text file ``fp``.
+
+    Rows are inserted in batches of ``batch_size``, one transaction per batch,
+    with foreign key checks deferred to the end of the batch. After each
+    commit ``on_checkpoint(line)`` receives the number of lines of the file
+    fully imported; pass that as ``start_line`` to resume an interrupted
+    import. Rows that already exist are skipped, so replaying a batch is
+    harmless. Returns the number of rows read per table.
+    """
+    header = json.loads(fp.readline())
+    if header.get('format') != FORMAT or header.get('version') != VERSION:
+        raise ValueError(f'Not a {FORMAT} v{VERSION} dump: {header!r}')
+
+    connection = connections[using]
+    counts = {tag: 0 for tag in TABLES}
+
+    def flush(tag, rows, last_line):
+        model = TABLES[tag][0]
+        with transaction.atomic(using=using):
+            with connection.constraint_checks_disabled():
+                model.objects.using(using).bulk_create(rows, ignore_conflicts=True)
+            connection.check_constraints(table_names=[model._meta.db_table])
+        if on_checkpoint:
+            on_checkpoint(last_line)
+
+    batch, batch_tag, last_line = [], None, 1
+    with _keep_timestamps():
+        for line, text in enumerate(fp, start=2):
+            if line <= start_line:
+                continue
+            tag, *values = json.loads(text)
+            if batch and (tag != batch_tag or len(batch) >= batch_size):
+                flush(batch_tag, batch, last_line)
+                batch = []
+            model, fields = TABLES[tag]
+            row = model(**dict(zip(fields, values)))
+            if tag == 'friendship':
+                # Dumps from before friendships were stored in canonical order.
+                row.user1_id, row.user2_id = Friendship.canonical(row.user1_id, row.user2_id)
+            batch.append(row)
+            batch_tag, last_line = tag, line
+            counts[tag] += 1
+        if batch:
+            flush(batch_tag, batch, last_line)
+
+    reset_sequences(using)
+    return counts
+
+
+def reset_sequences(using=DEFAULT_DB_ALIAS):
+    """
+    Move the primary key sequences past the imported ids (PostgreSQL).
+    """
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), [model for model, _ in TABLES.values()])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hashers, get_hashers_by_algorithm
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class PBKDF2PolicyPasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 whose work factor comes from ``settings.PASSWORD_HASH_ITERATIONS``.
+
+    It keeps the stock ``pbkdf2_sha256`` algorithm name, so existing hashes stay
+    valid; a hash made with a different iteration count is reported by
+    ``must_update()`` and rehashed on the user's next login. The iteration
+    count is an instance attribute so it travels with the hasher when it is
+    sent to a ``users.hashing`` worker process.
+    """
+
+    def __init__(self):
+        self.iterations = getattr(settings, 'PASSWORD_HASH_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+@receiver(setting_changed)
+def reset_hashers(setting, **kwargs):
+    # Django caches hasher instances; drop them so the new work factor is used.
+    if setting == 'PASSWORD_HASH_ITERATIONS':
+        get_hashers.cache_clear()
+        get_hashers_by_algorithm.cache_clear()
@@ -0,0 +1,127 @@
+"""
+Password hashing off the request thread.
+
+PBKDF2 costs hundreds of milliseconds of CPU per hash. ``HashingPool`` runs
+hashes in a process pool sized to the machine and admits at most
+``WORKERS + QUEUE_SIZE`` hashes at once; beyond that ``HashingPoolSaturated``
+(503 with ``Retry-After``) is raised immediately instead of letting a login
+burst tie up every request thread of the worker.
+
+Configured by ``settings.PASSWORD_HASHING_POOL``; ``WORKERS = 0`` hashes inline.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, is_password_usable
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.crypto import get_random_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingPoolSaturated(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please retry shortly.'
+    default_code = 'hashing_pool_saturated'
+
+    def __init__(self, wait=1):
+        super().__init__()
+        self.wait = wait
+
+
+def _encode(hasher, password, salt):
+    return hasher.encode(password, salt)
+
+
+def _verify(hasher, password, encoded):
+    return hasher.verify(password, encoded)
+
+
+class HashingPool:
+    def __init__(self, workers=None, queue_size=32, timeout=10, retry_after=1):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(self.workers + queue_size) if self.workers else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Created on first use so every (forked) server process gets its own.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolSaturated(self.retry_after)
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingPoolSaturated(self.retry_after)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+@lru_cache(maxsize=None)
+def get_hashing_pool():
+    options = getattr(settings, 'PASSWORD_HASHING_POOL', {})
+    return HashingPool(
+        workers=options.get('WORKERS'),
+        queue_size=options.get('QUEUE_SIZE', 32),
+        timeout=options.get('TIMEOUT', 10),
+        retry_after=options.get('RETRY_AFTER', 1),
+    )
+
+
+@receiver(setting_changed)
+def reset_hashing_pool(setting, **kwargs):
+    if setting == 'PASSWORD_HASHING_POOL' and get_hashing_pool.cache_info().currsize:
+        get_hashing_pool().shutdown()
+        get_hashing_pool.cache_clear()
+
+
+def make_password(password):
+    """
+    ``django.contrib.auth.hashers.make_password`` computed in the pool.
+    """
+    hasher = get_hasher('default')
+    return get_hashing_pool().run(_encode, hasher, password, hasher.salt())
+
+
+def check_password(password, encoded):
+    """
+    Pool-backed counterpart of ``django.contrib.auth.hashers.verify_password``.
+    Returns ``(is_correct, must_update)``; ``must_update`` is true when the
+    hash was made with another algorithm or work factor than the current one.
+    """
+    if password is None or not is_password_usable(encoded):
+        make_password(get_random_string(40))  # Keep the timing of a real check.
+        return False, False
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        make_password(get_random_string(40))
+        return False, False
+    preferred = get_hasher('default')
+    must_update = hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+    return get_hashing_pool().run(_verify, hasher, password, encoded), must_update
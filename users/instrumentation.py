@@ -0,0 +1,283 @@
+"""
+Request-level instrumentation.
+
+``InstrumentationMiddleware`` records, per view, the wall time, the time spent
+in the database, the number of queries (and how many of them repeated an
+earlier query of the same request verbatim) and cache hits/misses. The totals
+are served in the Prometheus text format by ``metrics_view`` and each response
+carries a ``Server-Timing`` header with its own numbers. A fraction
+``PROFILE_SAMPLE_RATE`` of (sync) requests is run under cProfile and dumped to
+``PROFILE_DIR``.
+
+Queries are timed by ``instrumented_execute``, a database execute wrapper
+installed on every connection when it is opened. Outside a request it only
+costs a context variable lookup. Connection opens and, with
+``DB_POOL_MAX_SIZE``, the pool's statistics (size, waits, timeouts) are
+exported as well. The registry is per process: scrape every
+worker, or sum the series over the ``instance`` label.
+"""
+import cProfile
+import contextvars
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'db_time', 'queries', 'statements', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.statements = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.statements.values())
+
+
+def instrumented_execute(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+        # Same statement with the same parameters: a redundant round trip.
+        metrics.statements[(sql, repr(params))] += 1
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    registry.connection_opened(connection.alias)
+    if instrumented_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, instrumented_execute)
+
+
+def record_cache(hit):
+    """
+    Count a cache hit or miss against the current request, if any.
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+class ViewStats:
+    def __init__(self):
+        self.responses = Counter()
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.wall_seconds = 0.0
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.duplicate_queries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = {}
+        self.connections = Counter()
+
+    def connection_opened(self, alias):
+        with self._lock:
+            self.connections[alias] += 1
+
+    def observe(self, view, status_code, metrics, wall):
+        with self._lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.responses[status_code] += 1
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if wall <= bound:
+                    stats.buckets[i] += 1
+            stats.wall_seconds += wall
+            stats.db_seconds += metrics.db_time
+            stats.queries += metrics.queries
+            stats.duplicate_queries += metrics.duplicate_queries
+            stats.cache_hits += metrics.cache_hits
+            stats.cache_misses += metrics.cache_misses
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+            self.connections = Counter()
+
+    def render(self):
+        """
+        The collected metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            views = sorted(self.views.items())
+            lines = [
+                '# HELP users_requests_total Requests handled, by view and status code.',
+                '# TYPE users_requests_total counter',
+            ]
+            for view, stats in views:
+                for status_code, count in sorted(stats.responses.items()):
+                    lines.append(f'users_requests_total{{view="{view}",status="{status_code}"}} {count}')
+
+            lines += [
+                '# HELP users_request_duration_seconds Wall time of a request.',
+                '# TYPE users_request_duration_seconds histogram',
+            ]
+            for view, stats in views:
+                total = sum(stats.responses.values())
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    lines.append(f'users_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+                lines.append(f'users_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {total}')
+                lines.append(f'users_request_duration_seconds_sum{{view="{view}"}} {stats.wall_seconds:.6f}')
+                lines.append(f'users_request_duration_seconds_count{{view="{view}"}} {total}')
+
+            for name, attribute, help_text in (
+                ('users_db_duration_seconds_total', 'db_seconds', 'Time spent executing SQL.'),
+                ('users_db_queries_total', 'queries', 'SQL statements executed.'),
+                ('users_db_duplicate_queries_total', 'duplicate_queries', 'SQL statements repeated verbatim within a request.'),
+                ('users_cache_hits_total', 'cache_hits', 'Cache lookups that hit.'),
+                ('users_cache_misses_total', 'cache_misses', 'Cache lookups that missed.'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for view, stats in views:
+                    value = getattr(stats, attribute)
+                    lines.append(f'{name}{{view="{view}"}} {value:.6f}' if isinstance(value, float) else f'{name}{{view="{view}"}} {value}')
+
+            lines += [
+                '# HELP users_db_connections_total Database connections opened or taken from the pool.',
+                '# TYPE users_db_connections_total counter',
+            ]
+            for alias, count in sorted(self.connections.items()):
+                lines.append(f'users_db_connections_total{{alias="{alias}"}} {count}')
+
+        pools = pool_stats()
+        if pools:
+            lines += [
+                '# HELP users_db_pool Connection pool statistics (psycopg_pool), e.g. requests_wait_ms, requests_errors (timeouts).',
+                '# TYPE users_db_pool gauge',
+            ]
+            for alias, stats in pools:
+                for stat, value in sorted(stats.items()):
+                    lines.append(f'users_db_pool{{alias="{alias}",stat="{stat}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def pool_stats():
+    """
+    ``[(alias, stats)]`` for every database served by a connection pool.
+    """
+    result = []
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            result.append((alias, pool.get_stats()))
+    return result
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    return getattr(func, 'view_class', func).__name__
+
+
+def server_timing(metrics, wall):
+    return (
+        f'total;dur={wall * 1000:.1f}, '
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries, {metrics.duplicate_queries} duplicate", '
+        f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"'
+    )
+
+
+class InstrumentationMiddleware:
+    """
+    Times every request and records it in ``registry``. Keep it first in
+    ``MIDDLEWARE`` so the wall time covers the rest of the stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        profiler = None
+        if random.random() < getattr(settings, 'PROFILE_SAMPLE_RATE', 0):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _current.reset(token)
+        self.finish(request, response, metrics, profiler)
+        return response
+
+    async def __acall__(self, request):
+        # Not profiled: cProfile would mix in every coroutine on the loop.
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    def finish(self, request, response, metrics, profiler=None):
+        wall = time.perf_counter() - metrics.started
+        view = view_name(request)
+        registry.observe(view, response.status_code, metrics, wall)
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = server_timing(metrics, wall)
+        if profiler is not None:
+            directory = settings.PROFILE_DIR
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, f'{view}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.prof'))
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. When ``METRICS_TOKEN`` is set the scraper must
+    send ``Authorization: Bearer <token>``.
+    """
+    expected = getattr(settings, 'METRICS_TOKEN', None)
+    if expected and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {expected}'):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,173 @@
+"""
+Database-backed queue for work that does not have to finish before the
+response, e.g. the suggestion fan-out of a new friendship.
+
+``enqueue()`` inserts a ``Job`` row in the caller's transaction, so the job
+exists if and only if the state change that asked for it commits. A job with
+an idempotency ``key`` is enqueued at most once (until it is purged).
+
+Workers (``manage.py run_jobs``) claim due jobs in batches with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of them can share the
+table without waiting for each other. A claim is a lease of ``LEASE_SECONDS``:
+a job whose worker died becomes due again when it expires. Each job runs in
+one transaction together with the conditional update that marks it done, which
+only succeeds while the worker still holds the lease, so a task that only
+writes to the database takes effect exactly once. A failed job is retried
+after ``RETRY_DELAY`` seconds, doubling up to ``MAX_RETRY_DELAY``, and marked
+failed after ``MAX_ATTEMPTS``.
+
+Tasks are registered with ``@task('name')`` and called with the job's payload.
+
+Configured by ``settings.JOB_QUEUE``.
+"""
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+# Outcome of a job whose lease expired before it finished (it runs again).
+LOST = 'lost'
+
+_tasks = {}
+
+
+def _options():
+    return {
+        'BATCH_SIZE': 100,
+        'MAX_ATTEMPTS': 5,
+        'RETRY_DELAY': 2,
+        'MAX_RETRY_DELAY': 600,
+        'LEASE_SECONDS': 300,
+        'RETENTION_SECONDS': 86400,
+        **getattr(settings, 'JOB_QUEUE', {}),
+    }
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def task(name):
+    """
+    Register the decorated function as the task ``name``.
+    """
+    def register(func):
+        _tasks[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    enqueue_many(name, [(payload, key)], delay=delay)
+
+
+def enqueue_many(name, jobs, delay=0):
+    """
+    Enqueue one ``name`` job per ``(payload, key)`` pair in a single insert.
+    Pairs whose key is taken by a job that has not been purged are skipped.
+    """
+    run_at = timezone.now() + timedelta(seconds=delay)
+    Job.objects.bulk_create(
+        [Job(name=name, payload=payload or {}, key=key, run_at=run_at) for payload, key in jobs],
+        ignore_conflicts=True,
+    )
+
+
+def retry_delay(attempts):
+    options = _options()
+    delay = min(options['RETRY_DELAY'] * 2 ** (attempts - 1), options['MAX_RETRY_DELAY'])
+    # Jitter, so jobs that failed together are not retried together.
+    return delay * random.uniform(0.5, 1)
+
+
+def claim(batch_size=None):
+    """
+    Lease up to ``batch_size`` due jobs to the caller and return them.
+    """
+    options = _options()
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[PENDING, RUNNING], run_at__lte=now)
+            .order_by('run_at', 'id')[:batch_size or options['BATCH_SIZE']]
+        )
+        if jobs:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=RUNNING, run_at=now + timedelta(seconds=options['LEASE_SECONDS']), attempts=F('attempts') + 1,
+            )
+    for job in jobs:
+        job.status = RUNNING
+        job.attempts += 1
+    return jobs
+
+
+def _leased(job):
+    # The attempt count identifies the lease: a job reclaimed after its lease
+    # expired has a higher one.
+    return Job.objects.filter(pk=job.pk, status=RUNNING, attempts=job.attempts)
+
+
+def run_job(job):
+    """
+    Run a claimed job. Returns ``DONE``, ``PENDING`` (will be retried),
+    ``FAILED`` or ``LOST``.
+    """
+    handler = _tasks.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f'No task named {job.name!r}')
+        with transaction.atomic():
+            handler(job.payload)
+            if not _leased(job).update(status=DONE, run_at=timezone.now(), last_error=''):
+                raise LeaseLost(job.pk)
+    except LeaseLost:
+        return LOST
+    except Exception as exc:
+        error = f'{type(exc).__name__}: {exc}'
+        if handler is None or job.attempts >= _options()['MAX_ATTEMPTS']:
+            outcome, run_at = FAILED, timezone.now()
+        else:
+            outcome, run_at = PENDING, timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        if not _leased(job).update(status=outcome, run_at=run_at, last_error=error):
+            return LOST
+        return outcome
+    return DONE
+
+
+def run_pending(batch_size=None, limit=None):
+    """
+    Run due jobs until there are none left (or ``limit`` have run). Returns
+    the number of jobs per outcome.
+    """
+    outcomes = Counter()
+    batch_size = batch_size or _options()['BATCH_SIZE']
+    while limit is None or outcomes.total() < limit:
+        jobs = claim(batch_size if limit is None else min(batch_size, limit - outcomes.total()))
+        if not jobs:
+            break
+        for job in jobs:
+            outcomes[run_job(job)] += 1
+    return outcomes
+
+
+def purge_finished(retention_seconds=None):
+    """
+    Delete jobs that finished more than ``retention_seconds`` ago, which also
+    frees their idempotency keys. Failed jobs are kept for inspection.
+    """
+    if retention_seconds is None:
+        retention_seconds = _options()['RETENTION_SECONDS']
+    cutoff = timezone.now() - timedelta(seconds=retention_seconds)
+    deleted, _ = Job.objects.filter(status=DONE, run_at__lt=cutoff).delete()
+    return deleted
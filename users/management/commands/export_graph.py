@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from users.graph_io import export_graph, open_dump
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream users, friendships and friend requests to a JSON Lines file '
+        '(gzip-compressed if the name ends in .gz). The file contains password hashes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='File to write, e.g. graph.jsonl.gz')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round trip.')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        with open_dump(options['output'], 'w') as fp:
+            counts = export_graph(fp, chunk_size=options['chunk_size'], using=options['database'])
+        summary = ', '.join(f'{count} {tag} rows' for tag, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Exported {summary} to {options["output"]}'))
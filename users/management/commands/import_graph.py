@@ -0,0 +1,58 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.graph import rebuild_friend_graph
+from users.graph_io import import_graph, open_dump
+from users.search import rebuild_search_index
+from users.stats import reconcile_stats
+from users.suggestions import recompute_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a file written by export_graph in committed batches. Progress is '
+        'checkpointed next to the input so an interrupted import can be resumed '
+        'with --resume. The friend graph, search index and suggestions are rebuilt afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='File written by export_graph.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows inserted per transaction.')
+        parser.add_argument('--resume', action='store_true', help='Continue after the last checkpoint.')
+        parser.add_argument('--skip-derived', action='store_true', help='Do not rebuild the derived tables.')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        checkpoint_path = options['input'] + '.checkpoint'
+        start_line = 0
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as fp:
+                start_line = json.load(fp)['line']
+            self.stdout.write(f'Resuming after line {start_line}')
+
+        def checkpoint(line):
+            with open(checkpoint_path + '.tmp', 'w') as fp:
+                json.dump({'line': line}, fp)
+            os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+        try:
+            with open_dump(options['input']) as fp:
+                counts = import_graph(
+                    fp, batch_size=options['batch_size'], start_line=start_line,
+                    on_checkpoint=checkpoint, using=options['database'],
+                )
+        except ValueError as exc:
+            raise CommandError(exc)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        summary = ', '.join(f'{count} {tag} rows' for tag, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Imported {summary}'))
+        if not options['skip_derived']:
+            rebuild_friend_graph()
+            rebuild_search_index()
+            recompute_suggestions()
+            reconcile_stats()
+            self.stdout.write(self.style.SUCCESS('Rebuilt friend edges, search index, suggestions and user stats'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.graph import rebuild_friend_graph
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the FriendEdge adjacency list from the Friendship table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = rebuild_friend_graph(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt edges for {total} friendships'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from users.suggestions import TOP_K, recompute_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Recompute every user\'s "people you may know" suggestions from the friend graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users processed per chunk.')
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Suggestions kept per user.')
+
+    def handle(self, *args, **options):
+        total = recompute_suggestions(chunk_size=options['chunk_size'], top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed suggestions for {total} users'))
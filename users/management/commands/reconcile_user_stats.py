@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.stats import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the friend and pending request counts of every user and repair the ones that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users recomputed per transaction.')
+
+    def handle(self, *args, **options):
+        checked, repaired = reconcile_stats(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} users, repaired {repaired}'))
@@ -0,0 +1,46 @@
+import signal
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users import events, jobs
+
+# Seconds between purges of finished jobs and expired events (users.events).
+PURGE_INTERVAL = 600
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (users.jobs). Start as many workers as needed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Jobs claimed at once (default: JOB_QUEUE["BATCH_SIZE"]).')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when no job is due.')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due, then exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.report(jobs.run_pending(batch_size=options['batch_size']))
+            return
+
+        stopping = []
+        # Finish the current batch on SIGTERM (e.g. a deploy) instead of
+        # abandoning leased jobs until their lease expires.
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        next_purge = 0
+        while not stopping:
+            close_old_connections()
+            if time.monotonic() >= next_purge:
+                jobs.purge_finished()
+                events.purge_events()
+                next_purge = time.monotonic() + PURGE_INTERVAL
+            batch = jobs.claim(options['batch_size'])
+            if batch:
+                self.report(Counter(jobs.run_job(job) for job in batch))
+            else:
+                time.sleep(options['poll_interval'])
+
+    def report(self, outcomes):
+        labels = {jobs.DONE: 'done', jobs.PENDING: 'to retry', jobs.FAILED: 'failed', jobs.LOST: 'lease lost'}
+        self.stdout.write(', '.join(f'{count} {labels[outcome]}' for outcome, count in outcomes.items()) or 'No jobs due')
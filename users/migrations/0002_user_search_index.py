@@ -0,0 +1,79 @@
+# Generated by Django 5.1 on 2026-10-18 17:01
+
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+TRIGRAM_INDEXES = {
+    'users_usersearchindex_first_name_trgm': 'first_name',
+    'users_usersearchindex_last_name_trgm': 'last_name',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Substring (LIKE '%x%') matches can only use an index on PostgreSQL with
+    # pg_trgm; other backends fall back to the plain b-tree indexes.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON users_usersearchindex USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def normalize_search_text(value):
+    # A copy of users.search.normalize_search_text as of this migration, so
+    # later changes to that module cannot change or break it.
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', value.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).strip()
+
+
+def backfill_search_index(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    UserSearchIndex = apps.get_model('users', 'UserSearchIndex')
+    batch = []
+    for pk, first_name, last_name in User.objects.values_list('pk', 'first_name', 'last_name').iterator(chunk_size=1000):
+        batch.append(UserSearchIndex(
+            user_id=pk,
+            first_name=normalize_search_text(first_name),
+            last_name=normalize_search_text(last_name),
+        ))
+        if len(batch) >= 1000:
+            UserSearchIndex.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        UserSearchIndex.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('first_name', models.CharField(db_index=True, max_length=150)),
+                ('last_name', models.CharField(db_index=True, max_length=150)),
+            ],
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-18 17:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_friend_edges(apps, schema_editor):
+    Friendship = apps.get_model('users', 'Friendship')
+    FriendEdge = apps.get_model('users', 'FriendEdge')
+    pairs = Friendship.objects.values_list('user1_id', 'user2_id', 'user1__date_joined', 'user2__date_joined')
+    batch = []
+    for user1_id, user2_id, user1_joined, user2_joined in pairs.iterator(chunk_size=1000):
+        batch.append(FriendEdge(user_id=user1_id, friend_id=user2_id, friend_date_joined=user2_joined))
+        batch.append(FriendEdge(user_id=user2_id, friend_id=user1_id, friend_date_joined=user1_joined))
+        if len(batch) >= 1000:
+            FriendEdge.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FriendEdge.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendEdge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('friend_date_joined', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_edges', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-friend_date_joined', '-friend'], name='users_friendedge_listing')],
+                'unique_together': {('user', 'friend')},
+            },
+        ),
+        migrations.RunPython(backfill_friend_edges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 17:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_rate_limit_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['to_user', '-created_at'], name='users_fr_pending_received'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['to_user', 'from_user'], name='users_fr_to_from'),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['user2', 'user1'], name='users_friendship_user2_user1'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_friend_request_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='friendrequest',
+            name='users_fr_pending_received',
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['to_user', '-created_at', '-id'], name='users_fr_pending_received_key'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0007_friend_suggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('friend_count', models.IntegerField(default=0)),
+                ('pending_received', models.IntegerField(default=0)),
+                ('pending_sent', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
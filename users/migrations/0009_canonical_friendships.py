@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-18 17:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def canonicalize_friendships(apps, schema_editor):
+    # Store every friendship as (lower id, higher id); a pair stored in both
+    # directions keeps its older row.
+    Friendship = apps.get_model('users', 'Friendship')
+    reversed_rows = Friendship.objects.filter(user1_id__gt=models.F('user2_id')).order_by('pk')
+    for friendship in reversed_rows.iterator(chunk_size=1000):
+        canonical = Friendship.objects.filter(user1_id=friendship.user2_id, user2_id=friendship.user1_id)
+        if canonical.filter(pk__lt=friendship.pk).exists():
+            friendship.delete()
+            continue
+        canonical.delete()
+        Friendship.objects.filter(pk=friendship.pk).update(user1_id=friendship.user2_id, user2_id=friendship.user1_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_user_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_friendships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.CheckConstraint(condition=models.Q(('user1__lt', models.F('user2'))), name='users_friendship_canonical'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1 on 2026-10-18 18:05
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+# As in users.emails when this migration was written; spelled out so later
+# changes to that module cannot change this migration.
+EMAIL_KEY_INDEX = 'users_auth_user_email_key'
+EMAIL_KEY_SQL = "NULLIF(LOWER(email), '')"
+
+
+def create_email_key_index(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.exclude(email='').annotate(email_key=Lower('email'))
+        .values('email_key').annotate(users=Count('pk')).filter(users__gt=1).values_list('email_key', flat=True)[:10]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Several users share an email address (ignoring case), e.g. %s. '
+            'Change or remove the duplicates before migrating.' % ', '.join(duplicates)
+        )
+    schema_editor.execute(f'CREATE UNIQUE INDEX {EMAIL_KEY_INDEX} ON auth_user (({EMAIL_KEY_SQL}))')
+
+
+def drop_email_key_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {EMAIL_KEY_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0009_canonical_friendships'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_key_index, drop_email_key_index),
+    ]
@@ -17,16 +17,181 @@ class FriendRequest(models.Model):
 
     class Meta:
         unique_together = ('from_user', 'to_user')
+        indexes = [
+            # Pending requests received by a user in (created_at, id) keyset
+            # order, newest first (the pending list).
+            models.Index(
+                fields=['to_user', '-created_at', '-id'],
+                condition=models.Q(status='pending'),
+                name='users_fr_pending_received_key',
+            ),
+            # The unique (from_user, to_user) index serves lookups in one
+            # direction; this one serves "requests sent to me by any of ...".
+            models.Index(fields=['to_user', 'from_user'], name='users_fr_to_from'),
+        ]
 
 class Friendship(models.Model):
+    """
+    One friendship, stored once in canonical order (``user1_id < user2_id``)
+    so the unique constraint also covers the reverse direction.
+    """
     user1 = models.ForeignKey(User, related_name='friendships1', on_delete=models.CASCADE)
     user2 = models.ForeignKey(User, related_name='friendships2', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('user1', 'user2')
+        indexes = [
+            models.Index(fields=['user2', 'user1'], name='users_friendship_user2_user1'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(user1__lt=models.F('user2')), name='users_friendship_canonical'),
+        ]
+
+    @staticmethod
+    def canonical(user_a_id, user_b_id):
+        """
+        ``(user1_id, user2_id)`` of the friendship between the two users.
+        """
+        return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
 
     def save(self, *args, **kwargs):
-        if self.user1 == self.user2:
+        if self.user1_id == self.user2_id:
             raise ValidationError("A user cannot be friends with themselves.")
+        if self.user1_id > self.user2_id:
+            self.user1, self.user2 = self.user2, self.user1
         super(Friendship, self).save(*args, **kwargs)
+
+
+class UserSearchIndex(models.Model):
+    """
+    Normalized copy of the searchable name columns of a user.
+
+    The names are stored casefolded and accent-stripped so lookups never need
+    ``UPPER()``/``LOWER()`` around the column, which lets PostgreSQL serve them
+    from a trigram GIN index (substring matches) and the pattern-ops b-tree it
+    builds for indexed CharFields (prefix matches). The rows are kept in sync
+    by ``users.signals``.
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name='search_index', on_delete=models.CASCADE)
+    first_name = models.CharField(max_length=150, db_index=True)
+    last_name = models.CharField(max_length=150, db_index=True)
+
+    def __str__(self):
+        return f"{self.first_name} {self.last_name}"
+
+
+class FriendEdge(models.Model):
+    """
+    Materialized adjacency list of the friendship graph.
+
+    Every ``Friendship`` is stored here twice, once from each side, so "friends
+    of X" is a single range scan of the ``(user, friend_date_joined, friend)``
+    index in the order the friends list is displayed. ``friend_date_joined`` is
+    copied from the friend so keyset pagination never has to sort by a column
+    of another table. Rows are maintained by ``users.signals``.
+    """
+    user = models.ForeignKey(User, related_name='friend_edges', on_delete=models.CASCADE)
+    friend = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    friend_date_joined = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'friend')
+        indexes = [
+            models.Index(fields=['user', '-friend_date_joined', '-friend'], name='users_friendedge_listing'),
+        ]
+
+
+class RateLimitCounter(models.Model):
+    """
+    Hit count of one rate-limit key in one fixed window, used by
+    ``users.ratelimit.DatabaseBackend``.
+    """
+    key = models.CharField(max_length=200)
+    window_start = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('key', 'window_start')
+
+
+class FriendSuggestion(models.Model):
+    """
+    One entry of a user's bounded "people you may know" list: a second-degree
+    ``candidate`` and the number of friends they have in common.
+    Maintained by ``users.suggestions``.
+    """
+    user = models.ForeignKey(User, related_name='friend_suggestions', on_delete=models.CASCADE)
+    candidate = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    mutual_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        indexes = [
+            models.Index(fields=['user', '-mutual_count', 'candidate'], name='users_suggestion_top'),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    Denormalized counts shown as badges: friends, and pending friend requests
+    received and sent. Maintained by ``users.stats`` in the same transaction
+    as the changes they count; ``reconcile_user_stats`` repairs drift.
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    # Signed, so a decrement racing a repair can never fail a write.
+    friend_count = models.IntegerField(default=0)
+    pending_received = models.IntegerField(default=0)
+    pending_sent = models.IntegerField(default=0)
+    # The ``seq`` of the user's latest ``UserEvent``.
+    last_event_seq = models.BigIntegerField(default=0)
+
+
+class Job(models.Model):
+    """
+    One unit of deferred work in the ``users.jobs`` queue. ``run_at`` is when a
+    pending job becomes due, or when a running job's lease expires; ``key``
+    makes enqueueing idempotent.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    key = models.CharField(max_length=200, unique=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    run_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Jobs a worker can claim, oldest due first.
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status__in=['pending', 'running']), name='users_job_ready'),
+            # Finished jobs, for purging.
+            models.Index(fields=['run_at'], condition=models.Q(status='done'), name='users_job_done'),
+        ]
+
+
+class UserEvent(models.Model):
+    """
+    One event pushed to ``user`` over the event stream (``users.events``).
+    ``seq`` numbers the user's events 1, 2, 3... in commit order; it is the
+    event id clients resume from.
+    """
+    user = models.ForeignKey(User, related_name='events', on_delete=models.CASCADE)
+    seq = models.BigIntegerField()
+    kind = models.CharField(max_length=50)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'seq'], name='users_userevent_seq'),
+        ]
@@ -1,6 +1,272 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
 
-class UserSearchPagination(PageNumberPagination):
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite, unique ordering key.
+
+    DRF's CursorPagination positions on the first ordering field only and skips
+    ties with an OFFSET. Here every page is located with a comparison over all
+    of the ``ordering`` fields, so page N costs the same as page 1. The last
+    ordering field must make the key unique (typically the primary key).
+
+    Rows may be model instances or ``.values()`` dicts; the ordering fields are
+    read from them by name.
+
+    With ``include_count`` the envelope carries the number of results. It is
+    computed once, for the first page, and carried in the cursors of the
+    following ones (so it is not updated while paging). It costs no query when
+    the first page holds every result. Otherwise it is a ``COUNT(*)`` capped
+    at ``count_limit`` rows, if set: the count then stops at ``count_limit``
+    and ``count_exact`` is false ("1000+" results), so a broad query costs
+    the same as a narrow one.
+    """
+    ordering = ('-id',)
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    include_count = False
+    count_limit = None
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.prepare(request)
+        rows = self.finish(list(self.page_queryset(queryset)))
+        if self.include_count:
+            self.bounded_count = self.known_count()
+            if self.bounded_count is None:
+                self.bounded_count = self.get_count(queryset)
+        return rows
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async counterpart of ``paginate_queryset`` for the ASGI views, which
+        pass a plain Django ``HttpRequest``.
+        """
+        self.prepare(request)
+        rows = self.finish([row async for row in self.page_queryset(queryset)])
+        if self.include_count:
+            self.bounded_count = self.known_count()
+            if self.bounded_count is None:
+                self.bounded_count = await self.aget_count(queryset)
+        return rows
+
+    @property
+    def ordering_fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def prepare(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.query_params = getattr(request, 'query_params', request.GET)
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse, self.cursor_count = self.decode_cursor(request)
+
+    def page_queryset(self, queryset):
+        if self.position is not None:
+            position = self.position_values(queryset, self.position)
+            queryset = queryset.filter(self.position_filter(position, self.reverse))
+        ordering = [self._flip(field) for field in self.ordering] if self.reverse else list(self.ordering)
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def finish(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        self.page = rows
+        return rows
+
+    def known_count(self):
+        """
+        The count, when it needs no query: carried by the cursor, or the
+        first page is the only one.
+        """
+        if self.cursor_count is not None:
+            return self.cursor_count
+        if self.position is None and not self.has_next:
+            return len(self.page)
+        return None
+
+    def get_count(self, queryset):
+        """
+        The number of rows, or ``count_limit + 1`` if there are more than
+        ``count_limit``.
+        """
+        if self.count_limit is None:
+            return queryset.count()
+        return queryset.order_by()[:self.count_limit + 1].count()
+
+    async def aget_count(self, queryset):
+        if self.count_limit is None:
+            return await queryset.acount()
+        return await queryset.order_by()[:self.count_limit + 1].acount()
+
+    @property
+    def count(self):
+        if self.count_limit is None:
+            return self.bounded_count
+        return min(self.bounded_count, self.count_limit)
+
+    @property
+    def count_exact(self):
+        return self.count_limit is None or self.bounded_count <= self.count_limit
+
+    def get_page_size(self, request):
+        try:
+            size = int(self.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        payload = {}
+        if self.include_count:
+            payload['count'] = self.count
+            if self.count_limit is not None:
+                payload['count_exact'] = self.count_exact
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return payload
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1], False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[0], True))
+
+    def position_values(self, queryset, position):
+        """
+        The cursor's values converted by the ordering fields (model fields or
+        annotations of ``queryset``), so a tampered cursor is a 404 rather
+        than a database error.
+        """
+        values = []
+        for name, value in zip(self.ordering_fields, position):
+            annotation = queryset.query.annotations.get(name)
+            field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+            if field.is_relation:
+                field = field.target_field
+            try:
+                value = field.to_python(value)
+                field.run_validators(value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def position_filter(self, position, reverse):
+        """
+        Build ``(f1, f2, ...) > (v1, v2, ...)`` in the direction of the ordering
+        as ``f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...``.
+        """
+        condition = Q()
+        equal_prefix = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal_prefix & Q(**{f'{name}__{lookup}': value})
+            equal_prefix &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, row, reverse):
+        position = [self._cursor_value(self._row_value(row, field.lstrip('-'))) for field in self.ordering]
+        cursor = {'p': position, 'r': int(reverse)}
+        if self.include_count:
+            cursor['c'] = self.bounded_count
+        raw = json.dumps(cursor, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = self.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False, None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            position = cursor['p']
+            reverse = bool(cursor.get('r'))
+            count = cursor.get('c')
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        if count is not None and (type(count) is not int or count < 0):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse, count
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _row_value(row, name):
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    @staticmethod
+    def _cursor_value(value):
+        # Datetimes keep their full microsecond precision, otherwise rows that
+        # share a millisecond could be skipped or repeated between pages.
+        return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class UserSearchPagination(KeysetPagination):
+    """
+    Keyset pagination for user search: best matches first, then newest users.
+    Keeps the ``count``/``next``/``previous``/``results`` envelope of the old
+    page-number pagination, with the count capped at ``count_limit``.
+    """
+    ordering = ('search_rank', '-date_joined', '-id')
     page_size = 10  # Number of records per page
     page_size_query_param = 'page_size'
-    max_page_size = 100  # Maximum page size limit
\ No newline at end of file
+    max_page_size = 100  # Maximum page size limit
+    include_count = True
+    count_limit = 1000
+
+
+class FriendsPagination(KeysetPagination):
+    """
+    Keyset pagination over ``FriendEdge`` rows, newest friends (by join date) first.
+    """
+    ordering = ('-friend_date_joined', '-friend_id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class PendingRequestsPagination(KeysetPagination):
+    """
+    Keyset pagination over pending friend requests, newest first.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
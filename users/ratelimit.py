@@ -0,0 +1,199 @@
+"""
+Atomic sliding-window rate limiting with pluggable storage.
+
+``get_rate_limiter()`` returns the backend named by ``settings.RATE_LIMIT_BACKEND``
+(constructed with ``settings.RATE_LIMIT_BACKEND_OPTIONS``). Every backend
+implements ``hit(key, limit, window, cost=1)``, which checks the budget and
+consumes it in one atomic step, so concurrent requests cannot race past the
+limit and every worker process shares the same counters (except with the
+in-process backend, which is meant for tests and single-process servers).
+"""
+import bisect
+import threading
+import time
+import uuid
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'remaining', 'retry_after'])
+
+
+class BaseRateLimitBackend:
+    def hit(self, key, limit, window, cost=1):
+        """
+        Consume ``cost`` units of the ``limit`` allowed per ``window`` seconds
+        for ``key``. Nothing is consumed when the request is refused; the
+        result's ``retry_after`` is then the number of seconds until it would fit.
+        """
+        raise NotImplementedError
+
+    def reset(self, key):
+        raise NotImplementedError
+
+
+class LocMemBackend(BaseRateLimitBackend):
+    """
+    Exact sliding log kept in process memory. Not shared between processes.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, cost=1):
+        now = self.clock()
+        with self._lock:
+            hits = self._hits.setdefault(key, [])
+            del hits[:bisect.bisect_right(hits, now - window)]
+            used = len(hits)
+            if used + cost > limit:
+                overflow = used + cost - limit
+                retry_after = hits[overflow - 1] + window - now if overflow <= used else window
+                return RateLimitResult(False, max(limit - used, 0), retry_after)
+            hits.extend([now] * cost)
+            return RateLimitResult(True, limit - used - cost, 0)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class DatabaseBackend(BaseRateLimitBackend):
+    """
+    Sliding-window counter stored in ``RateLimitCounter`` rows.
+
+    Hits are counted in fixed windows; the previous window's count is weighted
+    by how much of it still overlaps the sliding window. The current window's
+    row is locked with ``SELECT ... FOR UPDATE`` while the budget is checked
+    and consumed.
+    """
+
+    def __init__(self, clock=time.time, using=None):
+        self.clock = clock
+        self.using = using
+
+    def hit(self, key, limit, window, cost=1):
+        from .models import RateLimitCounter
+
+        now = self.clock()
+        window_start = int(now // window) * window
+        previous_start = window_start - window
+        elapsed = now - window_start
+        counters = RateLimitCounter.objects.using(self.using)
+
+        with transaction.atomic(using=self.using):
+            counter = counters.select_for_update().filter(key=key, window_start=window_start).first()
+            if counter is None:
+                try:
+                    with transaction.atomic(using=self.using):
+                        counters.create(key=key, window_start=window_start, count=0)
+                except IntegrityError:
+                    pass  # Another request opened the window first.
+                counters.filter(key=key, window_start__lt=previous_start).delete()
+                counter = counters.select_for_update().get(key=key, window_start=window_start)
+
+            previous = counters.filter(key=key, window_start=previous_start).values_list('count', flat=True).first() or 0
+            weight = (window - elapsed) / window
+            used = previous * weight + counter.count
+            if used + cost > limit:
+                return RateLimitResult(False, max(int(limit - used), 0), self._retry_after(limit, window, elapsed, previous, counter.count, cost))
+
+            counters.filter(pk=counter.pk).update(count=F('count') + cost)
+            return RateLimitResult(True, max(int(limit - used - cost), 0), 0)
+
+    @staticmethod
+    def _retry_after(limit, window, elapsed, previous, current, cost):
+        if current + cost > limit or not previous:
+            # Only the next window can make room.
+            return window - elapsed
+        # Wait until the previous window's weight has decayed enough.
+        needed_weight = (limit - current - cost) / previous
+        return max(window * (1 - needed_weight) - elapsed, 0)
+
+    def reset(self, key):
+        from .models import RateLimitCounter
+
+        RateLimitCounter.objects.using(self.using).filter(key=key).delete()
+
+
+class RedisBackend(BaseRateLimitBackend):
+    """
+    Exact sliding log in a Redis (or Redis-protocol compatible) sorted set,
+    checked and updated by a single Lua script. Requires the ``redis`` package.
+    """
+    SCRIPT = """
+    local key = KEYS[1]
+    local now = tonumber(ARGV[1])
+    local window = tonumber(ARGV[2])
+    local limit = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local used = redis.call('ZCARD', key)
+    if used + cost > limit then
+        local overflow = used + cost - limit
+        if overflow > used then
+            return {0, limit - used, window}
+        end
+        local oldest = redis.call('ZRANGE', key, overflow - 1, overflow - 1, 'WITHSCORES')
+        return {0, limit - used, tonumber(oldest[2]) + window - now}
+    end
+    for i = 1, cost do
+        redis.call('ZADD', key, now, ARGV[5] .. ':' .. i)
+    end
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - used - cost, 0}
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='ratelimit:', client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as exc:
+                raise ImproperlyConfigured('RedisBackend requires the "redis" package.') from exc
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def hit(self, key, limit, window, cost=1):
+        now_ms = int(time.time() * 1000)
+        allowed, remaining, retry_after_ms = self._script(
+            keys=[self.prefix + key],
+            args=[now_ms, int(window * 1000), limit, cost, uuid.uuid4().hex],
+        )
+        return RateLimitResult(bool(allowed), max(int(remaining), 0), int(retry_after_ms) / 1000)
+
+    def reset(self, key):
+        self.client.delete(self.prefix + key)
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter():
+    backend = getattr(settings, 'RATE_LIMIT_BACKEND', 'users.ratelimit.DatabaseBackend')
+    options = getattr(settings, 'RATE_LIMIT_BACKEND_OPTIONS', {})
+    return import_string(backend)(**options)
+
+
+@receiver(setting_changed)
+def reset_rate_limiter(setting, **kwargs):
+    if setting in ('RATE_LIMIT_BACKEND', 'RATE_LIMIT_BACKEND_OPTIONS'):
+        get_rate_limiter.cache_clear()
+
+
+def parse_rate(rate):
+    """
+    Parse a DRF-style rate such as ``'3/min'`` into ``(limit, window_seconds)``.
+    """
+    if rate is None:
+        return None, None
+    num, period = rate.split('/')
+    return int(num), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
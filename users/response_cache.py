@@ -0,0 +1,222 @@
+"""
+Shared cache of read-endpoint responses.
+
+Entries are keyed by scope ('friends', 'pending', 'search'), owner (the user
+whose data the response shows, or ``None`` for data shared by everyone), a
+version and a digest of the request URL. Nothing is ever deleted: writers bump
+the owner's version through ``invalidate()`` (called from ``users.signals``
+and from the code paths that write in bulk) and the old entries simply stop
+being read and expire. Versions start at a timestamp, so a version key that is
+evicted can never come back with an old value. ``invalidate_all()`` bumps a
+generation shared by every key, for bulk rebuilds.
+
+A miss is computed by one request at a time per key (single flight): the
+others wait up to ``LOCK_WAIT`` seconds for its result instead of all hitting
+the database at once. A hit costs two cache reads and no ORM access.
+
+Configured by ``settings.RESPONSE_CACHE``.
+"""
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .instrumentation import record_cache
+
+GENERATION_KEY = 'resp:generation'
+POLL_INTERVAL = 0.02
+
+
+def _options():
+    return {
+        'TIMEOUT': 300,
+        'SEARCH_TIMEOUT': 60,
+        'SEARCH_MIN_HITS': 2,
+        'SEARCH_INVALIDATE_INTERVAL': 10,
+        'LOCK_TIMEOUT': 10,
+        'LOCK_WAIT': 2,
+        **getattr(settings, 'RESPONSE_CACHE', {}),
+    }
+
+
+def version_key(scope, owner):
+    return f'resp:version:{scope}:{owner}'
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate(scope, *owners):
+    """
+    Drop the cached ``scope`` responses of every owner (user id, or ``None``).
+
+    The bump is repeated when the surrounding transaction commits, so a
+    response computed from the pre-commit data in between is not served.
+    """
+    keys = [version_key(scope, owner) for owner in set(owners)]
+    if not keys:
+        return
+    for key in keys:
+        _bump(key)
+
+    def bump_again():
+        for key in keys:
+            _bump(key)
+    transaction.on_commit(bump_again)
+
+
+def invalidate_all():
+    _bump(GENERATION_KEY)
+
+
+def _init_version(key):
+    version = time.time_ns()
+    if not cache.add(key, version, None):
+        version = cache.get(key, version)
+    return version
+
+
+async def _ainit_version(key):
+    version = time.time_ns()
+    if not await cache.aadd(key, version, None):
+        version = await cache.aget(key, version)
+    return version
+
+
+def _entry_key(request, scope, owner, generation, version):
+    digest = hashlib.sha256(f'{request.get_host()}{request.get_full_path()}'.encode()).hexdigest()
+    return f'resp:{scope}:{owner}:{generation or 0}.{version}:{digest}'
+
+
+def _is_popular(entry_key, timeout, min_hits):
+    if min_hits <= 1:
+        return True
+    hits_key = entry_key + ':hits'
+    cache.add(hits_key, 0, timeout)
+    try:
+        return cache.incr(hits_key) >= min_hits
+    except ValueError:
+        return False
+
+
+async def _ais_popular(entry_key, timeout, min_hits):
+    if min_hits <= 1:
+        return True
+    hits_key = entry_key + ':hits'
+    await cache.aadd(hits_key, 0, timeout)
+    try:
+        return await cache.aincr(hits_key) >= min_hits
+    except ValueError:
+        return False
+
+
+def cached(request, scope, owner, build, timeout=None, min_hits=1):
+    """
+    Return ``(data, status_code, hit)`` for the request, calling ``build()``
+    (which returns ``(data, status_code)``) on a miss. Only 200 responses are
+    stored. With ``min_hits`` the response is only stored once its URL has
+    been requested that many times within ``timeout``.
+    """
+    options = _options()
+    timeout = options['TIMEOUT'] if timeout is None else timeout
+    versions = cache.get_many([GENERATION_KEY, version_key(scope, owner)])
+    version = versions.get(version_key(scope, owner)) or _init_version(version_key(scope, owner))
+    key = _entry_key(request, scope, owner, versions.get(GENERATION_KEY), version)
+
+    entry = cache.get(key)
+    if entry is not None:
+        record_cache(hit=True)
+        return entry[0], entry[1], True
+    record_cache(hit=False)
+
+    if not _is_popular(key, timeout, min_hits):
+        return (*build(), False)
+
+    lock_key = key + ':lock'
+    if not cache.add(lock_key, 1, options['LOCK_TIMEOUT']):
+        deadline = time.monotonic() + options['LOCK_WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0], entry[1], True
+        # The request holding the lock is slow or died; don't wait longer.
+        return (*build(), False)
+    try:
+        data, status_code = build()
+        if status_code == 200:
+            cache.set(key, (data, status_code), timeout)
+    finally:
+        cache.delete(lock_key)
+    return data, status_code, False
+
+
+async def acached(request, scope, owner, build, timeout=None, min_hits=1):
+    """
+    Async counterpart of ``cached``; ``build`` is a coroutine function.
+    """
+    options = _options()
+    timeout = options['TIMEOUT'] if timeout is None else timeout
+    versions = await cache.aget_many([GENERATION_KEY, version_key(scope, owner)])
+    version = versions.get(version_key(scope, owner)) or await _ainit_version(version_key(scope, owner))
+    key = _entry_key(request, scope, owner, versions.get(GENERATION_KEY), version)
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        record_cache(hit=True)
+        return entry[0], entry[1], True
+    record_cache(hit=False)
+
+    if not await _ais_popular(key, timeout, min_hits):
+        return (*await build(), False)
+
+    lock_key = key + ':lock'
+    if not await cache.aadd(lock_key, 1, options['LOCK_TIMEOUT']):
+        deadline = time.monotonic() + options['LOCK_WAIT']
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            entry = await cache.aget(key)
+            if entry is not None:
+                return entry[0], entry[1], True
+        return (*await build(), False)
+    try:
+        data, status_code = await build()
+        if status_code == 200:
+            await cache.aset(key, (data, status_code), timeout)
+    finally:
+        await cache.adelete(lock_key)
+    return data, status_code, False
+
+
+def cached_search(request, build):
+    """
+    ``cached`` for user search results, which are the same for every user:
+    only queries asked ``SEARCH_MIN_HITS`` times are stored, for ``SEARCH_TIMEOUT``.
+    """
+    options = _options()
+    return cached(request, 'search', None, build, options['SEARCH_TIMEOUT'], options['SEARCH_MIN_HITS'])
+
+
+async def acached_search(request, build):
+    options = _options()
+    return await acached(request, 'search', None, build, options['SEARCH_TIMEOUT'], options['SEARCH_MIN_HITS'])
+
+
+def invalidate_search(throttled=False):
+    """
+    Drop the cached search results. ``throttled`` does it at most once per
+    ``SEARCH_INVALIDATE_INTERVAL`` seconds, for frequent writes that rarely
+    change a result (signups): a user saved in between shows up at the next
+    bump or when the entries expire, within ``SEARCH_TIMEOUT``.
+    """
+    interval = _options()['SEARCH_INVALIDATE_INTERVAL']
+    if throttled and interval > 0 and not cache.add(version_key('search', None) + ':throttle', 1, interval):
+        return
+    invalidate('search', None)
@@ -0,0 +1,195 @@
+"""
+Primary/replica database routing.
+
+``ReplicaRoutingMiddleware`` marks GET/HEAD/OPTIONS requests as read-only;
+while such a request runs, ``PrimaryReplicaRouter`` sends its reads to one of
+``settings.DATABASE_REPLICAS``. Everything else (writes, reads inside a
+request that writes, management commands, tokens and rate-limit counters)
+goes to ``default``, the primary.
+
+Read-your-writes: after a successful write request the user is pinned to the
+primary for ``DATABASE_REPLICA_PIN_SECONDS`` (in the shared cache, so every
+worker sees it), long enough for the replicas to catch up with e.g. an
+accepted friend request.
+
+Failover: a replica that cannot be connected to, or fails a query, is skipped
+for ``DATABASE_REPLICA_RETRY_SECONDS``; with no replica left reads go to the
+primary. A read-only (sync) request whose replica fails mid-way is run again
+on the primary.
+"""
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Read from the primary even in read-only requests: authentication must see
+# new tokens at once, rate-limit counters are written on every request and an
+# event stream must replay events that were just committed.
+PRIMARY_ONLY_MODELS = {'authtoken.token', 'users.ratelimitcounter', 'users.userevent'}
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('read_only', 'user_id', 'pinned', 'replica')
+
+    def __init__(self, read_only):
+        self.read_only = read_only
+        self.user_id = None
+        self.pinned = None
+        self.replica = None
+
+
+def pin_key(user_id):
+    return f'dbpin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), 1, getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5))
+
+
+def user_authenticated(user_id):
+    """
+    Tell the router who the current request acts for, so a pinned user's
+    reads stay on the primary. Called by ``CachedTokenAuthentication``.
+    """
+    state = _state.get()
+    if state is not None:
+        state.user_id = user_id
+
+
+class ReplicaHealth:
+    """
+    Per-process record of replicas that recently failed.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._down_until[alias] = self.clock() + getattr(settings, 'DATABASE_REPLICA_RETRY_SECONDS', 30)
+
+    def is_up(self, alias):
+        with self._lock:
+            return self._down_until.get(alias, 0) <= self.clock()
+
+    def reset(self):
+        with self._lock:
+            self._down_until.clear()
+
+
+health = ReplicaHealth()
+
+
+def check_replica(alias):
+    """
+    Connect to ``alias`` if needed; a failure marks it down.
+    """
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        health.mark_down(alias)
+        return False
+    return True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.read_only or model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if state.replica is not None:
+            return state.replica
+        if self.is_pinned(state):
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if health.is_up(alias)]
+        random.shuffle(replicas)
+        for alias in replicas:
+            if check_replica(alias):
+                # Stay on one replica for the whole request.
+                state.replica = alias
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
+
+    @staticmethod
+    def is_pinned(state):
+        if state.user_id is None:
+            return False
+        if state.pinned is None:
+            state.pinned = cache.get(pin_key(state.user_id)) is not None
+        return state.pinned
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets ``PrimaryReplicaRouter`` send the reads of read-only requests to a
+    replica, pins users to the primary after they write, and reruns a
+    read-only request on the primary when its replica fails.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(read_only=request.method in SAFE_METHODS)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(state, response)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState(read_only=request.method in SAFE_METHODS)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(state, response)
+        return response
+
+    @staticmethod
+    def finish(state, response):
+        if not state.read_only and state.user_id is not None and response.status_code < 400:
+            pin_to_primary(state.user_id)
+
+    def process_exception(self, request, exception):
+        state = _state.get()
+        match = request.resolver_match
+        if (
+            state is None or state.replica in (None, DEFAULT_DB_ALIAS)
+            or not isinstance(exception, DatabaseError) or iscoroutinefunction(match.func)
+        ):
+            return None
+        health.mark_down(state.replica)
+        # Sticks: every read of the retry goes to the primary.
+        state.replica = DEFAULT_DB_ALIAS
+        return match.func(request, *match.args, **match.kwargs)
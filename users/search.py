@@ -0,0 +1,101 @@
+import unicodedata
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from . import response_cache
+from .emails import users_with_email
+from .models import UserSearchIndex
+
+
+# Columns needed to serialize and paginate a result.
+RESULT_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'date_joined')
+
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_SUBSTRING = 2
+
+
+def normalize_search_text(value):
+    """
+    Casefold ``value`` and strip accents so 'José' and 'jose' compare equal.
+    """
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', value.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).strip()
+
+
+def index_user(user):
+    """
+    Create or refresh the search index row for ``user``.
+    """
+    UserSearchIndex.objects.update_or_create(
+        user_id=user.pk,
+        defaults={
+            'first_name': normalize_search_text(user.first_name),
+            'last_name': normalize_search_text(user.last_name),
+        },
+    )
+
+
+@transaction.atomic
+def rebuild_search_index(batch_size=1000):
+    """
+    Recreate the search index rows for every user, streaming the user table.
+    Returns the number of indexed users.
+    """
+    UserSearchIndex.objects.all().delete()
+    batch = []
+    total = 0
+    users = User.objects.values_list('pk', 'first_name', 'last_name').order_by('pk')
+    for pk, first_name, last_name in users.iterator(chunk_size=batch_size):
+        batch.append(UserSearchIndex(
+            user_id=pk,
+            first_name=normalize_search_text(first_name),
+            last_name=normalize_search_text(last_name),
+        ))
+        if len(batch) >= batch_size:
+            UserSearchIndex.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        UserSearchIndex.objects.bulk_create(batch)
+        total += len(batch)
+    response_cache.invalidate_search()
+    return total
+
+
+def search_users(keyword):
+    """
+    Return the users matching ``keyword``, annotated with a ``search_rank``
+    (exact name match, then prefix, then substring).
+
+    A keyword containing '@' is looked up as an exact email address. Other
+    keywords match anywhere in the first or last name. On PostgreSQL the
+    trigram indexes serve keywords of 3 characters or more; shorter ones have no
+    trigram to look up and scan the search table, which is narrow, instead of
+    ``auth_user``.
+    """
+    if '@' in keyword:
+        return users_with_email(keyword).annotate(
+            search_rank=Value(RANK_EXACT, output_field=IntegerField()),
+        ).only(*RESULT_FIELDS)
+
+    term = normalize_search_text(keyword)
+    if not term:
+        return User.objects.none()
+
+    match = Q(first_name__contains=term) | Q(last_name__contains=term)
+    # The matching ids come from the (indexed) search table, so the planner
+    # never has to start from a scan of auth_user.
+    matching_ids = UserSearchIndex.objects.filter(match).values('user_id')
+
+    rank = Case(
+        When(Q(search_index__first_name=term) | Q(search_index__last_name=term), then=Value(RANK_EXACT)),
+        When(Q(search_index__first_name__startswith=term) | Q(search_index__last_name__startswith=term), then=Value(RANK_PREFIX)),
+        default=Value(RANK_SUBSTRING),
+        output_field=IntegerField(),
+    )
+    return User.objects.filter(pk__in=matching_ids).annotate(search_rank=rank).only(*RESULT_FIELDS)
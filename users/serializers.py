@@ -1,6 +1,8 @@
+from operator import itemgetter
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import FriendRequest, Friendship
+from .models import FriendRequest, FriendSuggestion, Friendship
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -20,3 +22,65 @@ class FriendRequestSerializer(serializers.ModelSerializer):
             'username': obj.from_user.username,
             'email': obj.from_user.email,
         }
+
+
+class FriendSuggestionSerializer(serializers.ModelSerializer):
+    user = UserSerializer(source='candidate')
+
+    class Meta:
+        model = FriendSuggestion
+        fields = ['user', 'mutual_count']
+
+
+class ValuesSerializer:
+    """
+    Read-only counterpart of a ``ModelSerializer`` for the list endpoints,
+    over rows fetched with ``.values(*serializer.lookups)``: no model
+    instances and no per-field ``to_representation`` calls, each row becomes
+    its dict through one ``itemgetter`` and ``zip``. The output is the same as
+    the ``ModelSerializer``'s, fields in the same order.
+
+    ``fields`` are output field names, read from the lookup ``prefix + name``,
+    or ``(name, ValuesSerializer)`` pairs for a nested object.
+    """
+
+    def __init__(self, *fields, prefix=''):
+        self.names = [field[0] if isinstance(field, tuple) else field for field in fields]
+        self.lookups = []
+        getters = []
+        for field in fields:
+            if isinstance(field, tuple):
+                nested = field[1]
+                self.lookups += nested.lookups
+                getters.append(nested.to_representation_row)
+            else:
+                self.lookups.append(prefix + field)
+                getters.append(itemgetter(prefix + field))
+        if all(isinstance(getter, itemgetter) for getter in getters):
+            getter = itemgetter(*self.lookups)
+            self.get_values = getter if len(self.lookups) > 1 else lambda row: (getter(row),)
+        else:
+            self.get_values = lambda row: [getter(row) for getter in getters]
+
+    def values(self, queryset, *extra):
+        """
+        ``queryset`` as rows with the serialized lookups, plus ``extra`` ones
+        (e.g. the pagination's ordering fields).
+        """
+        return queryset.values(*dict.fromkeys([*self.lookups, *extra]))
+
+    def to_representation_row(self, row):
+        return dict(zip(self.names, self.get_values(row)))
+
+    def to_representation(self, rows):
+        names, get_values = self.names, self.get_values
+        return [dict(zip(names, get_values(row))) for row in rows]
+
+
+# Values counterparts of UserSerializer (for users and for the friend of a
+# FriendEdge) and FriendRequestSerializer.
+user_values = ValuesSerializer(*UserSerializer.Meta.fields)
+friend_values = ValuesSerializer(*UserSerializer.Meta.fields, prefix='friend__')
+friend_request_values = ValuesSerializer(
+    'id', ('from_user', ValuesSerializer('id', 'username', 'email', prefix='from_user__')), 'status',
+)
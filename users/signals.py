@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import response_cache
+from .authentication import SNAPSHOT_FIELDS, invalidate_token, invalidate_user_tokens
+from .graph import add_friend_edges, remove_friend_edges
+from .models import FriendEdge, FriendRequest, Friendship, UserStats
+from .search import index_user
+from .suggestions import enqueue_record_friendships
+
+SEARCH_FIELDS = {'first_name', 'last_name'}
+AUTH_SNAPSHOT_FIELDS = set(SNAPSHOT_FIELDS)
+# Columns of a user shown in other users' cached friends and pending lists and search results.
+DISPLAYED_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def update_user_search_index(sender, instance, created, update_fields=None, **kwargs):
+    # Saves that only touch other columns (e.g. last_login on every login)
+    # do not need to rewrite the index row.
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    index_user(instance)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    # Counters then only ever need an UPDATE (see users.stats).
+    if created and not raw:
+        UserStats.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Friendship)
+def add_friendship_edges(sender, instance, created, **kwargs):
+    if created:
+        add_friend_edges(instance.user1, instance.user2)
+        enqueue_record_friendships([(instance.user1_id, instance.user2_id)])
+
+
+@receiver(post_delete, sender=Friendship)
+def remove_friendship_edges(sender, instance, **kwargs):
+    remove_friend_edges(instance.user1_id, instance.user2_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # A deactivated or edited user must not be served from a stale snapshot.
+    if created or (update_fields is not None and not AUTH_SNAPSHOT_FIELDS & set(update_fields)):
+        return
+    invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_listings(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not DISPLAYED_FIELDS & set(update_fields):
+        return
+    # Signups and full saves (which mostly change nothing shown) are too
+    # frequent to drop every cached search each time.
+    response_cache.invalidate_search(throttled=update_fields is None)
+    if created:
+        return
+    response_cache.invalidate('friends', *FriendEdge.objects.filter(friend=instance).values_list('user_id', flat=True))
+    response_cache.invalidate('pending', *FriendRequest.objects.filter(
+        from_user=instance, status='pending',
+    ).values_list('to_user_id', flat=True))
+
+
+@receiver(post_save, sender=FriendRequest)
+@receiver(post_delete, sender=FriendRequest)
+def invalidate_cached_pending_requests(sender, instance, **kwargs):
+    response_cache.invalidate('pending', instance.to_user_id)
@@ -0,0 +1,114 @@
+"""
+Per-user friend and pending-request counts (``UserStats``).
+
+Writers collect the changes of an action in a ``StatsDelta`` and ``apply()``
+it inside the transaction that changes the requests or friendships, so the
+counters commit or roll back with them. Each counter is updated with an
+``F()`` expression, so concurrent actions add up instead of overwriting each
+other. A user without a row gets one computed from the source tables the
+first time it is needed.
+
+Anything that bypasses the friend request views (the admin, a shell, cascade
+deletes, imports) leaves the counters stale; ``reconcile_stats`` (the
+``reconcile_user_stats`` command) recomputes them in chunks.
+"""
+from collections import Counter, defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Max
+
+from .models import FriendEdge, FriendRequest, UserEvent, UserStats
+
+FIELDS = ('friend_count', 'pending_received', 'pending_sent')
+
+
+class StatsDelta:
+    def __init__(self):
+        self.changes = defaultdict(Counter)
+
+    def request_sent(self, from_user_id, to_user_id):
+        self.changes[from_user_id]['pending_sent'] += 1
+        self.changes[to_user_id]['pending_received'] += 1
+
+    def request_answered(self, from_user_id, to_user_id):
+        self.changes[from_user_id]['pending_sent'] -= 1
+        self.changes[to_user_id]['pending_received'] -= 1
+
+    def friendship_added(self, user_a_id, user_b_id):
+        self.changes[user_a_id]['friend_count'] += 1
+        self.changes[user_b_id]['friend_count'] += 1
+
+    def apply(self):
+        """
+        Write the collected changes. Call inside the transaction of the change.
+        """
+        missing = []
+        # Rows are locked in user id order, so concurrent actions cannot deadlock.
+        for user_id in sorted(self.changes):
+            updates = {field: F(field) + delta for field, delta in self.changes[user_id].items() if delta}
+            if updates and not UserStats.objects.filter(user_id=user_id).update(**updates):
+                missing.append(user_id)
+        if missing:
+            # Computed from the source tables, which already include this change.
+            UserStats.objects.bulk_create(compute(missing), ignore_conflicts=True)
+        self.changes.clear()
+
+
+def compute(user_ids):
+    """
+    ``UserStats`` (unsaved) for ``user_ids``, counted from the source tables.
+    """
+    counts = {user_id: dict.fromkeys(FIELDS, 0) for user_id in user_ids}
+    for field, rows in (
+        ('friend_count', FriendEdge.objects.filter(user_id__in=user_ids).values_list('user_id')),
+        ('pending_received', FriendRequest.objects.filter(to_user_id__in=user_ids, status='pending').values_list('to_user_id')),
+        ('pending_sent', FriendRequest.objects.filter(from_user_id__in=user_ids, status='pending').values_list('from_user_id')),
+    ):
+        for user_id, count in rows.annotate(count=Count('*')).order_by():
+            counts[user_id][field] = count
+    latest = UserEvent.objects.filter(user_id__in=user_ids).values('user_id').annotate(seq=Max('seq')).values_list('user_id', 'seq')
+    for user_id, seq in latest.order_by():
+        counts[user_id]['last_event_seq'] = seq
+    return [UserStats(user_id=user_id, **values) for user_id, values in counts.items()]
+
+
+def counts_for(user):
+    """
+    ``{'friend_count': ..., 'pending_received': ..., 'pending_sent': ...}`` for ``user``.
+    """
+    values = UserStats.objects.filter(user_id=user.pk).values(*FIELDS).first()
+    if values is None:
+        stats = compute([user.pk])[0]
+        UserStats.objects.bulk_create([stats], ignore_conflicts=True)
+        values = {field: getattr(stats, field) for field in FIELDS}
+    return values
+
+
+def reconcile_stats(chunk_size=1000):
+    """
+    Recompute every user's counts, ``chunk_size`` users per transaction, and
+    fix the rows that drifted. Returns ``(users checked, rows repaired)``.
+    """
+    checked = repaired = 0
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not user_ids:
+            return checked, repaired
+        last_id = user_ids[-1]
+        with transaction.atomic():
+            # Lock the rows before counting: an action that commits later
+            # waits for this chunk and then applies its delta on top.
+            current = {stats.user_id: stats for stats in UserStats.objects.select_for_update().filter(user_id__in=user_ids)}
+            changed, created = [], []
+            for stats in compute(user_ids):
+                row = current.get(stats.user_id)
+                if row is None:
+                    created.append(stats)
+                elif any(getattr(row, field) != getattr(stats, field) for field in FIELDS):
+                    changed.append(stats)
+            UserStats.objects.bulk_create(created, ignore_conflicts=True)
+            UserStats.objects.bulk_update(changed, FIELDS)
+        checked += len(user_ids)
+        repaired += len(changed) + len(created)
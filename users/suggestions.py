@@ -0,0 +1,194 @@
+"""
+"People you may know": second-degree friends ranked by mutual-friend count.
+
+Each user has at most ``TOP_K`` ``FriendSuggestion`` rows, so reading the
+suggestions is one index range scan. When a friendship is created the counts
+of the affected pairs are adjusted incrementally (``record_friendship``);
+``recompute_suggestions`` rebuilds everything from the ``FriendEdge`` table and
+repairs what the incremental path cannot see (removed friendships, candidates
+that were trimmed from a full list, friends beyond ``FANOUT_LIMIT``).
+
+``record_friendship`` runs in the background (``users.jobs``): the request
+that creates a friendship only enqueues it with ``enqueue_record_friendships``.
+"""
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+from . import jobs
+from .models import FriendEdge, FriendSuggestion
+
+TOP_K = getattr(settings, 'FRIEND_SUGGESTIONS_TOP_K', 50)
+# Friends read per side when a friendship is created; hubs beyond this are
+# left to the batch recompute so accepting a request stays cheap.
+FANOUT_LIMIT = getattr(settings, 'FRIEND_SUGGESTIONS_FANOUT_LIMIT', 1000)
+
+
+def mutual_friend_count(user_a, user_b):
+    return FriendEdge.objects.filter(
+        user=user_a,
+        friend_id__in=FriendEdge.objects.filter(user=user_b).values('friend_id'),
+    ).count()
+
+
+def top_suggestions(user, limit=TOP_K):
+    return FriendSuggestion.objects.filter(user=user).select_related('candidate').only(
+        'mutual_count', 'candidate__id', 'candidate__username', 'candidate__email',
+        'candidate__first_name', 'candidate__last_name',
+    ).order_by('-mutual_count', 'candidate_id')[:limit]
+
+
+def _friend_ids(user_id, before_edge_id):
+    """
+    The friends of ``user_id``, and those of them whose edge is older (has a
+    lower id) than ``before_edge_id``.
+    """
+    edges = FriendEdge.objects.filter(user_id=user_id).values_list('friend_id', 'id')[:FANOUT_LIMIT]
+    friends, earlier = set(), set()
+    for friend_id, edge_id in edges:
+        friends.add(friend_id)
+        if edge_id < before_edge_id:
+            earlier.add(friend_id)
+    return friends, earlier
+
+
+def _increment_candidates(user_id, candidate_ids):
+    """
+    Add one mutual friend to ``(user_id, candidate)`` for every candidate.
+    """
+    if not candidate_ids:
+        return
+    rows = FriendSuggestion.objects.filter(user_id=user_id, candidate_id__in=candidate_ids)
+    existing = set(rows.values_list('candidate_id', flat=True))
+    rows.update(mutual_count=F('mutual_count') + 1)
+    FriendSuggestion.objects.bulk_create(
+        [FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_count=1) for candidate_id in candidate_ids - existing],
+        ignore_conflicts=True,
+    )
+
+
+def _increment_users(user_ids, candidate_id):
+    """
+    Add one mutual friend to ``(user, candidate_id)`` for every user.
+    """
+    if not user_ids:
+        return
+    rows = FriendSuggestion.objects.filter(user_id__in=user_ids, candidate_id=candidate_id)
+    existing = set(rows.values_list('user_id', flat=True))
+    rows.update(mutual_count=F('mutual_count') + 1)
+    FriendSuggestion.objects.bulk_create(
+        [FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_count=1) for user_id in user_ids - existing],
+        ignore_conflicts=True,
+    )
+
+
+def trim_suggestions(user_ids, top_k=TOP_K):
+    """
+    Drop everything but the ``top_k`` best suggestions of each of ``user_ids``.
+    """
+    ranked = FriendSuggestion.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(RowNumber(), partition_by=[F('user_id')], order_by=[F('mutual_count').desc(), F('candidate_id').asc()]),
+    )
+    stale = list(ranked.filter(position__gt=top_k).values_list('pk', flat=True))
+    if stale:
+        FriendSuggestion.objects.filter(pk__in=stale).delete()
+
+
+@transaction.atomic
+def record_friendship(user_a_id, user_b_id):
+    """
+    Update suggestions for a new friendship between ``user_a_id`` and ``user_b_id``.
+
+    Each friend A had before B that is not a friend of B now shares A with B
+    (and vice versa), and A and B stop being suggestions for each other.
+    "Before" goes by ``FriendEdge`` id, so a mutual friend is counted by exactly
+    one call however late (queued) calls run and in whatever order.
+    """
+    edge_ids = dict(FriendEdge.objects.filter(
+        user_id__in=[user_a_id, user_b_id], friend_id__in=[user_a_id, user_b_id],
+    ).values_list('user_id', 'id'))
+    if len(edge_ids) < 2:
+        return  # No longer friends.
+    friends_a, earlier_a = _friend_ids(user_a_id, edge_ids[user_a_id])
+    friends_b, earlier_b = _friend_ids(user_b_id, edge_ids[user_b_id])
+    new_for_b = earlier_a - friends_b
+    new_for_a = earlier_b - friends_a
+
+    FriendSuggestion.objects.filter(user_id=user_a_id, candidate_id=user_b_id).delete()
+    FriendSuggestion.objects.filter(user_id=user_b_id, candidate_id=user_a_id).delete()
+    _increment_candidates(user_b_id, new_for_b)
+    _increment_users(new_for_b, user_b_id)
+    _increment_candidates(user_a_id, new_for_a)
+    _increment_users(new_for_a, user_a_id)
+    trim_suggestions({user_a_id, user_b_id} | new_for_a | new_for_b)
+
+
+@jobs.task('suggestions.record_friendship')
+def record_friendship_job(payload):
+    record_friendship(*payload['users'])
+
+
+def enqueue_record_friendships(pairs):
+    """
+    Queue ``record_friendship`` for every ``(user_a_id, user_b_id)`` pair, once
+    per pair: a pair befriended again before its job is purged is left to
+    ``recompute_suggestions``, like any removed friendship.
+    """
+    jobs.enqueue_many('suggestions.record_friendship', [
+        ({'users': [user_a_id, user_b_id]}, 'record_friendship:%s:%s' % tuple(sorted((user_a_id, user_b_id))))
+        for user_a_id, user_b_id in pairs
+    ])
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def recompute_suggestions(chunk_size=500, top_k=TOP_K):
+    """
+    Rebuild every user's top-``top_k`` suggestions from the ``FriendEdge`` table.
+
+    Users are processed ``chunk_size`` at a time; the database counts the
+    friends-of-friends of a chunk in one grouped query that is streamed back,
+    so memory is bounded by the chunk rather than the graph. Returns the number
+    of users processed.
+    """
+    FriendSuggestion.objects.exclude(user_id__in=FriendEdge.objects.values('user_id')).delete()
+
+    user_ids = FriendEdge.objects.values_list('user_id', flat=True).distinct().order_by('user_id')
+    total = 0
+    for chunk in _chunks(user_ids.iterator(chunk_size=chunk_size), chunk_size):
+        friends = defaultdict(set)
+        for user_id, friend_id in FriendEdge.objects.filter(user_id__in=chunk).values_list('user_id', 'friend_id').iterator(chunk_size=chunk_size):
+            friends[user_id].add(friend_id)
+
+        # (user, friend of a friend, number of friends in between)
+        counts = FriendEdge.objects.filter(user_id__in=chunk).values_list(
+            'user_id', 'friend__friend_edges__friend_id',
+        ).annotate(mutual=Count('pk')).order_by()
+        candidates = defaultdict(list)
+        for user_id, candidate_id, mutual in counts.iterator(chunk_size=chunk_size):
+            if candidate_id != user_id and candidate_id not in friends[user_id]:
+                candidates[user_id].append((mutual, -candidate_id))
+
+        rows = [
+            FriendSuggestion(user_id=user_id, candidate_id=-negated_id, mutual_count=mutual)
+            for user_id, scored in candidates.items()
+            for mutual, negated_id in heapq.nlargest(top_k, scored)
+        ]
+        with transaction.atomic():
+            FriendSuggestion.objects.filter(user_id__in=chunk).delete()
+            FriendSuggestion.objects.bulk_create(rows, batch_size=1000)
+        total += len(chunk)
+    return total
@@ -1,3 +1,1585 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from benchmarks.datagen import generate
+from benchmarks.harness import compare, percentile
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import Count, F, Q
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from social_network.settings import api as api_settings
+
+from . import events, friend_requests, jobs, response_cache
+from .authentication import CachedTokenAuthentication, LRUCache, local_tokens, stats
+from .emails import users_with_email
+from .graph import are_friends
+from .graph_io import export_graph, import_graph, open_dump
+from .hashing import HashingPool, HashingPoolSaturated, get_hashing_pool
+from .instrumentation import RequestMetrics, _current, registry
+from .models import FriendEdge, FriendRequest, FriendSuggestion, Friendship, Job, RateLimitCounter, UserEvent, UserSearchIndex, UserStats
+from .pagination import UserSearchPagination
+from .ratelimit import DatabaseBackend, LocMemBackend, RateLimitResult, get_rate_limiter
+from .response_cache import cached
+from .routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware, health, user_authenticated
+from .renderers import FastJSONRenderer
+from .serializers import FriendRequestSerializer, UserSerializer, friend_request_values, friend_values, user_values
+from .stats import counts_for, reconcile_stats
+from .suggestions import recompute_suggestions, trim_suggestions
+
+
+# The configured cache may be the one running servers use (the file cache in
+# BASE_DIR, or the Redis of docker-compose), and tests clear it: every test
+# runs against a cache of its own instead.
+isolated_cache = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'users-tests'},
+})
+
+
+def setUpModule():
+    isolated_cache.enable()
+
+
+def tearDownModule():
+    isolated_cache.disable()
+
+
+def make_user(email, first_name='', last_name='', password='pass1234!'):
+    return User.objects.create_user(
+        username=email, email=email, password=password, first_name=first_name, last_name=last_name,
+    )
+
+
+def authenticated_client(user):
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def cursor_for(position):
+    raw = json.dumps({'p': position, 'r': 0}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+
+    def search(self, **params):
+        return self.client.get('/user/user_search/', params)
+
+    def test_index_follows_name_changes(self):
+        user = make_user('jose@example.com', 'José', 'Núñez')
+        self.assertEqual(UserSearchIndex.objects.get(user=user).first_name, 'jose')
+        user.first_name = 'Pepe'
+        user.save()
+        self.assertEqual(UserSearchIndex.objects.get(user=user).first_name, 'pepe')
+
+    def test_substring_match_is_ranked(self):
+        make_user('a@example.com', 'Ashish', 'Doe')
+        make_user('b@example.com', 'Shiva', 'Rao')
+        make_user('c@example.com', 'Shi', 'Kumar')
+        response = self.search(search='shi')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        emails = [row['email'] for row in response.data['results']]
+        self.assertEqual(emails, ['c@example.com', 'b@example.com', 'a@example.com'])
+
+    def test_short_keyword_matches_anywhere(self):
+        make_user('a@example.com', 'Ashish', 'Doe')
+        make_user('b@example.com', 'Shiva', 'Rao')
+        make_user('c@example.com', 'Anna', 'Lee')
+        response = self.search(search='sh')
+        self.assertEqual([row['email'] for row in response.data['results']], ['b@example.com', 'a@example.com'])
+        response = self.search(search='nn')
+        self.assertEqual([row['email'] for row in response.data['results']], ['c@example.com'])
+
+    def test_email_lookup(self):
+        make_user('target@example.com', 'Target', 'User')
+        response = self.search(search='TARGET@example.com')
+        self.assertEqual([row['email'] for row in response.data['results']], ['target@example.com'])
+
+    def test_no_match_returns_404(self):
+        self.assertEqual(self.search(search='nobody').status_code, 404)
+        self.assertEqual(self.search().status_code, 400)
+
+    def test_cursor_pages_cover_all_results(self):
+        for i in range(7):
+            make_user(f'user{i}@example.com', 'Kiran', f'Number{i}')
+        seen = []
+        response = self.search(search='kiran', page_size=3)
+        while True:
+            self.assertEqual(response.data['count'], 7)
+            seen.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual([row['id'] for row in previous.data['results']], seen[3:6])
+
+    def test_tampered_cursor_is_not_found(self):
+        make_user('user@example.com', 'Kiran', 'Number')
+        response = self.search(search='kiran', cursor=cursor_for(['x', 'y', 'z']))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['detail'], 'Invalid cursor')
+
+    def test_count_is_capped_and_carried_by_the_cursor(self):
+        for i in range(7):
+            make_user(f'user{i}@example.com', 'Kiran', f'Number{i}')
+
+        def counts(response):
+            return response.data['count'], response.data['count_exact']
+
+        def count_queries(queries):
+            return len([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+        with mock.patch.object(UserSearchPagination, 'count_limit', 5):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.search(search='kiran', page_size=3)
+            self.assertEqual(counts(response), (5, False))
+            self.assertEqual(count_queries(queries), 1)
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(response.data['next'])
+            self.assertEqual(counts(response), (5, False))
+            self.assertEqual(count_queries(queries), 0)
+        self.assertEqual(counts(self.search(search='kiran', page_size=3)), (7, True))
+
+    def test_single_page_needs_no_count_query(self):
+        make_user('a@example.com', 'Kiran', 'Doe')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search(search='kiran')
+        self.assertEqual((response.data['count'], response.data['count_exact']), (1, True))
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+
+class ListFriendsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+
+    def test_no_friends(self):
+        response = self.client.get('/user/friends_list')
+        self.assertEqual(response.data, {'message': 'No friends yet'})
+
+    def test_friends_from_both_sides_are_listed_newest_first(self):
+        friends = [make_user(f'friend{i}@example.com', 'Friend', str(i)) for i in range(5)]
+        for i, friend in enumerate(friends):
+            if i % 2:
+                Friendship.objects.create(user1=self.me, user2=friend)
+            else:
+                Friendship.objects.create(user1=friend, user2=self.me)
+        expected = [friend.email for friend in reversed(friends)]
+
+        with self.assertNumQueries(2):  # token lookup, one page of edges joined to the friends
+            response = self.client.get('/user/friends_list', {'page_size': 2})
+        emails = [row['email'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            emails.extend(row['email'] for row in response.data['results'])
+        self.assertEqual(emails, expected)
+
+    def test_tampered_cursor_is_not_found(self):
+        Friendship.objects.create(user1=self.me, user2=make_user('friend@example.com', 'Friend', 'One'))
+        for position in (['bad', 'bad'], ['2020-01-01T00:00:00+00:00', 10 ** 30], [None, 1]):
+            response = self.client.get('/user/friends_list', {'cursor': cursor_for(position)})
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_unfriending_removes_both_edges(self):
+        friend = make_user('friend@example.com', 'Friend', 'One')
+        friendship = Friendship.objects.create(user1=self.me, user2=friend)
+        self.assertTrue(are_friends(friend, self.me))
+        friendship.delete()
+        self.assertFalse(FriendEdge.objects.exists())
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitBackendTests(TestCase):
+    def check_sliding_window(self, backend, clock):
+        for remaining in (2, 1, 0):
+            self.assertEqual(backend.hit('k', 3, 60), RateLimitResult(True, remaining, 0))
+        refused = backend.hit('k', 3, 60)
+        self.assertFalse(refused.allowed)
+        self.assertGreater(refused.retry_after, 0)
+        self.assertFalse(backend.hit('k', 3, 60, cost=2).allowed)
+        self.assertTrue(backend.hit('other', 3, 60).allowed)
+        clock.now += 121
+        self.assertTrue(backend.hit('k', 3, 60, cost=3).allowed)
+        backend.reset('k')
+        self.assertTrue(backend.hit('k', 3, 60, cost=3).allowed)
+
+    def test_locmem_backend(self):
+        clock = FakeClock()
+        self.check_sliding_window(LocMemBackend(clock=clock), clock)
+
+    def test_database_backend(self):
+        clock = FakeClock(now=6000.0)
+        self.check_sliding_window(DatabaseBackend(clock=clock), clock)
+
+    def test_database_backend_weights_previous_window(self):
+        clock = FakeClock(now=6000.0)
+        backend = DatabaseBackend(clock=clock)
+        backend.hit('k', 3, 60, cost=3)
+        clock.now += 75  # a quarter into the next window, 75% of the old hits still count
+        refused = backend.hit('k', 3, 60)
+        self.assertFalse(refused.allowed)
+        self.assertAlmostEqual(refused.retry_after, 5)
+        clock.now += 5
+        self.assertTrue(backend.hit('k', 3, 60).allowed)
+
+
+@override_settings(RATE_LIMIT_BACKEND='users.ratelimit.LocMemBackend', RATE_LIMIT_BACKEND_OPTIONS={})
+class FriendRequestThrottleTests(TestCase):
+    def setUp(self):
+        get_rate_limiter.cache_clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+        self.targets = [make_user(f'target{i}@example.com', 'Target', str(i)) for i in range(4)]
+
+    def send(self, target):
+        return self.client.post('/user/friend-request', {'action': 'send', 'target_email': target.email})
+
+    def test_fourth_send_in_a_minute_is_refused(self):
+        for target in self.targets[:3]:
+            self.assertEqual(self.send(target).status_code, 200)
+        response = self.send(self.targets[3])
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(response.json(), {'error': 'Request limit exceeded. You can only send 3 requests per minute.'})
+        self.assertFalse(FriendRequest.objects.filter(to_user=self.targets[3]).exists())
+
+    def test_accept_is_not_counted(self):
+        for target in self.targets[:3]:
+            self.send(target)
+        FriendRequest.objects.create(from_user=self.targets[3], to_user=self.me)
+        response = self.client.post('/user/friend-request', {'action': 'accept', 'target_email': self.targets[3].email})
+        self.assertEqual(response.status_code, 200)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        stats.reset()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+
+    def test_second_request_skips_the_token_query(self):
+        self.client.get('/user/friends_list')
+        with self.assertNumQueries(0):  # token and friends page both come from the caches
+            response = self.client.get('/user/friends_list')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stats.snapshot()['misses'], 1)
+        self.assertEqual(stats.snapshot()['local_hits'], 1)
+
+    def test_shared_tier_is_used_after_local_expiry(self):
+        self.client.get('/user/friends_list')
+        local_tokens.clear()
+        self.client.get('/user/friends_list')
+        self.assertEqual(stats.snapshot()['shared_hits'], 1)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/user/friends_list')
+        Token.objects.filter(user=self.me).delete()
+        self.assertEqual(self.client.get('/user/friends_list').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/user/friends_list')
+        self.me.is_active = False
+        self.me.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get('/user/friends_list').status_code, 401)
+
+    def test_cached_user_has_the_right_attributes(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {self.me.auth_token.key}')
+        for _ in range(2):  # from the database, then from the cache
+            user, _ = CachedTokenAuthentication().authenticate(request)
+            self.assertEqual(
+                (user.pk, user.username, user.email, user.first_name, user.is_active, user.is_staff, user.is_superuser),
+                (self.me.pk, 'me@example.com', 'me@example.com', 'Me', True, False, False),
+            )
+
+    def test_lru_evicts_least_recently_used(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual((lru.get('a'), lru.get('c')), (1, 3))
+
+
+@override_settings(RATE_LIMIT_BACKEND='users.ratelimit.LocMemBackend', RATE_LIMIT_BACKEND_OPTIONS={})
+class FriendRequestBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_rate_limiter.cache_clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+        self.alice = make_user('alice@example.com', 'Alice', 'A')
+        self.bob = make_user('bob@example.com', 'Bob', 'B')
+        self.carol = make_user('carol@example.com', 'Carol', 'C')
+
+    def batch(self, *operations):
+        return self.client.post('/user/friend-request/batch', {'operations': [
+            {'action': action, 'target_email': email} for action, email in operations
+        ]}, format='json')
+
+    def test_mixed_batch_uses_constant_number_of_queries(self):
+        FriendRequest.objects.create(from_user=self.bob, to_user=self.me)
+        FriendRequest.objects.create(from_user=self.carol, to_user=self.me)
+        self.client.get('/user/friends_list')  # warm the token cache
+        # targets, pair locks, existing requests, one statement per bulk write and
+        # status transition (incl. savepoint, the friendships already known and the
+        # queued suggestion update), one counter update per user involved, the
+        # recipients' event numbers (locked, then advanced) and the events
+        with self.assertNumQueries(19):
+            response = self.batch(
+                ('send', 'alice@example.com'),
+                ('accept', 'bob@example.com'),
+                ('reject', 'carol@example.com'),
+                ('send', 'alice@example.com'),
+                ('send', 'nobody@example.com'),
+                ('accept', 'me@example.com'),
+            )
+        codes = [result['status_code'] for result in response.data['results']]
+        self.assertEqual(codes, [200, 200, 200, 400, 404, 400])
+        self.assertEqual(FriendRequest.objects.get(from_user=self.me, to_user=self.alice).status, 'pending')
+        self.assertEqual(FriendRequest.objects.get(from_user=self.carol).status, 'rejected')
+        self.assertTrue(are_friends(self.me, self.bob))
+
+    def test_sends_count_against_the_rate_limit(self):
+        self.assertEqual(self.batch(('send', 'alice@example.com'), ('send', 'bob@example.com')).status_code, 200)
+        response = self.batch(('send', 'carol@example.com'), ('send', 'me@example.com'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(list(response.json()), ['error'])
+        self.assertEqual(self.batch(('send', 'carol@example.com')).status_code, 200)
+
+    def test_rejects_invalid_payload(self):
+        self.assertEqual(self.client.post('/user/friend-request/batch', {'operations': []}, format='json').status_code, 400)
+
+    @override_settings(FRIEND_REQUEST_BATCH_MAX_OPERATIONS=1)
+    def test_batch_size_limit_follows_the_setting(self):
+        response = self.batch(('send', 'alice@example.com'), ('send', 'bob@example.com'))
+        self.assertEqual((response.status_code, response.data), (400, {'error': 'At most 1 operations are allowed per batch'}))
+
+    def test_reads_requests_under_the_pair_locks(self):
+        friend_requests.send_request(self.bob, self.me)
+        lock_pairs = friend_requests.lock_pairs
+
+        def reject_first(pairs):
+            # A single-endpoint reject that committed while the batch waited for the locks.
+            with mock.patch.object(friend_requests, 'lock_pairs', lock_pairs):
+                friend_requests.reject_request(self.me, self.bob)
+            lock_pairs(pairs)
+
+        with mock.patch.object(friend_requests, 'lock_pairs', reject_first):
+            response = self.batch(('accept', 'bob@example.com'))
+        self.assertEqual(response.data['results'][0]['status_code'], 400)
+        self.assertEqual(FriendRequest.objects.get(from_user=self.bob).status, 'rejected')
+        self.assertFalse(Friendship.objects.exists())
+        self.assertEqual(counts_for(self.me)['pending_received'], 0)
+        self.assertEqual(counts_for(self.bob)['pending_sent'], 0)
+
+    def test_reopened_request_shows_in_the_targets_cached_list(self):
+        FriendRequest.objects.create(from_user=self.me, to_user=self.alice, status='rejected')
+        alice = authenticated_client(self.alice)
+        self.assertEqual(alice.get('/user/pending-recieved-requests').data['results'], [])
+        self.batch(('send', 'alice@example.com'))
+        response = alice.get('/user/pending-recieved-requests')
+        self.assertEqual((response['X-Cache'], len(response.data['results'])), ('MISS', 1))
+        self.assertEqual(FriendRequest.objects.get(from_user=self.me).status, 'pending')
+
+    def test_counts_only_inserted_friendships(self):
+        FriendRequest.objects.create(from_user=self.bob, to_user=self.me)
+        user1, user2 = sorted([self.me, self.bob], key=lambda user: user.pk)
+        Friendship.objects.bulk_create([Friendship(user1=user1, user2=user2)])  # sends no signal
+        friend_count = counts_for(self.me)['friend_count']
+        self.assertEqual(self.batch(('accept', 'bob@example.com')).data['results'][0]['status_code'], 200)
+        self.assertEqual(counts_for(self.me)['friend_count'], friend_count)
+
+
+def explain(sql):
+    """
+    Return the plan of ``sql`` as a list of lines. On PostgreSQL sequential
+    scans are disabled first so the plan shows whether an index *can* be used
+    rather than what the planner prefers for a tiny test table.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN ' + sql)
+                return [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(sql):
+    """
+    Return the tables ``sql`` reads with a full (sequential) scan.
+    """
+    pattern = r'Seq Scan on (\w+)' if connection.vendor == 'postgresql' else r'^SCAN (\w+)'
+    aliases = dict((alias, table) for table, alias in re.findall(r'"(\w+)" (?:AS )?([A-Z]\d+)\b', sql))
+    scanned = {match.group(1) for line in explain(sql) for match in [re.search(pattern, line)] if match}
+    # Scans of derived tables (subqueries, CTEs) are not table scans.
+    return {aliases.get(name, name) for name in scanned} & set(connection.introspection.table_names())
+
+
+class QueryPlanTests(TestCase):
+    """
+    Query-plan regression suite for users/views.py: every statement a view runs
+    must be served by an index, and list endpoints must run a constant number
+    of queries however many rows they return.
+    """
+    # Tables a view may still scan on this backend, with the reason.
+    ALLOWED_SCANS = {
+        # Without pg_trgm there is no index for LIKE '%x%' (users.search).
+        'user_search': {'users_usersearchindex'} if connection.vendor != 'postgresql' else set(),
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+
+    def make_friends(self, count, offset=0):
+        for i in range(offset, offset + count):
+            Friendship.objects.create(user1=self.me, user2=make_user(f'friend{i}@example.com', 'Friend', str(i)))
+
+    def make_pending(self, count, offset=0):
+        for i in range(offset, offset + count):
+            FriendRequest.objects.create(from_user=make_user(f'sender{i}@example.com', 'Sender', str(i)), to_user=self.me)
+
+    def capture(self, name, method, url, data=None, allowed=()):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json' if method == 'post' else None)
+        self.assertLess(response.status_code, 500)
+        allowed = set(allowed) | self.ALLOWED_SCANS.get(name, set())
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            scanned = full_scans(sql) - allowed
+            self.assertFalse(scanned, f'{name} scans {sorted(scanned)}:\n{sql}\n' + '\n'.join(explain(sql)))
+        return response, len(ctx.captured_queries)
+
+    def assert_constant_queries(self, name, url, grow):
+        grow(2, 0)
+        self.client.get(url)  # warm the token cache and the rate-limit window
+        _, small = self.capture(name, 'get', url, {'page_size': 100})
+        grow(10, 2)
+        _, large = self.capture(name, 'get', url, {'page_size': 100})
+        self.assertEqual(small, large, f'{name} runs a query per row (N+1)')
+
+    def test_signup(self):
+        self.client.credentials()
+        self.capture('signup', 'post', '/user/signup', {
+            'email': 'new@example.com', 'password': 'pass1234!', 'first_name': 'New', 'last_name': 'User',
+        })
+
+    def test_login(self):
+        self.client.credentials()
+        self.capture('login', 'post', '/user/login', {'email': 'me@example.com', 'password': 'pass1234!'})
+
+    def test_user_search(self):
+        make_user('kiran@example.com', 'Kiran', 'Rao')
+        self.capture('user_search', 'get', '/user/user_search/', {'search': 'kir'})
+        # Too short for a trigram: scans the search table (never auth_user).
+        self.capture('user_search', 'get', '/user/user_search/', {'search': 'ki'}, allowed={'users_usersearchindex'})
+        self.capture('user_search', 'get', '/user/user_search/', {'search': 'kiran@example.com'})
+
+    def test_user_search_is_not_n_plus_one(self):
+        def grow(count, offset):
+            for i in range(offset, offset + count):
+                make_user(f'kiran{i}@example.com', 'Kiran', str(i))
+        self.assert_constant_queries('user_search', '/user/user_search/?search=kiran', grow)
+
+    def test_friend_request_actions(self):
+        target = make_user('target@example.com', 'Target', 'User')
+        sender = make_user('sender@example.com', 'Sender', 'User')
+        FriendRequest.objects.create(from_user=sender, to_user=self.me)
+        self.capture('friend_request', 'post', '/user/friend-request', {'action': 'send', 'target_email': target.email})
+        self.capture('friend_request', 'post', '/user/friend-request', {'action': 'accept', 'target_email': sender.email})
+        self.capture('friend_request_batch', 'post', '/user/friend-request/batch', {'operations': [
+            {'action': 'send', 'target_email': target.email}, {'action': 'reject', 'target_email': sender.email},
+        ]})
+
+    def test_friends_list(self):
+        self.assert_constant_queries('friends_list', '/user/friends_list', self.make_friends)
+
+    def test_pending_requests(self):
+        self.make_pending(1)
+        self.capture('pending_requests', 'get', '/user/pending-recieved-requests')
+
+    def test_pending_requests_is_not_n_plus_one(self):
+        self.assert_constant_queries('pending_requests', '/user/pending-recieved-requests', self.make_pending)
+
+    def test_friend_suggestions(self):
+        def grow(count, offset):
+            # Each candidate is a friend of a different friend of mine.
+            for i in range(offset, offset + count):
+                friend = make_user(f'friend{i}@example.com', 'Friend', str(i))
+                Friendship.objects.create(user1=self.me, user2=friend)
+                Friendship.objects.create(user1=friend, user2=make_user(f'candidate{i}@example.com', 'Candidate', str(i)))
+            recompute_suggestions()
+        self.assert_constant_queries('friend_suggestions', '/user/suggestions', grow)
+        self.assertEqual(len(self.client.get('/user/suggestions').data), 12)
+
+    def test_mutual_friends(self):
+        target = make_user('target@example.com', 'Target', 'User')
+        self.make_friends(2)
+        for friend in User.objects.filter(email__startswith='friend'):
+            Friendship.objects.create(user1=friend, user2=target)
+        response, _ = self.capture('mutual_friends', 'get', '/user/mutual-friends', {'target_email': target.email})
+        self.assertEqual(response.data, {'mutual_count': 2})
+
+    def test_user_counts(self):
+        self.make_pending(1)
+        self.capture('user_counts', 'get', '/user/counts')
+        UserStats.objects.filter(user=self.me).delete()
+        response, _ = self.capture('user_counts', 'get', '/user/counts')  # the row is computed again
+        self.assertEqual(response.data['pending_received'], 1)
+
+
+class EmailLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+
+    def test_lookup_ignores_case(self):
+        self.assertEqual(list(users_with_email('ME@Example.com')), [self.me])
+        self.assertEqual(list(users_with_email('me@example.com', 'nobody@example.com')), [self.me])
+
+    def test_index_rejects_duplicate_address(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='other', email='Me@Example.com')
+
+    def test_blank_emails_do_not_collide(self):
+        User.objects.create_user(username='first')
+        User.objects.create_user(username='second')
+        self.assertFalse(users_with_email('').exists())
+
+    def test_non_string_email_matches_nobody(self):
+        self.assertFalse(users_with_email(5).exists())
+        self.assertEqual(list(users_with_email(5, 'me@example.com')), [self.me])
+        make_user('target@example.com')
+        response = self.client.post('/user/friend-request', {'action': 'send', 'target_email': 5}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_signup_with_address_in_use(self):
+        response = APIClient().post('/user/signup', {
+            'email': 'ME@example.com', 'password': 'pass1234!', 'first_name': 'Me', 'last_name': 'Again',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Email is already in use'})
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_target_email_ignores_case(self):
+        target = make_user('target@example.com', 'Target', 'User')
+        response = self.client.post('/user/friend-request', {'action': 'send', 'target_email': 'Target@Example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/user/friend-request/batch', {'operations': [
+            {'action': 'send', 'target_email': 'TARGET@example.com'},
+        ]}, format='json')
+        self.assertEqual(response.data['results'][0]['info'], 'A friend request is already pending between these users')
+        self.assertTrue(FriendRequest.objects.filter(from_user=self.me, to_user=target).exists())
+
+
+@override_settings(EVENT_STREAM={'BACKEND': 'users.events.LocalBackend', 'QUEUE_SIZE': 2, 'HEARTBEAT': 0.05, 'REPLAY_LIMIT': 3})
+class EventStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice@example.com', 'Alice', 'A')
+        self.bob = make_user('bob@example.com', 'Bob', 'B')
+
+    def act(self, action, user, other):
+        with self.captureOnCommitCallbacks(execute=True):
+            getattr(friend_requests, f'{action}_request')(user, other)
+
+    async def open_stream(self, user, **headers):
+        token, _ = await Token.objects.aget_or_create(user=user)
+        response = await self.async_client.get('/user/events', headers={'Authorization': f'Token {token.key}', **headers})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b': connected\n\n')
+        return stream
+
+    async def next_event(self, stream):
+        while True:
+            chunk = (await anext(stream)).decode()
+            if not chunk.startswith(':'):
+                fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+    async def test_pushes_request_lifecycle_to_both_users(self):
+        alice_stream = await self.open_stream(self.alice)
+        bob_stream = await self.open_stream(self.bob)
+        await sync_to_async(self.act)('send', self.alice, self.bob)
+        _, kind, data = await self.next_event(bob_stream)
+        self.assertEqual((kind, data['from_user']['email'], data['to_user']['id']), (events.SENT, 'alice@example.com', self.bob.id))
+        self.assertEqual((await self.next_event(alice_stream))[1], events.SENT)
+        await sync_to_async(self.act)('accept', self.bob, self.alice)
+        _, kind, data = await self.next_event(alice_stream)
+        self.assertEqual((kind, data['from_user']['id'], data['to_user']['id']), (events.ACCEPTED, self.alice.id, self.bob.id))
+
+    async def test_resumes_after_last_event_id(self):
+        carol = await sync_to_async(make_user)('carol@example.com', 'Carol', 'C')
+        await sync_to_async(self.act)('send', self.alice, self.bob)
+        await sync_to_async(self.act)('send', carol, self.bob)
+        await sync_to_async(self.act)('reject', self.bob, self.alice)
+        seqs = [seq async for seq in UserEvent.objects.filter(user=self.bob).order_by('seq').values_list('seq', flat=True)]
+        self.assertEqual(seqs, [1, 2, 3])
+        stream = await self.open_stream(self.bob, **{'Last-Event-ID': '1'})
+        replayed = [await self.next_event(stream) for _ in seqs[1:]]
+        self.assertEqual([(seq, kind) for seq, kind, _ in replayed], [(2, events.SENT), (3, events.REJECTED)])
+
+    async def test_too_many_missed_events_reset(self):
+        for name in 'cdef':
+            sender = await sync_to_async(make_user)(f'{name}@example.com', name, 'X')
+            await sync_to_async(self.act)('send', sender, self.bob)
+        stream = await self.open_stream(self.bob, **{'Last-Event-ID': '0'})
+        self.assertEqual((await self.next_event(stream))[:2], (4, events.RESET))
+
+    async def test_unknown_last_event_id_resets(self):
+        await sync_to_async(self.act)('send', self.alice, self.bob)
+        stream = await self.open_stream(self.bob, **{'Last-Event-ID': '7'})
+        self.assertEqual((await self.next_event(stream))[:2], (1, events.RESET))
+
+    async def test_event_committed_out_of_order_is_not_skipped(self):
+        carol = await sync_to_async(make_user)('carol@example.com', 'Carol', 'C')
+        stream = await self.open_stream(self.bob)
+        await asyncio.sleep(0)
+
+        def send_unannounced(sender):
+            # Committed, but its notification never arrives.
+            with self.captureOnCommitCallbacks(execute=False):
+                friend_requests.send_request(sender, self.bob)
+
+        await sync_to_async(send_unannounced)(self.alice)
+        await sync_to_async(self.act)('send', carol, self.bob)
+        received = [await self.next_event(stream) for _ in range(2)]
+        self.assertEqual([(seq, data['from_user']['email']) for seq, _, data in received], [(1, 'alice@example.com'), (2, 'carol@example.com')])
+
+    async def test_lost_notification_is_caught_up_at_the_heartbeat(self):
+        stream = await self.open_stream(self.bob)
+        await asyncio.sleep(0)
+        with self.captureOnCommitCallbacks(execute=False):
+            await sync_to_async(friend_requests.send_request)(self.alice, self.bob)
+        self.assertEqual((await self.next_event(stream))[:2], (1, events.SENT))
+
+    def test_sequences_are_per_recipient(self):
+        carol = make_user('carol@example.com', 'Carol', 'C')
+        self.act('send', self.alice, self.bob)
+        self.act('send', carol, self.bob)
+        self.act('accept', self.bob, self.alice)
+        self.assertEqual(
+            sorted(UserEvent.objects.values_list('user_id', 'seq')),
+            sorted([(self.alice.id, 1), (self.alice.id, 2), (self.bob.id, 1), (self.bob.id, 2), (self.bob.id, 3), (carol.id, 1)]),
+        )
+        self.assertEqual(UserStats.objects.get(user=self.bob).last_event_seq, 3)
+
+    async def test_slow_stream_catches_up_from_the_table(self):
+        stream = await self.open_stream(self.bob)
+        await asyncio.sleep(0)
+        for name in 'cde':  # more than QUEUE_SIZE while nobody reads
+            sender = await sync_to_async(make_user)(f'{name}@example.com', name, 'X')
+            await sync_to_async(self.act)('send', sender, self.bob)
+        await asyncio.sleep(0.01)
+        received = [await self.next_event(stream) for _ in range(3)]
+        self.assertEqual([data['from_user']['email'] for _, _, data in received], ['c@example.com', 'd@example.com', 'e@example.com'])
+        self.assertEqual(len(events.broker._subscriptions[self.bob.id]), 1)
+
+    async def test_requires_authentication_and_a_valid_id(self):
+        self.assertEqual((await self.async_client.get('/user/events')).status_code, 401)
+        token, _ = await Token.objects.aget_or_create(user=self.bob)
+        response = await self.async_client.get('/user/events', headers={'Authorization': f'Token {token.key}', 'Last-Event-ID': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(EVENT_STREAM={'BACKEND': 'users.events.LocalBackend', 'HEARTBEAT': 0.05})
+class EventStreamConnectionTests(TransactionTestCase):
+    open_stream = EventStreamTests.open_stream
+
+    async def test_idle_streams_hold_no_database_connection(self):
+        wrapper = type(connections['default'])
+        used = set()  # connections used since they were last closed
+        ensure_connection, close = wrapper.ensure_connection, wrapper.close
+
+        def tracked_ensure_connection(conn):
+            used.add(conn.alias)
+            return ensure_connection(conn)
+
+        def tracked_close(conn):
+            used.discard(conn.alias)
+            return close(conn)
+
+        users = [await sync_to_async(make_user)(f'user{i}@example.com') for i in range(3)]
+        with mock.patch.object(wrapper, 'ensure_connection', tracked_ensure_connection), \
+                mock.patch.object(wrapper, 'close', tracked_close):
+            # More streams than a pool of 2 connections could hold open.
+            for user in users:
+                stream = await self.open_stream(user)
+                self.assertEqual(await anext(stream), b': keep-alive\n\n')  # past the catch-up read
+                self.assertEqual(used, set())
+
+
+class ListPendingFriendRequestsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+        self.requests = [
+            FriendRequest.objects.create(from_user=make_user(f'sender{i}@example.com', 'Sender', str(i)), to_user=self.me)
+            for i in range(5)
+        ]
+
+    def test_pages_newest_first(self):
+        response = self.client.get('/user/pending-recieved-requests', {'page_size': 3})
+        ids = [row['id'] for row in response.data['results']]
+        ids += [row['id'] for row in self.client.get(response.data['next']).data['results']]
+        self.assertEqual(ids, [friend_request.id for friend_request in reversed(self.requests)])
+        self.assertEqual(response.data['results'][0]['from_user'], {
+            'id': self.requests[-1].from_user.id, 'username': 'sender4@example.com', 'email': 'sender4@example.com',
+        })
+
+    def test_since_returns_only_newer_requests(self):
+        self.requests[1].status = 'accepted'
+        self.requests[1].save()
+        response = self.client.get('/user/pending-recieved-requests', {'since': self.requests[0].id})
+        self.assertEqual([row['id'] for row in response.data['results']], [r.id for r in reversed(self.requests[2:])])
+        self.assertEqual(self.client.get('/user/pending-recieved-requests', {'since': 'x'}).status_code, 400)
+
+
+class ValuesSerializationTests(TestCase):
+    """
+    The list endpoints serialize ``.values()`` rows and render with orjson;
+    the output must not change.
+    """
+
+    def setUp(self):
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.friend = make_user('zoë@example.com', 'Zoë', 'Ångström\u2028')
+        Friendship.objects.create(user1=self.me, user2=self.friend)
+        self.friend_request = FriendRequest.objects.create(from_user=self.friend, to_user=self.me)
+
+    def test_rows_match_model_serializers(self):
+        users = User.objects.order_by('id')
+        self.assertEqual(user_values.to_representation(user_values.values(users)), UserSerializer(users, many=True).data)
+        edges = FriendEdge.objects.filter(user=self.me)
+        self.assertEqual(
+            friend_values.to_representation(friend_values.values(edges)),
+            UserSerializer([edge.friend for edge in edges], many=True).data,
+        )
+        requests = FriendRequest.objects.filter(to_user=self.me)
+        rows = friend_request_values.to_representation(friend_request_values.values(requests))
+        self.assertEqual(rows, FriendRequestSerializer(requests, many=True).data)
+        self.assertEqual(list(rows[0]), ['id', 'from_user', 'status'])
+
+    def test_renderer_output_matches_json_renderer(self):
+        data = {
+            'text': 'Zoë \u2028 \u2029', 'when': timezone.now(), 'number': 2 ** 70, 1: [None, 1.5, True],
+            'lazy': gettext_lazy('Not found.'),
+        }
+        for payload in (data, {'ok': [1, 2]}, [], 'plain'):
+            self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertEqual(
+            FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+            JSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+        )
+
+    def test_list_endpoints(self):
+        client = authenticated_client(self.me)
+        results = client.get('/user/friends_list').json()['results']
+        self.assertEqual(results, UserSerializer([self.friend], many=True).data)
+        results = client.get('/user/pending-recieved-requests').json()['results']
+        self.assertEqual(results, FriendRequestSerializer([self.friend_request], many=True).data)
+        results = client.get('/user/user_search/', {'search': 'zoe'}).json()['results']
+        self.assertEqual(results, UserSerializer([self.friend], many=True).data)
+
+
+class FriendSuggestionTests(TestCase):
+    def setUp(self):
+        self.users = {name: make_user(f'{name}@example.com', name.title(), 'User') for name in 'abcdef'}
+
+    def befriend(self, *pairs):
+        for pair in pairs:
+            Friendship.objects.create(user1=self.users[pair[0]], user2=self.users[pair[1]])
+        jobs.run_pending()
+
+    def suggestions(self, name):
+        return {
+            (s.candidate.email[0], s.mutual_count)
+            for s in FriendSuggestion.objects.filter(user=self.users[name]).select_related('candidate')
+        }
+
+    def test_incremental_updates_match_recompute(self):
+        self.befriend('ab', 'ac', 'bd', 'cd', 'ce', 'de', 'bc')
+        incremental = {name: self.suggestions(name) for name in 'abcdef'}
+        self.assertEqual(incremental['a'], {('d', 2), ('e', 1)})
+        self.assertNotIn('c', {candidate for candidate, _ in incremental['b']})
+
+        recompute_suggestions(chunk_size=2)
+        self.assertEqual({name: self.suggestions(name) for name in 'abcdef'}, incremental)
+
+    def test_lists_are_bounded(self):
+        self.befriend('ab', 'ac', 'ad', 'ae')
+        trim_suggestions([self.users['b'].id], top_k=2)
+        self.assertEqual(len(self.suggestions('b')), 2)
+        recompute_suggestions(top_k=1)
+        self.assertEqual(len(self.suggestions('c')), 1)
+
+    def test_endpoints(self):
+        self.befriend('ab', 'ac', 'bd', 'cd')
+        client = authenticated_client(self.users['a'])
+        response = client.get('/user/suggestions')
+        self.assertEqual(response.data, [{'user': UserSerializer(self.users['d']).data, 'mutual_count': 2}])
+        response = client.get('/user/mutual-friends', {'target_email': 'd@example.com'})
+        self.assertEqual(response.data, {'mutual_count': 2})
+        self.assertEqual(client.get('/user/mutual-friends', {'target_email': 'x@example.com'}).status_code, 404)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        jobs.task('test.record')(self.record)
+        self.addCleanup(jobs._tasks.pop, 'test.record')
+
+    def record(self, payload):
+        if payload.get('fail'):
+            raise ValueError('boom')
+        self.calls.append(payload['n'])
+        RateLimitCounter.objects.create(key='job', window_start=payload['n'])
+
+    def test_runs_due_jobs_in_order_and_batches(self):
+        for n in range(5):
+            jobs.enqueue('test.record', {'n': n})
+        jobs.enqueue('test.record', {'n': 99}, delay=60)
+        with CaptureQueriesContext(connection) as ctx:
+            outcomes = jobs.run_pending(batch_size=2)
+        self.assertEqual(outcomes, {jobs.DONE: 5})
+        claims = [query for query in ctx.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(claims), 4)  # batches of 2, 2 and 1, then an empty claim
+        self.assertEqual(self.calls, [0, 1, 2, 3, 4])
+        self.assertEqual(Job.objects.filter(status=jobs.PENDING).count(), 1)
+
+    def test_idempotency_key(self):
+        jobs.enqueue('test.record', {'n': 1}, key='once')
+        jobs.enqueue_many('test.record', [({'n': 2}, 'once'), ({'n': 3}, 'other')])
+        jobs.run_pending()
+        jobs.enqueue('test.record', {'n': 4}, key='once')
+        jobs.run_pending()
+        self.assertEqual(self.calls, [1, 3])
+        Job.objects.update(run_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(jobs.purge_finished(), 2)
+        jobs.enqueue('test.record', {'n': 5}, key='once')
+        jobs.run_pending()
+        self.assertEqual(self.calls, [1, 3, 5])
+
+    @override_settings(JOB_QUEUE={'MAX_ATTEMPTS': 3, 'RETRY_DELAY': 10})
+    def test_retries_with_backoff_then_fails(self):
+        jobs.enqueue('test.record', {'fail': True})
+        delays = []
+        for _ in range(3):
+            started = timezone.now()
+            self.assertEqual(jobs.run_pending(), {jobs.PENDING: 1} if len(delays) < 2 else {jobs.FAILED: 1})
+            job = Job.objects.get()
+            delays.append((job.run_at - started).total_seconds())
+            Job.objects.update(run_at=started)
+        self.assertTrue(5 <= delays[0] <= 10.5 and 10 <= delays[1] <= 20.5, delays)
+        self.assertEqual((job.status, job.attempts, job.last_error), (jobs.FAILED, 3, 'ValueError: boom'))
+        self.assertEqual(jobs.run_pending(), {})
+
+    def test_unknown_task_fails_at_once(self):
+        jobs.enqueue('test.missing')
+        self.assertEqual(jobs.run_pending(), {jobs.FAILED: 1})
+
+    def test_expired_lease_is_reclaimed_and_fences_the_old_worker(self):
+        jobs.enqueue('test.record', {'n': 1})
+        [stale] = jobs.claim()
+        Job.objects.update(run_at=timezone.now())  # the lease expires
+        [current] = jobs.claim()
+        self.assertEqual(jobs.run_job(stale), jobs.LOST)
+        self.assertEqual(jobs.run_job(current), jobs.DONE)
+        # Both ran, but only the current lease's writes were committed.
+        self.assertEqual(self.calls, [1, 1])
+        self.assertEqual(RateLimitCounter.objects.filter(key='job').count(), 1)
+
+    def test_suggestion_updates_do_not_depend_on_job_order(self):
+        users = {name: make_user(f'{name}@example.com', name.title(), 'User') for name in 'abcde'}
+        for pair in ('ab', 'bc', 'cd', 'ac', 'de', 'bd'):
+            Friendship.objects.create(user1=users[pair[0]], user2=users[pair[1]])
+        for age, job in enumerate(Job.objects.order_by('id')):  # run newest first
+            Job.objects.filter(pk=job.pk).update(run_at=job.run_at + timedelta(seconds=age - 60))
+        self.assertEqual(jobs.run_pending(), {jobs.DONE: 6})
+        incremental = set(FriendSuggestion.objects.values_list('user_id', 'candidate_id', 'mutual_count'))
+        recompute_suggestions()
+        self.assertEqual(set(FriendSuggestion.objects.values_list('user_id', 'candidate_id', 'mutual_count')), incremental)
+
+    def test_run_jobs_command(self):
+        jobs.enqueue('test.record', {'n': 1})
+        jobs.enqueue('test.record', {'fail': True})
+        out = io.StringIO()
+        call_command('run_jobs', '--once', stdout=out)
+        self.assertEqual(out.getvalue().strip(), '1 done, 1 to retry')
+
+
+class AsyncParityTests(TestCase):
+    """
+    The async views must answer exactly like their synchronous counterparts.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+        for i in range(3):
+            friend = make_user(f'kiran{i}@example.com', 'Kiran', str(i))
+            Friendship.objects.create(user1=self.me, user2=friend)
+            FriendRequest.objects.create(from_user=make_user(f'sender{i}@example.com', 'Sender', str(i)), to_user=self.me)
+
+    def assert_parity(self, path, params=None):
+        sync = self.client.get(f'/user/{path}', params)
+        asynchronous = self.client.get(f'/user/async/{path}', params)
+        self.assertEqual(sync.status_code, asynchronous.status_code)
+        sync_data, async_data = sync.json(), asynchronous.json()
+        for data in (sync_data, async_data):
+            if isinstance(data, dict) and data.get('next'):
+                data['next'] = data['next'].replace('/user/async/', '/user/')
+        self.assertEqual(sync_data, async_data)
+        return async_data
+
+    def test_read_endpoints(self):
+        self.assertEqual(len(self.assert_parity('user_search/', {'search': 'kiran', 'page_size': 2})['results']), 2)
+        self.assert_parity('user_search/', {'search': 'nobody'})
+        self.assert_parity('user_search/')
+        self.assert_parity('friends_list', {'page_size': 2})
+        self.assert_parity('pending-recieved-requests')
+        self.assert_parity('pending-recieved-requests', {'since': 'x'})
+
+    def test_cursor_links_work_on_async_views(self):
+        first = self.client.get('/user/async/friends_list', {'page_size': 2}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 3)
+
+    def test_authentication_is_required(self):
+        self.client.credentials()
+        sync = self.client.get('/user/friends_list')
+        asynchronous = self.client.get('/user/async/friends_list')
+        self.assertEqual((sync.status_code, sync.json()), (asynchronous.status_code, asynchronous.json()))
+        self.assertEqual(asynchronous['WWW-Authenticate'], 'Token')
+
+    def test_login(self):
+        self.client.credentials()
+        for body in ({'email': 'ME@example.com', 'password': 'pass1234!'}, {'email': 'me@example.com', 'password': 'wrong'}, {}):
+            sync = self.client.post('/user/login', body, format='json')
+            asynchronous = self.client.post('/user/async/login', body, format='json')
+            self.assertEqual((sync.status_code, sync.json()), (asynchronous.status_code, asynchronous.json()))
+
+
+@override_settings(
+    PASSWORD_HASHERS=['users.hashers.PBKDF2PolicyPasswordHasher'],
+    PASSWORD_HASH_ITERATIONS=1000,
+    PASSWORD_HASHING_POOL={'WORKERS': 0},
+)
+class PasswordHashingTests(TestCase):
+    def login(self, email, password):
+        return APIClient().post('/user/login', {'email': email, 'password': password})
+
+    def test_signup_and_login_hash_through_the_pool(self):
+        response = APIClient().post('/user/signup', {
+            'email': 'New@example.com', 'password': 'pass1234!', 'first_name': 'New', 'last_name': 'User',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(email='new@example.com').password.startswith('pbkdf2_sha256$1000$'))
+        self.assertEqual(self.login('new@example.com', 'pass1234!').status_code, 200)
+        self.assertEqual(self.login('new@example.com', 'wrong').status_code, 401)
+        self.assertEqual(self.login('nobody@example.com', 'pass1234!').status_code, 401)
+
+    def test_login_upgrades_work_factor(self):
+        user = make_user('old@example.com')
+        with self.settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(self.login('old@example.com', 'pass1234!').status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_saturated_pool_answers_503(self):
+        with mock.patch.object(HashingPool, 'run', side_effect=HashingPoolSaturated(2)):
+            response = self.login('any@example.com', 'pass1234!')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+
+    def test_pool_sheds_load_beyond_its_queue(self):
+        pool = HashingPool(workers=1, queue_size=0, timeout=10)
+        self.addCleanup(pool.shutdown)
+        self.assertIsNone(pool.run(time.sleep, 0))  # Start the worker.
+        busy = threading.Thread(target=pool.run, args=(time.sleep, 1))
+        busy.start()
+        time.sleep(0.2)
+        with self.assertRaises(HashingPoolSaturated):
+            pool.run(time.sleep, 0)
+        busy.join()
+        self.assertIsNone(pool.run(time.sleep, 0))
+
+    def test_pool_follows_settings(self):
+        self.assertEqual(get_hashing_pool().workers, 0)
+        with self.settings(PASSWORD_HASHING_POOL={'WORKERS': 2, 'QUEUE_SIZE': 4}):
+            self.assertEqual(get_hashing_pool().workers, 2)
+
+
+@override_settings(PASSWORD_HASHING_POOL={'WORKERS': 0})
+class BenchmarkDataTests(TestCase):
+    def test_generated_graph_is_consistent_and_skewed(self):
+        seeded = generate(200, friends_per_user=3, requests_per_user=2)
+        self.assertEqual(seeded['users'], 200)
+        self.assertEqual(Friendship.objects.count(), seeded['friendships'])
+        self.assertEqual(FriendRequest.objects.filter(status='accepted').count(), seeded['friendships'])
+        self.assertEqual(FriendRequest.objects.filter(status='pending').count(), seeded['pending_requests'])
+        self.assertEqual(FriendEdge.objects.count(), 2 * seeded['friendships'])
+        self.assertEqual(UserSearchIndex.objects.count(), 200)
+        self.assertFalse(FriendRequest.objects.filter(
+            status='pending', from_user__friend_edges__friend=F('to_user'),
+        ).exists())
+
+        degrees = sorted(FriendEdge.objects.values('user').annotate(n=Count('pk')).values_list('n', flat=True))
+        self.assertGreater(degrees[-1], 4 * degrees[len(degrees) // 2])
+
+    def test_percentiles_and_baseline_comparison(self):
+        samples = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(percentile(samples, 50), 0.05)
+        self.assertEqual(percentile(samples, 99), 0.099)
+        baseline = {'login': {'throughput': 100, 'p99_ms': 10, 'queries_max': 2}}
+        self.assertEqual(compare({'login': {'throughput': 95, 'p99_ms': 11, 'queries_max': 2}}, baseline, 0.2), [])
+        self.assertEqual(len(compare({'login': {'throughput': 50, 'p99_ms': 20, 'queries_max': 3}}, baseline, 0.2)), 3)
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        local_tokens.clear()
+        cache.clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.client = authenticated_client(self.me)
+
+    def test_server_timing_header(self):
+        response = self.client.get('/user/friends_list')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries, 0 duplicate", cache;desc="0 hits, 2 misses"$')
+
+    def test_duplicate_queries_are_detected(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            list(User.objects.filter(pk=self.me.pk))
+            list(User.objects.filter(pk=self.me.pk))
+            list(User.objects.filter(pk=0))
+        finally:
+            _current.reset(token)
+        self.assertEqual((metrics.queries, metrics.duplicate_queries), (3, 1))
+
+    def test_metrics_endpoint(self):
+        self.client.get('/user/friends_list')
+        self.client.get('/user/friends_list')
+        body = APIClient().get('/metrics').content.decode()
+        self.assertIn('users_requests_total{view="ListFriendsView",status="200"} 2', body)
+        self.assertIn('users_request_duration_seconds_count{view="ListFriendsView"} 2', body)
+        self.assertIn('users_cache_hits_total{view="ListFriendsView"} 2', body)  # token and page
+        self.assertRegex(body, r'users_db_queries_total\{view="ListFriendsView"\} [1-9]')
+
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(APIClient().get('/metrics').status_code, 403)
+            self.assertEqual(APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    def test_connection_and_pool_metrics(self):
+        registry.connection_opened('default')
+        stats = {'pool_size': 4, 'requests_wait_ms': 12, 'requests_errors': 1}
+        with mock.patch('users.instrumentation.pool_stats', return_value=[('default', stats)]):
+            body = registry.render()
+        self.assertIn('users_db_connections_total{alias="default"} 1', body)
+        self.assertIn('users_db_pool{alias="default",stat="requests_wait_ms"} 12', body)
+        self.assertIn('users_db_pool{alias="default",stat="requests_errors"} 1', body)
+
+    def test_sampled_profile_is_dumped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_DIR=directory):
+                self.client.get('/user/friends_list')
+            dumps = os.listdir(directory)
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].startswith('ListFriendsView-'))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.friend = make_user('friend@example.com', 'Kiran', 'Rao')
+        Friendship.objects.create(user1=self.me, user2=self.friend)
+        self.client = authenticated_client(self.me)
+
+    def test_hit_is_served_without_queries(self):
+        first = self.client.get('/user/friends_list')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get('/user/friends_list')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.json(), second.json())
+
+    def test_friendship_changes_invalidate_both_lists(self):
+        other = make_user('other@example.com', 'Other', 'User')
+        other_client = authenticated_client(other)
+        self.client.get('/user/friends_list')
+        other_client.get('/user/friends_list')
+        friendship = Friendship.objects.create(user1=other, user2=self.me)
+        self.assertEqual(len(self.client.get('/user/friends_list').json()['results']), 2)
+        self.assertEqual(len(other_client.get('/user/friends_list').json()['results']), 1)
+        friendship.delete()
+        self.assertEqual(len(self.client.get('/user/friends_list').json()['results']), 1)
+
+    def test_name_change_invalidates_friends_list(self):
+        self.client.get('/user/friends_list')
+        self.friend.first_name = 'Renamed'
+        self.friend.save()
+        self.assertEqual(self.client.get('/user/friends_list').json()['results'][0]['first_name'], 'Renamed')
+
+    def test_pending_list_follows_requests(self):
+        self.assertEqual(self.client.get('/user/pending-recieved-requests').json()['results'], [])
+        sender = make_user('sender@example.com', 'Sender', 'User')
+        friend_request = FriendRequest.objects.create(from_user=sender, to_user=self.me)
+        self.assertEqual(len(self.client.get('/user/pending-recieved-requests').json()['results']), 1)
+        friend_request.status = 'rejected'
+        friend_request.save()
+        self.assertEqual(self.client.get('/user/pending-recieved-requests').json()['results'], [])
+
+    def test_batch_writes_invalidate_pending_lists(self):
+        sender_client = authenticated_client(make_user('sender@example.com', 'Sender', 'User'))
+        self.client.get('/user/pending-recieved-requests')
+        sender_client.post('/user/friend-request/batch', {'operations': [{'action': 'send', 'target_email': 'me@example.com'}]}, format='json')
+        self.assertEqual(len(self.client.get('/user/pending-recieved-requests').json()['results']), 1)
+
+    def test_only_popular_searches_are_cached(self):
+        states = [self.client.get('/user/user_search/', {'search': 'kiran'})['X-Cache'] for _ in range(3)]
+        self.assertEqual(states, ['MISS', 'MISS', 'HIT'])
+        self.friend.first_name = 'Kiran'
+        self.friend.save(update_fields=['first_name'])
+        self.assertEqual(self.client.get('/user/user_search/', {'search': 'kiran'})['X-Cache'], 'MISS')
+
+    def test_signups_drop_cached_searches_at_most_once_per_interval(self):
+        def search():
+            response = self.client.get('/user/user_search/', {'search': 'kiran'})
+            return response['X-Cache'], response.json()['count']
+
+        cache.delete(response_cache.version_key('search', None) + ':throttle')  # set by the setUp signups
+        search()
+        search()  # stored on the second request (SEARCH_MIN_HITS)
+        make_user('kiran2@example.com', 'Kiran', 'Two')
+        self.assertEqual(search(), ('MISS', 2))
+        search()
+        make_user('kiran3@example.com', 'Kiran', 'Three')
+        self.assertEqual(search(), ('HIT', 2))
+        with override_settings(RESPONSE_CACHE={'SEARCH_INVALIDATE_INTERVAL': 0}):
+            make_user('kiran4@example.com', 'Kiran', 'Four')
+        self.assertEqual(search(), ('MISS', 4))
+
+    def test_concurrent_misses_compute_once(self):
+        request = RequestFactory().get('/user/friends_list')
+        entered, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_build():
+            calls.append('slow')
+            entered.set()
+            release.wait(5)
+            return {'value': 1}, 200
+
+        def fast_build():
+            calls.append('fast')
+            return {'value': 2}, 200
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(cached(request, 'test', 1, slow_build)))
+        first.start()
+        entered.wait(5)
+        second = threading.Thread(target=lambda: results.append(cached(request, 'test', 1, fast_build)))
+        second.start()
+        time.sleep(0.1)
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual(calls, ['slow'])
+        self.assertEqual(sorted(hit for _, _, hit in results), [False, True])
+        self.assertTrue(all(data == {'value': 1} for data, _, _ in results))
+
+
+class GraphExportImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice@example.com', 'Alice', 'Liddell')
+        self.bob = make_user('bob@example.com', 'Bob', 'Stone')
+        self.carol = make_user('carol@example.com', 'Carol', 'King')
+        Friendship.objects.create(user1=self.alice, user2=self.bob)
+        FriendRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+        FriendRequest.objects.create(from_user=self.carol, to_user=self.alice)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'graph.jsonl.gz')
+
+    def snapshot(self):
+        return (
+            list(User.objects.order_by('pk').values_list('pk', 'email', 'password', 'date_joined')),
+            list(Friendship.objects.order_by('pk').values_list('pk', 'user1_id', 'user2_id', 'created_at')),
+            list(FriendRequest.objects.order_by('pk').values_list('pk', 'from_user_id', 'to_user_id', 'status', 'created_at')),
+        )
+
+    def test_round_trip_through_commands(self):
+        before = self.snapshot()
+        call_command('export_graph', self.path, chunk_size=2, stdout=io.StringIO())
+        User.objects.all().delete()
+
+        call_command('import_graph', self.path, batch_size=2, stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), before)
+        self.assertTrue(are_friends(self.alice, self.bob))
+        self.assertTrue(UserSearchIndex.objects.filter(user=self.carol, first_name='carol').exists())
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+    def test_import_resumes_after_checkpoint(self):
+        before = self.snapshot()
+        with open_dump(self.path, 'w') as fp:
+            export_graph(fp)
+        User.objects.all().delete()
+
+        checkpoints = []
+        with open_dump(self.path) as fp:
+            import_graph(fp, batch_size=2, on_checkpoint=checkpoints.append)
+        self.assertEqual(checkpoints, [3, 4, 5, 7])
+        # Lose everything after the second batch and resume from its checkpoint.
+        FriendRequest.objects.all().delete()
+        Friendship.objects.all().delete()
+        with open_dump(self.path) as fp:
+            counts = import_graph(fp, batch_size=2, start_line=4)
+        self.assertEqual(counts, {'user': 0, 'friendship': 1, 'friend_request': 2})
+        self.assertEqual(self.snapshot(), before)
+
+    def test_rejects_foreign_files(self):
+        with open_dump(self.path, 'w') as fp:
+            fp.write('{"format": "other"}\n')
+        with open_dump(self.path) as fp, self.assertRaises(ValueError):
+            import_graph(fp)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        health.reset()
+        self.addCleanup(health.reset)
+        self.router = PrimaryReplicaRouter()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.friend = make_user('friend@example.com', 'Kiran', 'Rao')
+
+    def read_alias(self, method='GET', user=None, model=User):
+        """
+        The alias ``model`` is read from inside a request, as routed by the middleware.
+        """
+        def view(request):
+            if user is not None:
+                user_authenticated(user.pk)
+            request.alias = self.router.db_for_read(model)
+            return mock.Mock(status_code=200)
+        request = getattr(RequestFactory(), method.lower())('/')
+        ReplicaRoutingMiddleware(view)(request)
+        return request.alias
+
+    def test_reads_of_read_only_requests_go_to_a_replica(self):
+        with mock.patch('users.routers.check_replica', return_value=True):
+            self.assertIn(self.read_alias(), {'replica1', 'replica2'})
+            self.assertEqual(self.read_alias('POST'), 'default')
+            self.assertEqual(self.read_alias(model=Token), 'default')
+        self.assertEqual(self.router.db_for_read(User), 'default')  # outside a request
+        self.assertEqual(self.router.db_for_write(User), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'users'))
+
+    def test_accept_pins_both_users_to_the_primary(self):
+        FriendRequest.objects.create(from_user=self.friend, to_user=self.me)
+        with mock.patch('users.routers.check_replica', return_value=True):
+            self.assertNotEqual(self.read_alias(user=self.me), 'default')
+            response = authenticated_client(self.me).post(
+                '/user/friend-request', {'action': 'accept', 'target_email': self.friend.email},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.read_alias(user=self.me), 'default')
+            self.assertEqual(self.read_alias(user=self.friend), 'default')
+            with self.settings(DATABASE_REPLICA_PIN_SECONDS=0):
+                cache.clear()
+                self.assertNotEqual(self.read_alias(user=self.me), 'default')
+
+    def test_failed_replicas_fall_back_to_the_primary(self):
+        with mock.patch('users.routers.connections') as connections:
+            connections.__getitem__.return_value.ensure_connection.side_effect = DatabaseError('down')
+            self.assertEqual(self.read_alias(), 'default')
+            self.assertEqual(connections.__getitem__.call_count, 2)
+            # Both are skipped until DATABASE_REPLICA_RETRY_SECONDS pass.
+            self.assertEqual(self.read_alias(), 'default')
+            self.assertEqual(connections.__getitem__.call_count, 2)
+
+    def test_read_only_request_is_retried_on_the_primary(self):
+        aliases = []
+
+        def failing_read(request, *args, **kwargs):
+            alias = self.router.db_for_read(User)
+            aliases.append(alias)
+            if alias != 'default':
+                raise DatabaseError('replica went away')
+            return mock.Mock(status_code=200)
+
+        def view(request):
+            # What Django's handler does with a view exception.
+            try:
+                return failing_read(request)
+            except DatabaseError as exc:
+                return middleware.process_exception(request, exc)
+
+        middleware = ReplicaRoutingMiddleware(view)
+        request = RequestFactory().get('/')
+        request.resolver_match = mock.Mock(func=failing_read, args=(), kwargs={})
+        with mock.patch('users.routers.check_replica', return_value=True):
+            self.assertEqual(middleware(request).status_code, 200)
+        self.assertEqual(aliases[-1], 'default')
+        self.assertFalse(health.is_up(aliases[0]))
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_rate_limiter.cache_clear()
+        self.me = make_user('me@example.com', 'Me', 'Myself')
+        self.alice = make_user('alice@example.com', 'Alice', 'A')
+        self.bob = make_user('bob@example.com', 'Bob', 'B')
+        self.client = authenticated_client(self.me)
+
+    def counts(self, client=None):
+        response = (client or self.client).get('/user/counts')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['friend_count'], data['pending_received'], data['pending_sent']
+
+    def act(self, client, action, target):
+        response = client.post('/user/friend-request', {'action': action, 'target_email': target.email})
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_counts_follow_friend_request_actions(self):
+        alice = authenticated_client(self.alice)
+        self.act(self.client, 'send', self.alice)
+        self.act(authenticated_client(self.bob), 'send', self.me)
+        self.assertEqual(self.counts(), (0, 1, 1))
+        self.assertEqual(self.counts(alice), (0, 1, 0))
+
+        self.act(alice, 'accept', self.me)
+        self.act(self.client, 'reject', self.bob)
+        self.assertEqual(self.counts(), (1, 0, 0))
+        self.assertEqual(self.counts(alice), (1, 0, 0))
+        self.assertEqual(self.counts(authenticated_client(self.bob)), (0, 0, 0))
+
+    def test_batch_updates_counts(self):
+        self.act(authenticated_client(self.bob), 'send', self.me)
+        self.client.post('/user/friend-request/batch', {'operations': [
+            {'action': 'send', 'target_email': self.alice.email},
+            {'action': 'accept', 'target_email': self.bob.email},
+        ]}, format='json')
+        self.assertEqual(self.counts(), (1, 0, 1))
+
+    def test_missing_row_is_computed(self):
+        FriendRequest.objects.create(from_user=self.alice, to_user=self.me)
+        UserStats.objects.filter(user=self.me).delete()
+        self.assertEqual(self.counts(), (0, 1, 0))
+        self.assertTrue(UserStats.objects.filter(user=self.me).exists())
+
+    def test_reconcile_repairs_drift(self):
+        FriendRequest.objects.create(from_user=self.alice, to_user=self.me)  # bypasses the counters
+        Friendship.objects.create(user1=self.me, user2=self.bob)
+        UserStats.objects.filter(user=self.bob).delete()
+        self.assertEqual(reconcile_stats(chunk_size=2), (3, 3))
+        self.assertEqual(self.counts(), (1, 1, 0))
+        self.assertEqual(UserStats.objects.get(user=self.alice).pending_sent, 1)
+        self.assertEqual(UserStats.objects.get(user=self.bob).friend_count, 1)
+        self.assertEqual(reconcile_stats(), (3, 0))
+
+        out = io.StringIO()
+        call_command('reconcile_user_stats', stdout=out)
+        self.assertIn('Checked 3 users, repaired 0', out.getvalue())
+
+
+class FriendRequestServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice@example.com', 'Alice', 'A')
+        self.bob = make_user('bob@example.com', 'Bob', 'B')
+
+    def test_mutual_requests_become_a_friendship(self):
+        self.assertEqual(friend_requests.send_request(self.bob, self.alice), friend_requests.SENT)
+        self.assertEqual(friend_requests.send_request(self.alice, self.bob), friend_requests.ACCEPTED)
+        self.assertEqual(list(Friendship.objects.values_list('user1_id', 'user2_id')), [(self.alice.pk, self.bob.pk)])
+        self.assertEqual(friend_requests.send_request(self.bob, self.alice), friend_requests.ALREADY_FRIENDS)
+        self.assertEqual(friend_requests.accept_request(self.alice, self.bob), friend_requests.NO_PENDING_REQUEST)
+
+    def test_rejected_request_is_sent_again_as_a_new_request(self):
+        friend_requests.send_request(self.alice, self.bob)
+        rejected = FriendRequest.objects.get()
+        self.assertEqual(friend_requests.reject_request(self.bob, self.alice), friend_requests.REJECTED)
+        self.assertEqual(friend_requests.send_request(self.alice, self.bob), friend_requests.SENT)
+        resent = FriendRequest.objects.get()
+        self.assertEqual(resent.status, 'pending')
+        self.assertGreater((resent.pk, resent.created_at), (rejected.pk, rejected.created_at))
+        self.assertEqual(UserStats.objects.get(user=self.bob).pending_received, 1)
+        # Clients polling for requests newer than the rejected one see it.
+        response = authenticated_client(self.bob).get('/user/pending-recieved-requests', {'since': rejected.pk})
+        self.assertEqual([row['id'] for row in response.data['results']], [resent.pk])
+
+    def test_friendships_are_stored_in_canonical_order(self):
+        friendship = Friendship.objects.create(user1=self.bob, user2=self.alice)
+        self.assertEqual((friendship.user1_id, friendship.user2_id), (self.alice.pk, self.bob.pk))
+
+
+class FriendRequestConcurrencyTests(TransactionTestCase):
+    """
+    Many threads acting on a handful of users at once, each thread with its
+    own database connection. SQLite refuses concurrent writers ("database is
+    locked") instead of queueing them; those attempts are simply retried.
+    """
+    workers = 8
+    actions_per_worker = 40
+
+    def setUp(self):
+        cache.clear()
+        self.users = [make_user(f'user{i}@example.com', 'User', str(i)) for i in range(5)]
+
+    def run_concurrently(self, *tasks):
+        barrier = threading.Barrier(len(tasks))
+        errors = []
+
+        def run(task):
+            try:
+                barrier.wait()
+                task()
+            except Exception as exc:  # reported by the main thread
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(task,)) for task in tasks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    @staticmethod
+    def attempt(action, *args):
+        for _ in range(100):
+            try:
+                return action(*args)
+            except OperationalError:
+                if connection.vendor != 'sqlite':
+                    raise
+                time.sleep(0.005)
+        raise AssertionError('database stayed locked')
+
+    def test_crossing_sends_make_one_friendship(self):
+        alice, bob = self.users[:2]
+        outcomes = []
+        self.run_concurrently(
+            lambda: outcomes.append(self.attempt(friend_requests.send_request, alice, bob)),
+            lambda: outcomes.append(self.attempt(friend_requests.send_request, bob, alice)),
+        )
+        self.assertEqual(sorted(outcomes), [friend_requests.ACCEPTED, friend_requests.SENT])
+        self.assertEqual(Friendship.objects.count(), 1)
+        self.assertEqual(FriendEdge.objects.count(), 2)
+        self.assertFalse(FriendRequest.objects.filter(status='pending').exists())
+
+    def test_random_actions_keep_the_graph_consistent(self):
+        actions = (friend_requests.send_request, friend_requests.accept_request, friend_requests.reject_request)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(self.actions_per_worker):
+                user, other = rng.sample(self.users, 2)
+                self.attempt(rng.choice(actions), user, other)
+
+        self.run_concurrently(*[lambda seed=seed: worker(seed) for seed in range(self.workers)])
+
+        friendships = list(Friendship.objects.values_list('user1_id', 'user2_id'))
+        self.assertEqual(len(friendships), len(set(friendships)))
+        self.assertTrue(all(user1_id < user2_id for user1_id, user2_id in friendships))
+        self.assertEqual(FriendEdge.objects.count(), 2 * len(friendships))
+        pending = set(FriendRequest.objects.filter(status='pending').values_list('from_user_id', 'to_user_id'))
+        for from_user_id, to_user_id in pending:
+            self.assertNotIn((to_user_id, from_user_id), pending)
+            self.assertNotIn(Friendship.canonical(from_user_id, to_user_id), friendships)
+        for user1_id, user2_id in friendships:
+            self.assertTrue(FriendRequest.objects.filter(
+                Q(from_user_id=user1_id, to_user_id=user2_id) | Q(from_user_id=user2_id, to_user_id=user1_id),
+                status='accepted',
+            ).exists())
+        # Counters match the rows.
+        self.assertEqual(reconcile_stats()[1], 0)
+
+
+@override_settings(MIDDLEWARE=api_settings.MIDDLEWARE)
+class ApiProfileTests(TestCase):
+    """
+    The API works with the short middleware stack of the API-only profile.
+    """
+    def setUp(self):
+        cache.clear()
+        get_rate_limiter.cache_clear()
+
+    def test_endpoints_without_session_and_csrf_middleware(self):
+        self.assertNotIn('django.contrib.admin', api_settings.INSTALLED_APPS)
+        client = APIClient(enforce_csrf_checks=True)
+        response = client.post('/user/signup', {
+            'email': 'new@example.com', 'password': 'pass1234!', 'first_name': 'New', 'last_name': 'User',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('sessionid', response.cookies)
+
+        client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+        friend = make_user('friend@example.com', 'Kiran', 'Rao')
+        response = client.post('/user/friend-request', {'action': 'send', 'target_email': friend.email})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get('/user/counts').json()['pending_sent'], 1)
+        self.assertEqual(APIClient().get('/user/friends_list').status_code, 401)
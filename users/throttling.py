@@ -0,0 +1,82 @@
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .ratelimit import get_rate_limiter, parse_rate
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    DRF throttle backed by the shared ``users.ratelimit`` backend.
+
+    The rate for ``scope`` is read from ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``.
+    Requests are keyed by user when authenticated and by client address
+    otherwise. When a request is refused DRF answers 429 with a ``Retry-After``
+    header taken from ``wait()``.
+    """
+    scope = None
+
+    def __init__(self):
+        rates = getattr(settings, 'REST_FRAMEWORK', {}).get('DEFAULT_THROTTLE_RATES', {})
+        self.limit, self.window = parse_rate(rates.get(self.scope))
+        self.result = None
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'{self.scope}:user:{request.user.pk}'
+        return f'{self.scope}:ip:{self.get_ident(request)}'
+
+    def get_cost(self, request, view):
+        return 1
+
+    def allow_request(self, request, view):
+        if self.limit is None:
+            return True
+        cost = self.get_cost(request, view)
+        if not cost:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        self.result = get_rate_limiter().hit(key, self.limit, self.window, cost=cost)
+        return self.result.allowed
+
+    def wait(self):
+        if self.result is None or self.result.allowed:
+            return None
+        return self.result.retry_after
+
+
+class SignupThrottle(SlidingWindowThrottle):
+    scope = 'signup'
+
+
+class LoginThrottle(SlidingWindowThrottle):
+    scope = 'login'
+
+
+class UserSearchThrottle(SlidingWindowThrottle):
+    scope = 'user_search'
+
+
+class FriendRequestThrottle(SlidingWindowThrottle):
+    """
+    Limits how many friend requests a user may send; accepting and rejecting
+    are not counted.
+    """
+    scope = 'friend_request'
+
+    def get_cost(self, request, view):
+        return 1 if request.data.get('action') == 'send' else 0
+
+
+class FriendRequestBatchThrottle(FriendRequestThrottle):
+    """
+    Charges a batch one unit per 'send' operation against the same budget as
+    single friend requests, so a batch cannot be used to bypass the limit.
+    """
+
+    def get_cost(self, request, view):
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list):
+            return 0
+        return sum(1 for op in operations if isinstance(op, dict) and op.get('action') == 'send')
@@ -1,11 +1,24 @@
 from django.urls import path
-from .views import SignupView, LoginView,UserSearchView,FriendRequestView,ListFriendsView,ListPendingFriendRequestsView
+from .views import SignupView, LoginView,UserSearchView,FriendRequestView,FriendRequestBatchView,ListFriendsView,ListPendingFriendRequestsView,FriendSuggestionsView,MutualFriendsView,UserCountsView
+from .async_views import AsyncLoginView, AsyncUserSearchView, AsyncListFriendsView, AsyncListPendingFriendRequestsView, EventStreamView
 app_name = 'users'
 urlpatterns = [
     path('signup', SignupView.as_view(), name='signup'),
     path('login', LoginView.as_view(), name='login'),
     path('user_search/', UserSearchView.as_view(), name='user_search'),
     path('friend-request', FriendRequestView.as_view(), name='friend_request'),
+    path('friend-request/batch', FriendRequestBatchView.as_view(), name='friend_request_batch'),
     path('friends_list', ListFriendsView.as_view(), name='friends_list'),
-    path('pending-recieved-requests', ListPendingFriendRequestsView.as_view(), name='pending_requests')
+    path('pending-recieved-requests', ListPendingFriendRequestsView.as_view(), name='pending_requests'),
+    path('suggestions', FriendSuggestionsView.as_view(), name='suggestions'),
+    path('mutual-friends', MutualFriendsView.as_view(), name='mutual_friends'),
+    path('counts', UserCountsView.as_view(), name='counts'),
+
+    # Async variants of the read endpoints and login (served best by an ASGI worker).
+    path('async/login', AsyncLoginView.as_view(), name='async_login'),
+    path('async/user_search/', AsyncUserSearchView.as_view(), name='async_user_search'),
+    path('async/friends_list', AsyncListFriendsView.as_view(), name='async_friends_list'),
+    path('async/pending-recieved-requests', AsyncListPendingFriendRequestsView.as_view(), name='async_pending_requests'),
+    # Server-Sent Events push of friend request changes (ASGI only).
+    path('events', EventStreamView.as_view(), name='events'),
 ]
\ No newline at end of file
@@ -1,27 +1,62 @@
+import math
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from rest_framework import status
+from rest_framework.exceptions import Throttled
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from rest_framework import generics, permissions
-from .pagination import UserSearchPagination
+from .pagination import FriendsPagination, PendingRequestsPagination, UserSearchPagination
 from rest_framework.permissions import IsAuthenticated
-from django.core.cache import cache
 from .models import FriendRequest, Friendship
-from .serializers import UserSerializer,FriendRequestSerializer
-from django.utils.timezone import now
-from datetime import timedelta
-
+from . import events, friend_requests, hashing, response_cache, routers
+from .emails import normalize_email, users_with_email
+from .graph import add_friend_edges_bulk, friends_of
+from .search import search_users
+from .stats import StatsDelta, counts_for
+from .suggestions import TOP_K as SUGGESTIONS_TOP_K, enqueue_record_friendships, mutual_friend_count, top_suggestions
+from .serializers import FriendSuggestionSerializer, friend_request_values, friend_values, user_values
+from .throttling import FriendRequestBatchThrottle, FriendRequestThrottle, LoginThrottle, SignupThrottle, UserSearchThrottle
+
+
+FRIEND_REQUEST_LIMIT_MESSAGE = 'Request limit exceeded. You can only send 3 requests per minute.'
+
+FRIEND_REQUEST_ACTIONS = {
+    'send': friend_requests.send_request,
+    'accept': friend_requests.accept_request,
+    'reject': friend_requests.reject_request,
+}
+
+FRIEND_REQUEST_OUTCOMES = {
+    friend_requests.SENT: (status.HTTP_200_OK, {'status': 'Friend request sent'}),
+    friend_requests.ACCEPTED: (status.HTTP_200_OK, {'status': 'Friend request accepted'}),
+    friend_requests.REJECTED: (status.HTTP_200_OK, {'status': 'Friend request rejected'}),
+    friend_requests.ALREADY_PENDING: (status.HTTP_400_BAD_REQUEST, {'info': 'A friend request is already pending between these users'}),
+    friend_requests.ALREADY_FRIENDS: (status.HTTP_400_BAD_REQUEST, {'info': 'A friend request has already been accepted between these users'}),
+    friend_requests.NO_PENDING_REQUEST: (status.HTTP_400_BAD_REQUEST, {'error': 'No pending request found'}),
+}
+
+
+def friend_request_limit_response(wait):
+    """
+    The 429 of the friend request endpoints: the ``{"error": ...}`` body they have
+    always returned, rather than DRF's ``{"detail": ...}``, and a ``Retry-After``.
+    """
+    headers = {'Retry-After': '%d' % math.ceil(wait)} if wait is not None else None
+    return Response({'error': FRIEND_REQUEST_LIMIT_MESSAGE}, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=headers)
 
 
-    
-
 class SignupView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [SignupThrottle]
 
     def post(self, request):
         email = request.data.get('email')
@@ -32,24 +67,29 @@ class SignupView(APIView):
         if not email or not password or not first_name or not last_name:
             return Response({'error': 'Email, password, first name, and last name are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        email = email.lower()
+        email = normalize_email(email)
 
         try:
             validate_email(email)
         except ValidationError:
             return Response({'error': 'Invalid email format'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if User.objects.filter(email=email).exists():
-            return Response({'error': 'Email is already in use'}, status=status.HTTP_400_BAD_REQUEST)
-
-        user = User.objects.create_user(
+        # Hashed in the bounded pool; raises HashingPoolSaturated (503) when full.
+        user = User(
             username=email,
             email=email,
-            password=password,
             first_name=first_name,
             last_name=last_name
         )
-        token = Token.objects.create(user=user)
+        user.password = hashing.make_password(password)
+        try:
+            # The unique email index (users.emails) rejects an address in use,
+            # including one taken by a concurrent signup.
+            with transaction.atomic():
+                user.save()
+                token = Token.objects.create(user=user)
+        except IntegrityError:
+            return Response({'error': 'Email is already in use'}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'token': token.key}, status=status.HTTP_201_CREATED)
 
 
@@ -59,6 +99,7 @@ class SignupView(APIView):
 
 class LoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [LoginThrottle]
 
     def post(self, request):
         email = request.data.get('email')
@@ -88,14 +129,19 @@ class UserSearchView(APIView):
 
     This view allows authenticated users to search for other users in the system.
     The search can be performed using a keyword, which can be either a part of the
-    first name, last name, or the exact email address of the user.
+    first name, last name, or the exact email address of the user. Name matches are
+    served from the normalized ``UserSearchIndex`` table (see ``users.search``) and
+    ranked exact match first, then prefix, then substring, newest users first within a rank.
 
-    Pagination is applied to the search results to limit the number of users returned in a single response.
+    Keyset (cursor) pagination is applied to the search results to limit the number of
+    users returned in a single response; follow the ``next``/``previous`` links to page.
+    Pages of popular queries are kept in the shared response cache (``users.response_cache``)
+    until a user's name or email changes; the ``X-Cache`` header tells whether it was used.
 
     Attributes:
         permission_classes (list): Specifies that only authenticated users can access this view.
         pagination_class (class): Defines the pagination class used to paginate the search results.
-        serializer_class (class): Specifies the serializer class used to serialize the user data.
+        serializer (ValuesSerializer): Serializes the user rows, read with ``.values()``, like `UserSerializer`.
 
     Methods:
         get(self, request, *args, **kwargs):
@@ -113,36 +159,27 @@ class UserSearchView(APIView):
                     - Returns a paginated JSON response containing the serialized user data and a 200 HTTP status.
     """
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserSearchThrottle]
     pagination_class = UserSearchPagination
-    serializer_class = UserSerializer
+    serializer = user_values
 
     def get(self, request, *args, **kwargs):
         search_keyword = request.query_params.get('search', '').lower()
         if not search_keyword:
             return Response({'error': 'No search keyword provided'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if '@' in search_keyword:
-            users = User.objects.filter(email__iexact=search_keyword)
-        else:
-            users = User.objects.filter(first_name__icontains=search_keyword) | User.objects.filter(last_name__icontains=search_keyword)
-
-        if not users.exists():
-            return Response({'error': 'No users found matching the search criteria'}, status=status.HTTP_404_NOT_FOUND)
+        data, status_code, hit = response_cache.cached_search(request, lambda: self.search(request, search_keyword))
+        return Response(data, status=status_code, headers={'X-Cache': 'HIT' if hit else 'MISS'})
 
-        users = users.order_by('-date_joined')
-
-        serializer = self.get_serializer(users, many=True)
+    def search(self, request, search_keyword):
+        users = search_users(search_keyword)
 
         paginator = self.pagination_class()
-        page = paginator.paginate_queryset(users, request, view=self)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return paginator.get_paginated_response(serializer.data)
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        page = paginator.paginate_queryset(self.serializer.values(users, *paginator.ordering_fields), request, view=self)
+        if not page and not paginator.has_previous:
+            return {'error': 'No users found matching the search criteria'}, status.HTTP_404_NOT_FOUND
 
-    def get_serializer(self, *args, **kwargs):
-        return self.serializer_class(*args, **kwargs)
+        return paginator.get_paginated_data(self.serializer.to_representation(page)), status.HTTP_200_OK
 
 
 class FriendRequestView(APIView):
@@ -151,7 +188,8 @@ class FriendRequestView(APIView):
 
     This view allows authenticated users to send, accept, or reject friend requests
     to other users. The actions are determined based on the 'action' parameter sent
-    in the request body.
+    in the request body and carried out by ``users.friend_requests``, one transaction
+    per action, so concurrent actions on the same pair of users cannot interleave.
 
     Attributes:
         permission_classes (list): Specifies that only authenticated users can access this view.
@@ -174,12 +212,15 @@ class FriendRequestView(APIView):
                     - Returns a JSON response with an error message and a 400 HTTP status.
 
                 - If 'send' action is chosen:
-                    - If the user has already sent 3 requests within the last minute:
-                        - Returns a JSON response with an error message and a 429 HTTP status.
-                    - If there is an existing pending or accepted friend request:
+                    - If the user has already sent 3 requests within the last minute (enforced by
+                      `FriendRequestThrottle` before the view runs, shared across all workers):
+                        - Returns a JSON response with an error message, a `Retry-After` header and a 429 HTTP status.
+                    - If the target user has a pending request to the user:
+                        - Accepts it, creates the friendship, and returns "Friend request accepted" with a 200 HTTP status.
+                    - If there is an existing pending request to the target or the users are already friends:
                         - Returns a JSON response with an appropriate message and a 400 HTTP status.
                     - If no issues are found:
-                        - Creates a new friend request, updates the request count, and returns a JSON response with a 200 HTTP status.
+                        - Creates a new friend request (or reopens a rejected one) and returns a JSON response with a 200 HTTP status.
 
                 - If 'accept' action is chosen:
                     - If there is no pending request from the target user:
@@ -197,6 +238,12 @@ class FriendRequestView(APIView):
                     - Returns a JSON response with an error message and a 400 HTTP status.
     """
     permission_classes = [IsAuthenticated]
+    throttle_classes = [FriendRequestThrottle]
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Throttled):
+            return friend_request_limit_response(exc.wait)
+        return super().handle_exception(exc)
 
     def post(self, request):
         action = request.data.get('action')
@@ -206,67 +253,205 @@ class FriendRequestView(APIView):
         if not action or not target_email:
             return Response({'error': 'Action and email are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        target_user = User.objects.filter(email=target_email).first()
+        target_user = users_with_email(target_email).first()
         if not target_user:
             return Response({'error': 'Target user not found'}, status=status.HTTP_404_NOT_FOUND)
 
         if user == target_user:
             return Response({'error': 'You cannot send, accept, or reject a friend request to yourself'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if action == 'send':
-            # Key for tracking request count
-            request_key = f"friend_request_count_{user.id}"
-            request_count = cache.get(request_key, 0)
-            request_time_key = f"friend_request_time_{user.id}"
-            last_request_time = cache.get(request_time_key)
+        if action not in FRIEND_REQUEST_ACTIONS:
+            return Response({'error': 'Invalid action'}, status=status.HTTP_400_BAD_REQUEST)
 
-            if last_request_time and now() - last_request_time < timedelta(minutes=1):
-                if request_count >= 3:
-                    return Response({'error': 'Request limit exceeded. You can only send 3 requests per minute.'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
-            else:
-                # Reset request count and time if more than a minute has passed
-                request_count = 0
-                cache.set(request_time_key, now(), timeout=60)
+        outcome = FRIEND_REQUEST_ACTIONS[action](user, target_user)
+        if outcome == friend_requests.ACCEPTED:
+            # The middleware pins the acting user; the sender should see
+            # the new friendship straight away too.
+            routers.pin_to_primary(target_user.pk)
+        status_code, body = FRIEND_REQUEST_OUTCOMES[outcome]
+        return Response(body, status=status_code)
 
-            # Check for existing friend requests
-            existing_request = FriendRequest.objects.filter(
-                from_user=user, to_user=target_user
-            ).first() or FriendRequest.objects.filter(
-                from_user=target_user, to_user=user
-            ).first()
 
-            if existing_request:
-                if existing_request.status == 'pending':
-                    return Response({'info': 'A friend request is already pending between these users'}, status=status.HTTP_400_BAD_REQUEST)
-                elif existing_request.status == 'accepted':
-                    return Response({'info': 'A friend request has already been accepted between these users'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Create new friend request
-            FriendRequest.objects.create(from_user=user, to_user=target_user)
 
-            # Update request count and store it in the cache
-            cache.set(request_key, request_count + 1, timeout=60)
 
-            return Response({'status': 'Friend request sent'}, status=status.HTTP_200_OK)
 
-        elif action == 'accept':
-            request = FriendRequest.objects.filter(from_user=target_user, to_user=user, status='pending').first()
-            if not request:
-                return Response({'error': 'No pending request found'}, status=status.HTTP_400_BAD_REQUEST)
-            request.status = 'accepted'
-            request.save()
-            Friendship.objects.get_or_create(user1=user, user2=target_user)
-            return Response({'status': 'Friend request accepted'}, status=status.HTTP_200_OK)
+class FriendRequestBatchView(APIView):
+    """
+    API endpoint for applying many friend request actions in one call.
 
-        elif action == 'reject':
-            request = FriendRequest.objects.filter(from_user=target_user, to_user=user, status='pending').first()
-            if not request:
-                return Response({'error': 'No pending request found'}, status=status.HTTP_400_BAD_REQUEST)
-            request.status = 'rejected'
-            request.save()
-            return Response({'status': 'Friend request rejected'}, status=status.HTTP_200_OK)
+    The body is ``{"operations": [{"action": ..., "target_email": ...}, ...]}`` with the same
+    actions as `FriendRequestView`. All target users are resolved with one query. Then, in a
+    single transaction that holds the pair locks of ``users.friend_requests`` for every target
+    (so the batch cannot interleave with single requests or other batches on the same pairs),
+    all existing friend requests between the authenticated user and the targets are loaded with
+    one query, and the resulting inserts and conditional status changes are written in bulk.
+    Operations are applied in order, so a batch may e.g. accept a request and then be told the
+    next 'send' to the same user is already accepted.
 
-        return Response({'error': 'Invalid action'}, status=status.HTTP_400_BAD_REQUEST)
+    Attributes:
+        permission_classes (list): Specifies that only authenticated users can access this view.
+        throttle_classes (list): Every 'send' operation counts against the friend request rate limit.
+        max_operations (int): The largest accepted batch (``FRIEND_REQUEST_BATCH_MAX_OPERATIONS``).
+
+    Methods:
+        post(self, request):
+            Input:
+                - request (Request): The HTTP request object containing the `operations` list.
+
+            Output:
+                - If `operations` is missing, empty, not a list or too long:
+                    - Returns a JSON response with an error message and a 400 HTTP status.
+                - If the batch contains more sends than the rate limit currently allows:
+                    - Returns a JSON response with an error message, a `Retry-After` header and a 429 HTTP status.
+                - Otherwise:
+                    - Returns ``{"results": [...]}`` with a 200 HTTP status. Each result echoes the
+                      operation's `action` and `target_email` and carries the HTTP `status_code` and
+                      message the single-request endpoint would have returned for it.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [FriendRequestBatchThrottle]
+
+    @property
+    def max_operations(self):
+        return settings.FRIEND_REQUEST_BATCH_MAX_OPERATIONS
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Throttled):
+            return friend_request_limit_response(exc.wait)
+        return super().handle_exception(exc)
+
+    def post(self, request):
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return Response({'error': 'A non-empty list of operations is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > self.max_operations:
+            return Response({'error': f'At most {self.max_operations} operations are allowed per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        emails = {op.get('target_email') for op in operations if isinstance(op, dict) and isinstance(op.get('target_email'), str)}
+        targets = {normalize_email(target.email): target for target in users_with_email(*emails)} if emails else {}
+
+        target_ids = [target.id for target in targets.values()]
+        with transaction.atomic():
+            friend_requests.lock_pairs([(user.id, target_id) for target_id in target_ids])
+            # Latest known request in each direction, keyed by (from_user_id, to_user_id).
+            existing = {
+                (friend_request.from_user_id, friend_request.to_user_id): friend_request
+                for friend_request in FriendRequest.objects.filter(
+                    Q(from_user=user, to_user_id__in=target_ids) | Q(from_user_id__in=target_ids, to_user=user)
+                )
+            }
+
+            # Targets of rejected requests sent by the user, which a 'send' replaces.
+            rejected = {
+                to_user_id for (from_user_id, to_user_id), friend_request in existing.items()
+                if from_user_id == user.id and friend_request.status == 'rejected'
+            }
+            to_create, to_update, friendships = {}, {}, {}
+            delta = StatsDelta()
+            batch = events.EventBatch()
+            results = []
+            for op in operations:
+                op = op if isinstance(op, dict) else {}
+                action, target_email = op.get('action'), op.get('target_email')
+                target_user = targets.get(normalize_email(target_email)) if isinstance(target_email, str) else None
+                code, body = self.apply(user, action, target_user, existing, to_create, to_update, friendships, delta, batch, bool(target_email))
+                results.append({'action': action, 'target_email': target_email, 'status_code': code, **body})
+
+            friend_requests.replace_rejected(user.id, [target_id for target_id in to_create if target_id in rejected])
+            FriendRequest.objects.bulk_create(to_create.values())
+            # Conditional on the status that was read, as in users.friend_requests.
+            transitions = {}
+            for old_status, friend_request in to_update.values():
+                transitions.setdefault((old_status, friend_request.status), []).append(friend_request.pk)
+            for (old_status, new_status), pks in transitions.items():
+                FriendRequest.objects.filter(pk__in=pks, status=old_status).update(status=new_status)
+
+            new_friends = self.new_friendships(user, friendships)
+            Friendship.objects.bulk_create(
+                [Friendship(user1_id=min(user.id, target.id), user2_id=max(user.id, target.id)) for target in new_friends],
+                ignore_conflicts=True,
+            )
+            for target in new_friends:
+                delta.friendship_added(user.id, target.id)
+            add_friend_edges_bulk([(user, target) for target in new_friends])
+            enqueue_record_friendships([(user.id, target.id) for target in new_friends])
+            delta.apply()
+            batch.record()
+            # Bulk writes send no signals; drop the cached pending lists here.
+            changed = [*to_create.values(), *(friend_request for _, friend_request in to_update.values())]
+            response_cache.invalidate('pending', *[friend_request.to_user_id for friend_request in changed])
+
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def new_friendships(user, friendships):
+        """
+        The users of ``friendships`` (target id -> user) who are not friends of ``user`` yet.
+        """
+        if not friendships:
+            return []
+        pairs = Q()
+        for target_id in friendships:
+            user1_id, user2_id = Friendship.canonical(user.id, target_id)
+            pairs |= Q(user1_id=user1_id, user2_id=user2_id)
+        known = {
+            user2_id if user1_id == user.id else user1_id
+            for user1_id, user2_id in Friendship.objects.filter(pairs).values_list('user1_id', 'user2_id')
+        }
+        return [target for target_id, target in friendships.items() if target_id not in known]
+
+    @staticmethod
+    def apply(user, action, target_user, existing, to_create, to_update, friendships, delta, batch, has_email):
+        """
+        Apply one operation to the in-memory state (its request count changes
+        to ``delta`` and its events to ``batch``; friendships are counted once
+        inserted) and return ``(status_code, body)``.
+        """
+        if not action or not has_email:
+            return status.HTTP_400_BAD_REQUEST, {'error': 'Action and email are required'}
+        if not target_user:
+            return status.HTTP_404_NOT_FOUND, {'error': 'Target user not found'}
+        if user == target_user:
+            return status.HTTP_400_BAD_REQUEST, {'error': 'You cannot send, accept, or reject a friend request to yourself'}
+
+        sent = existing.get((user.id, target_user.id))
+        received = existing.get((target_user.id, user.id))
+
+        if action == 'send' and received and received.status == 'pending':
+            # Mutual requests become a friendship, as in users.friend_requests.
+            action = 'accept'
+
+        if action == 'send':
+            for friend_request in (sent, received):
+                if friend_request and friend_request.status == 'pending':
+                    return status.HTTP_400_BAD_REQUEST, {'info': 'A friend request is already pending between these users'}
+                if friend_request and friend_request.status == 'accepted':
+                    return status.HTTP_400_BAD_REQUEST, {'info': 'A friend request has already been accepted between these users'}
+            # A previously rejected request is replaced by the new one, see post().
+            sent = FriendRequest(from_user=user, to_user=target_user)
+            existing[(user.id, target_user.id)] = sent
+            to_create[target_user.id] = sent
+            delta.request_sent(user.id, target_user.id)
+            batch.add(events.SENT, user, target_user)
+            return status.HTTP_200_OK, {'status': 'Friend request sent'}
+
+        if action in ('accept', 'reject'):
+            if not received or received.status != 'pending':
+                return status.HTTP_400_BAD_REQUEST, {'error': 'No pending request found'}
+            if received.pk:
+                to_update[received.pk] = (received.status, received)
+            received.status = 'accepted' if action == 'accept' else 'rejected'
+            delta.request_answered(target_user.id, user.id)
+            if action == 'accept':
+                friendships[target_user.id] = target_user
+                batch.add(events.ACCEPTED, target_user, user)
+                return status.HTTP_200_OK, {'status': 'Friend request accepted'}
+            batch.add(events.REJECTED, target_user, user)
+            return status.HTTP_200_OK, {'status': 'Friend request rejected'}
+
+        return status.HTTP_400_BAD_REQUEST, {'error': 'Invalid action'}
 
 
 
@@ -276,12 +461,15 @@ class ListFriendsView(APIView):
     """
     API endpoint to list all friends of the authenticated user.
 
-    This view retrieves the list of friends for the authenticated user by checking both
-    sides of the Friendship relationship (i.e., where the user is either user1 or user2).
-    The friends are then returned in descending order based on the date they joined.
+    This view reads the user's rows of the ``FriendEdge`` adjacency list (see ``users.graph``),
+    which holds every friendship from both sides, so one indexed range scan returns the friends
+    in descending order of the date they joined. The list is paginated with keyset cursors.
+    Pages are served from the shared response cache (``users.response_cache``) until one of
+    the user's friendships or a friend's name changes.
 
     Attributes:
         permission_classes (list): Specifies that only authenticated users can access this view.
+        pagination_class (class): Defines the pagination class used to paginate the friends list.
 
     Methods:
         get(self, request, *args, **kwargs):
@@ -289,51 +477,179 @@ class ListFriendsView(APIView):
 
             Input:
                 - request (Request): The HTTP request object that contains user authentication.
+                  The optional `cursor` and `page_size` query parameters select the page.
 
             Output:
                 - If the user has no friends:
                     - Returns a JSON response with the message "No friends yet" and a 200 HTTP status.
                 - If the user has friends:
-                    - Returns a serialized list of friends, ordered by the date they joined, and a 200 HTTP status.
+                    - Returns a page of serialized friends, ordered by the date they joined, with
+                      `next`/`previous` links and a 200 HTTP status.
     """
     permission_classes = [IsAuthenticated]
+    pagination_class = FriendsPagination
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        
-        friendships_as_user1 = Friendship.objects.filter(user1=user)
-        friendships_as_user2 = Friendship.objects.filter(user2=user)
-        
-        # Extract friends from both queries
-        friends = []
-        for friendship in friendships_as_user1:
-            friends.append(friendship.user2)
-        for friendship in friendships_as_user2:
-            friends.append(friendship.user1)
-        
-        friends = list(set(friends))
-        
-        # Get the user objects from the list of friend IDs
-        friends = User.objects.filter(id__in=[friend.id for friend in friends]).order_by('-date_joined')
-        
-        # Serialize and return the friends
-        serializer = UserSerializer(friends, many=True)
-        if not serializer.data:
-            return Response({"message": "No friends yet"}, status=status.HTTP_200_OK)
+        data, status_code, hit = response_cache.cached(request, 'friends', request.user.pk, lambda: self.list_friends(request))
+        return Response(data, status=status_code, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+    def list_friends(self, request):
+        paginator = self.pagination_class()
+        edges = paginator.paginate_queryset(friend_values.values(friends_of(request.user), *paginator.ordering_fields), request, view=self)
+        if not edges and not paginator.has_previous:
+            return {"message": "No friends yet"}, status.HTTP_200_OK
+
+        return paginator.get_paginated_data(friend_values.to_representation(edges)), status.HTTP_200_OK
+
+
+
+    
+class FriendSuggestionsView(APIView):
+    """
+    API endpoint listing "people you may know" for the authenticated user.
+
+    Suggestions are friends of friends who are not yet friends with the user, ranked by the
+    number of mutual friends. They are precomputed (see ``users.suggestions``), so this reads at
+    most `limit` rows from the user's bounded suggestion list.
+
+    Attributes:
+        permission_classes (list): Specifies that only authenticated users can access this view.
+
+    Methods:
+        get(self, request, *args, **kwargs):
+            Input:
+                - request (Request): The HTTP request object. The optional `limit` query parameter
+                  (at most ``FRIEND_SUGGESTIONS_TOP_K``) caps the number of suggestions.
+
+            Output:
+                - Returns a list of ``{"user": {...}, "mutual_count": n}`` objects, best first,
+                  and a 200 HTTP status.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', SUGGESTIONS_TOP_K)), SUGGESTIONS_TOP_K)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = FriendSuggestionSerializer(top_suggestions(request.user, max(limit, 0)), many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class UserCountsView(APIView):
+    """
+    API endpoint returning the authenticated user's badge counts.
+
+    The counts are read from the user's ``UserStats`` row (see ``users.stats``), a single
+    primary key lookup, instead of fetching the friends and pending request lists.
+
+    Attributes:
+        permission_classes (list): Specifies that only authenticated users can access this view.
+
+    Methods:
+        get(self, request, *args, **kwargs):
+            Input:
+                - request (Request): The HTTP request object that contains user authentication.
+
+            Output:
+                - Returns ``{"friend_count": n, "pending_received": n, "pending_sent": n}``
+                  and a 200 HTTP status.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response(counts_for(request.user), status=status.HTTP_200_OK)
+
+
+class MutualFriendsView(APIView):
+    """
+    API endpoint returning how many friends the authenticated user has in common with another user.
+
+    Methods:
+        get(self, request, *args, **kwargs):
+            Input:
+                - request (Request): The HTTP request object with the `target_email` query parameter.
+
+            Output:
+                - If `target_email` is missing:
+                    - Returns a JSON response with an error message and a 400 HTTP status.
+                - If the target user is not found:
+                    - Returns a JSON response with an error message and a 404 HTTP status.
+                - Otherwise:
+                    - Returns ``{"mutual_count": n}`` and a 200 HTTP status.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        target_email = request.query_params.get('target_email')
+        if not target_email:
+            return Response({'error': 'target_email is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        target_user = users_with_email(target_email).only('id').first()
+        if not target_user:
+            return Response({'error': 'Target user not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({'mutual_count': mutual_friend_count(request.user, target_user)}, status=status.HTTP_200_OK)
+
+
 
     
+def pending_requests_for(user):
+    """
+    Pending requests received by ``user`` joined to their senders, loading only the
+    columns the pending list serializes.
+    """
+    return FriendRequest.objects.filter(to_user=user, status='pending').select_related('from_user').only(
+        'id', 'status', 'created_at', 'from_user__id', 'from_user__username', 'from_user__email',
+    )
+
+
 class ListPendingFriendRequestsView(APIView):
+    """
+    API endpoint to list the pending friend requests received by the authenticated user.
+
+    The requests and their senders are read with a single joined query that loads only the
+    serialized columns, newest first, and are paginated with keyset cursors over
+    ``(created_at, id)``. Pages are served from the shared response cache
+    (``users.response_cache``) until a request to the user is created or changes.
+
+    Attributes:
+        permission_classes (list): Specifies that only authenticated users can access this view.
+        pagination_class (class): Defines the pagination class used to paginate the requests.
+
+    Methods:
+        get(self, request, *args, **kwargs):
+            Input:
+                - request (Request): The HTTP request object. Optional query parameters:
+                    - since (int): Only return requests with a larger id than this one, i.e. requests
+                      that arrived after the newest one the client already has (incremental polling).
+                    - cursor, page_size: Select the page.
+
+            Output:
+                - If `since` is not an integer:
+                    - Returns a JSON response with an error message and a 400 HTTP status.
+                - Otherwise:
+                    - Returns a page of serialized pending requests with `next`/`previous` links
+                      and a 200 HTTP status.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PendingRequestsPagination
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        pending_requests = FriendRequest.objects.filter(to_user=user, status='pending').order_by('-created_at')
-        
-        # Serialize the pending friend requests
-        serializer = FriendRequestSerializer(pending_requests, many=True)
-        
-        # Return the serialized data with a 200 OK status
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        data, status_code, hit = response_cache.cached(request, 'pending', request.user.pk, lambda: self.list_pending(request))
+        return Response(data, status=status_code, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+    def list_pending(self, request):
+        pending_requests = pending_requests_for(request.user)
+
+        since = request.query_params.get('since')
+        if since:
+            try:
+                pending_requests = pending_requests.filter(id__gt=int(since))
+            except ValueError:
+                return {'error': 'since must be a friend request id'}, status.HTTP_400_BAD_REQUEST
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(friend_request_values.values(pending_requests, *paginator.ordering_fields), request, view=self)
+        return paginator.get_paginated_data(friend_request_values.to_representation(page)), status.HTTP_200_OK